@@ -0,0 +1,104 @@
+import subprocess
+import sys
+
+
+ABI = [{
+    'type': 'event', 'name': 'Transfer', 'anonymous': False,
+    'inputs': [
+        {'name': 'from', 'type': 'address', 'indexed': True},
+        {'name': 'to', 'type': 'address', 'indexed': True},
+        {'name': 'value', 'type': 'uint256', 'indexed': False}
+    ]
+}]
+
+
+def compact_output_memory_benchmark(num_events: int=200000) -> None:
+    """
+    Benchmark the memory used to hold decoded events in memory with the default
+    and compact output formats, decoding synthetic logs in a fresh interpreter
+    for each format so that the peak RSS of each run can be compared.
+
+    :param num_events: The number of events to decode and hold.
+    """
+
+    # run benchmark in fresh interpreters
+    results = {}
+    for compact in [False, True]:
+        print('\rBenchmarking {} output... '.format('compact' if compact else 'default'), end='')
+        results[compact] = run_memory_benchmark(num_events, compact)
+    print('Done.')
+
+    # print results
+    for compact, rss in results.items():
+        print('\n========== {} =========='.format('Compact' if compact else 'Default'))
+        print('Peak RSS growth: {:.1f} MB ({} bytes per event)'.format(rss / 1024 ** 2, rss // num_events))
+    print('\nRSS reduction: {:.1%}'.format(1 - results[True] / results[False]))
+
+
+def run_memory_benchmark(num_events: int, compact: bool) -> int:
+    """
+    Decode and hold synthetic events in a fresh interpreter, and return the
+    growth in its peak RSS.
+
+    :param num_events: The number of events to decode and hold.
+    :param compact: Whether to use the compact output format.
+    :return: The peak RSS growth in bytes.
+    """
+
+    result = subprocess.run(
+        [sys.executable, '-c', 'from benchmark.compact_output_memory_benchmark import measure_decoded_events; '
+                               'print(measure_decoded_events({}, {}))'.format(num_events, compact)],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    return int(result.stdout)
+
+
+def measure_decoded_events(num_events: int, compact: bool) -> int:
+    """
+    Decode synthetic logs in pages, as a stream would, and measure the growth
+    in peak RSS while holding the decoded events.
+
+    :param num_events: The number of events to decode and hold.
+    :param compact: Whether to use the compact output format.
+    :return: The peak RSS growth in bytes.
+    """
+
+    from transpose.stream.event import EventStream
+    from transpose.utils.abi import get_topic_map
+    import resource
+
+    stream = EventStream('', 'ethereum', '0x' + '11' * 20, ABI, start_block=0, end_block=num_events, compact=compact)
+    topic = next(iter(get_topic_map(ABI)))
+    addresses = ['0x{:064x}'.format(i) for i in range(100)]
+
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    events = []
+    for start in range(0, num_events, 1000):
+        page = [{
+            'timestamp': '2023-01-01T00:{:02d}:00Z'.format(i // 1000 % 60),
+            'block_number': i // 10,
+            'log_index': i % 10,
+            'transaction_hash': '0x{:064x}'.format(i // 2),
+            'transaction_position': i % 10 // 2,
+            'address': '0x' + '11' * 20,
+            'data': '0x{:064x}'.format(i),
+            'topic_0': topic,
+            'topic_1': addresses[i % 100],
+            'topic_2': addresses[(i + 1) % 100],
+            'topic_3': None,
+            '__confirmed': True
+        } for i in range(start, min(start + 1000, num_events))]
+        events.extend(stream.decode_batch(page))
+        del page
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale - start_rss
+
+
+if __name__ == '__main__':
+    compact_output_memory_benchmark(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,59 @@
+from typing import Dict
+import subprocess
+import sys
+
+
+def import_time_benchmark(module: str='transpose.contract', runs: int=5, top: int=10) -> None:
+    """
+    Benchmark the cold import time of a module with `python -X importtime`,
+    importing it in a fresh interpreter for each run.
+
+    :param module: The module to import.
+    :param runs: The number of runs to take the best time from.
+    :param top: The number of most expensive imports to print.
+    """
+
+    # run benchmark in fresh interpreters
+    print('\rBenchmarking import of {}... '.format(module), end='')
+    results = [run_import_time(module) for _ in range(runs)]
+    best = min(results, key=lambda r: r[module])
+    print('Done.')
+
+    # print results
+    print('\n========== {} =========='.format(module))
+    print('Import time: {} ms (best of {})'.format(best[module] / 1000, runs))
+    print('Heavy modules loaded: {}'.format(', '.join(m for m in ['web3', 'eth_event', 'eth_abi', 'requests', 'dateutil'] if m in best) or 'none'))
+    print('\nMost expensive imports (cumulative):')
+    for name, us in sorted(best.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print('{:>10.1f} ms  {}'.format(us / 1000, name))
+
+
+def run_import_time(module: str) -> Dict[str, int]:
+    """
+    Import a module in a fresh interpreter with `python -X importtime` and
+    parse the cumulative import time of every module it loaded.
+
+    :param module: The module to import.
+    :return: The cumulative import time in microseconds per module.
+    """
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    # parse lines of the form "import time: self | cumulative | name"
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'): continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit(): continue
+        times[fields[2].strip()] = int(fields[1])
+
+    return times
+
+
+if __name__ == '__main__':
+    import_time_benchmark(*sys.argv[1:2])
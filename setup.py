@@ -37,10 +37,15 @@ setup(
     requires=["wheel"],
 
     # dependencies
+    python_requires='>=3.7',
     install_requires=[
-        'eth-event',
+        'eth-abi',
+        'eth-hash[pycryptodome]',
         'pip-chill',
         'dateutils',
-        'web3'
-    ]
+        'requests'
+    ],
+    extras_require={
+        'benchmark': ['web3']
+    }
 )
\ No newline at end of file
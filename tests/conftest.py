@@ -0,0 +1,15 @@
+from typing import Iterator
+import pytest
+
+from transpose.utils.request import set_api_url
+from tests.fake_api import FakeTransposeAPI
+
+
+@pytest.fixture
+def fake_api() -> Iterator[FakeTransposeAPI]:
+    api = FakeTransposeAPI().start()
+    set_api_url(api.url)
+    try: yield api
+    finally:
+        set_api_url(None)
+        api.stop()
@@ -0,0 +1,170 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Tuple
+import threading
+import json
+import re
+
+
+ORDER_PATTERN = re.compile(r'ORDER BY block_number (ASC|DESC)')
+LIMIT_PATTERN = re.compile(r'LIMIT (\d+)')
+STOP_PATTERN = re.compile(r'AND block_number ([<>]) (-?\d+)')
+SELECTOR_PATTERN = re.compile(r"LEFT\(input, 10\) (?:= '(0x[0-9a-f]{8})'|IN \(([^)]*)\))")
+TOPIC_PATTERN = re.compile(r"AND topic_0 (?:= '(0x[0-9a-f]{64})'|IN \(([^)]*)\))")
+KEYSET_PATTERN = re.compile(r'AND \(([\w, ]+)\) (>=|<=|>|<) \(([-\d, ]+)\)')
+TABLE_PATTERN = re.compile(r'FROM (\w+)\.(\w+)')
+CONTRACT_ADDRESS = '0x1111111111111111111111111111111111111111'
+COMPARISONS = {
+    '>': lambda a, b: a > b,
+    '<': lambda a, b: a < b,
+    '>=': lambda a, b: a >= b,
+    '<=': lambda a, b: a <= b
+}
+
+
+class FakeTransposeAPI:
+    """
+    A local stand-in for the Transpose SQL API that serves the logs,
+    transactions, and traces queries the SDK sends from fixture rows, and
+    records every query it receives. Responses can be overridden per query to
+    inject errors.
+    """
+
+    def __init__(self, logs: List[dict]=None,
+                 transactions: List[dict]=None,
+                 traces: List[dict]=None,
+                 latest_block: int=1000000) -> None:
+
+        self.logs = logs if logs is not None else []
+        self.transactions = transactions if transactions is not None else []
+        self.traces = traces if traces is not None else []
+        self.latest_block = latest_block
+        self.queries: List[str] = []
+        self.override: Optional[Callable[[str], Optional[Tuple[int, bytes]]]] = None
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(self))
+        self.__server.daemon_threads = True
+        self.__thread = None
+
+
+    @property
+    def url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return 'http://{}:{}/sql'.format(host, port)
+
+
+    def start(self) -> 'FakeTransposeAPI':
+        self.__thread = threading.Thread(target=self.__server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self.__thread.start()
+        return self
+
+
+    def stop(self) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+
+
+    def record(self, query: str) -> None:
+        with self.__lock: self.queries.append(query)
+
+
+    def query(self, query: str) -> List[dict]:
+        """
+        Evaluate a query against the fixture rows. Rows with a "chain" field are
+        only returned for queries on that chain.
+        """
+
+        if '.blocks' in query: return [{'block_number': self.latest_block}]
+        elif '.logs' in query: rows, key = self.logs, lambda r: (r['block_number'], r['log_index'])
+        elif '.transactions' in query: rows, key = self.transactions, lambda r: (r['block_number'], r['transaction_position'])
+        elif '.traces' in query: rows, key = self.traces, lambda r: (r['block_number'], r['transaction_position'], r['trace_index'] - 1)
+        else: raise ValueError('Unsupported query')
+
+        # filter rows
+        chain = TABLE_PATTERN.search(query).group(1)
+        rows = [{k: v for k, v in row.items() if k != 'chain'} for row in rows if row.get('chain', chain) == chain]
+        selectors, topics = match_values(SELECTOR_PATTERN, query), match_values(TOPIC_PATTERN, query)
+        keyset, stop = KEYSET_PATTERN.search(query), STOP_PATTERN.search(query)
+        cursor = tuple(int(v) for v in keyset.group(3).split(','))
+        results = [
+            row for row in rows
+            if (selectors is None or row['input'][:10] in selectors)
+            and (topics is None or row['topic_0'] in topics)
+            and COMPARISONS[keyset.group(2)](key(row), cursor)
+            and (stop is None or COMPARISONS[stop.group(1)](row['block_number'], int(stop.group(2))))
+        ]
+
+        # order and limit rows
+        results.sort(key=key, reverse=ORDER_PATTERN.search(query).group(1) == 'DESC')
+        limit = LIMIT_PATTERN.search(query)
+        return results[:int(limit.group(1))] if limit is not None else results
+
+
+def match_values(pattern: re.Pattern, query: str) -> Optional[List[str]]:
+    """
+    Return the values a query matches a column against, with either = or IN.
+    """
+
+    match = pattern.search(query)
+    if match is None: return None
+    elif match.group(1) is not None: return [match.group(1)]
+    return [v.strip().strip("'") for v in match.group(2).split(',')]
+
+
+def make_handler(api: FakeTransposeAPI) -> type:
+    class FakeRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self) -> None:
+            query = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['sql']
+            api.record(query)
+
+            override = api.override(query) if api.override is not None else None
+            if override is not None: status_code, data = override
+            else: status_code, data = 200, json.dumps({'status': 'success', 'results': api.query(query)}).encode()
+
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return FakeRequestHandler
+
+
+def make_log(block_number: int, log_index: int, topic_0: str, data: str='0x') -> dict:
+    return {
+        'timestamp': '2023-01-01T00:00:00Z',
+        'block_number': block_number,
+        'log_index': log_index,
+        'transaction_hash': '0x{:064x}'.format(block_number * 1000 + log_index),
+        'transaction_position': log_index,
+        'address': CONTRACT_ADDRESS,
+        'data': data,
+        'topic_0': topic_0,
+        'topic_1': None,
+        'topic_2': None,
+        'topic_3': None,
+        '__confirmed': True
+    }
+
+
+def make_call(block_number: int, transaction_position: int, trace_index: int, input: str, output: str='0x') -> dict:
+    return {
+        'timestamp': '2023-01-01T00:00:00Z',
+        'block_number': block_number,
+        'transaction_hash': '0x{:064x}'.format(block_number * 1000 + transaction_position),
+        'transaction_position': transaction_position,
+        'trace_index': trace_index,
+        'trace_address': [] if trace_index == 0 else [trace_index - 1],
+        'trace_type': 'call',
+        'from_address': '0x' + '22' * 20,
+        'value': 0,
+        'input': input,
+        'output': output,
+        '__confirmed': True
+    }
+
@@ -0,0 +1,51 @@
+import pytest
+
+from transpose.contract import TransposeDecodedContract
+from transpose.utils.abi import get_function_map, get_topic_map
+from transpose.utils.exceptions import StreamError
+from tests.fake_api import CONTRACT_ADDRESS, make_call, make_log
+
+
+def transfer(*names: str) -> dict:
+    return {'type': 'event', 'name': 'Transfer', 'anonymous': False, 'inputs': [{'name': n, 'type': 'uint256', 'indexed': False} for n in names]}
+
+
+def ping(*names: str) -> dict:
+    return {'type': 'function', 'name': 'ping', 'stateMutability': 'nonpayable', 'inputs': [{'name': n, 'type': 'uint256'} for n in names], 'outputs': []}
+
+
+V1, V2 = [transfer('amount'), ping('amount')], [transfer('amount', 'fee'), ping('amount', 'fee')]
+TOPIC_1, TOPIC_2 = next(iter(get_topic_map(V1))), next(iter(get_topic_map(V2)))
+SELECTOR_1, SELECTOR_2 = next(iter(get_function_map(V1))), next(iter(get_function_map(V2)))
+
+
+def make_contract() -> TransposeDecodedContract:
+    return TransposeDecodedContract(CONTRACT_ADDRESS, abi_versions=[{'abi': V1, 'end_block': 100}, {'abi': V2, 'start_block': 100}], api_key='test')
+
+
+def word(value: int) -> str:
+    return '{:064x}'.format(value)
+
+
+def test_event_name_matches_every_version_signature(fake_api) -> None:
+    fake_api.logs = [make_log(b, 0, TOPIC_1, '0x' + word(b)) for b in [10, 20]] + [make_log(b, 0, TOPIC_2, '0x' + word(b) + word(1)) for b in [110, 120]]
+    fake_api.logs.append(make_log(130, 0, '0x' + 'ee' * 32, '0x'))
+
+    stream = make_contract().stream_events(event_name='Transfer', start_block=0, end_block=200)
+    assert [item['event_data'] for item in stream] == [{'amount': 10}, {'amount': 20}, {'amount': 110, 'fee': 1}, {'amount': 120, 'fee': 1}]
+    assert any(f"topic_0 IN ('{TOPIC_1}', '{TOPIC_2}')" in query for query in fake_api.queries)
+
+
+def test_function_name_matches_every_version_selector(fake_api) -> None:
+    fake_api.transactions = [make_call(b, 0, 0, SELECTOR_1 + word(b)) for b in [10, 20]] + [make_call(b, 0, 0, SELECTOR_2 + word(b) + word(1)) for b in [110, 120]]
+
+    stream = make_contract().stream_calls(function_name='ping', start_block=0, end_block=200, call_sources={'transactions'})
+    assert [item['input_data'] for item in stream] == [{'amount': 10}, {'amount': 20}, {'amount': 110, 'fee': 1}, {'amount': 120, 'fee': 1}]
+
+
+def test_names_must_be_unambiguous_within_a_version(fake_api) -> None:
+    overloaded = [transfer('amount'), transfer('amount', 'fee')]
+    contract = TransposeDecodedContract(CONTRACT_ADDRESS, abi_versions=[{'abi': overloaded}], api_key='test')
+
+    with pytest.raises(StreamError):
+        contract.stream_events(event_name='Transfer', start_block=0, end_block=10)
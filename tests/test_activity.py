@@ -0,0 +1,47 @@
+from transpose.stream.call import CallStream
+from transpose.stream.event import EventStream
+from transpose.utils.abi import get_function_map, get_topic_map
+from tests.fake_api import make_call, make_log
+
+
+EVENT_ABI = [{'type': 'event', 'name': 'Ping', 'anonymous': False, 'inputs': [{'name': 'value', 'type': 'uint256', 'indexed': False}]}]
+FUNCTION_ABI = [{'type': 'function', 'name': 'ping', 'stateMutability': 'nonpayable', 'inputs': [{'name': 'value', 'type': 'uint256'}], 'outputs': []}]
+TOPIC = next(iter(get_topic_map(EVENT_ABI)))
+SELECTOR = next(iter(get_function_map(FUNCTION_ABI)))
+
+
+def drain(stream) -> list:
+    return [item for page in iter(lambda: stream.next(10), []) for item in page]
+
+
+def test_streams_send_one_query_per_page_by_default(fake_api, monkeypatch) -> None:
+    monkeypatch.delenv('TRANSPOSE_CACHE_DIR', raising=False)
+    fake_api.logs = [make_log(b, 0, TOPIC, '0x{:064x}'.format(b)) for b in range(1, 26)]
+
+    stream = EventStream('test', 'ethereum', '0x' + 'a1' * 20, EVENT_ABI, start_block=0, end_block=100)
+    assert len(drain(stream)) == 25
+    assert len(fake_api.queries) == 4
+    assert not any('.blocks' in query for query in fake_api.queries)
+
+
+def test_single_source_call_streams_skip_ranges_empty_for_both_sources(fake_api, monkeypatch) -> None:
+    monkeypatch.delenv('TRANSPOSE_CACHE_DIR', raising=False)
+    contract_address = '0x' + 'a2' * 20
+    fake_api.transactions = [make_call(b, 0, 0, SELECTOR + '{:064x}'.format(b)) for b in range(55000, 55005)]
+    fake_api.traces = [make_call(b, 0, 1, SELECTOR + '{:064x}'.format(b)) for b in range(55000, 55005)]
+    make_stream = lambda call_sources: CallStream(
+        'test', 'ethereum', contract_address, FUNCTION_ABI,
+        start_block=0,
+        end_block=100000,
+        call_sources=call_sources,
+        use_activity_index=True
+    )
+
+    # a stream from both sources records the empty ranges
+    assert len(drain(make_stream({'transactions', 'traces'}))) == 10
+
+    # a traces-only stream starts at the active bucket
+    del fake_api.queries[:]
+    assert len(drain(make_stream({'traces'}))) == 5
+    assert len(fake_api.queries) == 1
+    assert '> (50000, -1, -2)' in fake_api.queries[0]
@@ -0,0 +1,76 @@
+import json
+import pytest
+
+from transpose.contract import TransposeDecodedContract
+from transpose.sql.events import log_word_expression
+from transpose.utils.abi import get_topic_map
+from transpose.utils.aggregate import word_decoder
+from transpose.utils.exceptions import ContractError
+
+
+@pytest.mark.parametrize('abi_type', ['uint256', 'uint8', 'uint', 'int128', 'int', 'bool'])
+def test_word_decoder_accepts_scalar_types(abi_type: str) -> None:
+    assert word_decoder(abi_type)(['0x' + '00' * 31 + '01']) == [1]
+
+
+@pytest.mark.parametrize('abi_type', ['uint256[]', 'int8[3]', 'uint256[2][]', 'uint7', 'int512', 'address', 'bytes32'])
+def test_word_decoder_rejects_non_scalar_types(abi_type: str) -> None:
+    with pytest.raises(ValueError):
+        word_decoder(abi_type)
+
+
+def test_aggregate_events_rejects_array_parameters() -> None:
+    abi = [{
+        'type': 'event', 'name': 'Batch', 'anonymous': False,
+        'inputs': [{'name': 'amounts', 'type': 'uint256[]', 'indexed': False}]
+    }]
+
+    contract = TransposeDecodedContract('0x' + '11' * 20, abi=abi, api_key='test')
+    with pytest.raises(ContractError):
+        contract.aggregate_events(event_name='Batch', group_by='block', metrics=['sum(amounts)'], start_block=0, end_block=10)
+
+
+def test_word_decoder_skips_missing_words() -> None:
+    words = [None, '', '0x' + 'ff' * 32, '00' * 31 + '02']
+    assert word_decoder('uint256')(words) == [None, None, (1 << 256) - 1, 2]
+    assert word_decoder('int256')(words) == [None, None, -1, 2]
+
+
+def test_log_words_past_the_data_are_null() -> None:
+    assert log_word_expression(data_slot=1) == 'CASE WHEN LENGTH(data) >= 130 THEN SUBSTRING(data FROM 67 FOR 64) END'
+
+
+def test_aggregate_events_ignores_missing_parameters(fake_api) -> None:
+    abi = [{
+        'type': 'event', 'name': 'Deposit', 'anonymous': False,
+        'inputs': [{'name': 'id', 'type': 'uint256', 'indexed': False}, {'name': 'amount', 'type': 'uint256', 'indexed': False}]
+    }]
+
+    # the second log's data is too short to hold the amount
+    rows = [
+        {'block_number': 1, 'log_index': 0, 'bucket': 1, 'p0': '{:064x}'.format(4)},
+        {'block_number': 1, 'log_index': 1, 'bucket': 1, 'p0': None},
+        {'block_number': 1, 'log_index': 2, 'bucket': 1, 'p0': '{:064x}'.format(8)}
+    ]
+    fake_api.override = lambda query: (200, json.dumps({'status': 'success', 'results': rows if 'AS p0' in query else []}).encode())
+
+    contract = TransposeDecodedContract('0x' + '11' * 20, abi=abi, api_key='test')
+    table = contract.aggregate_events(event_name='Deposit', group_by='block', metrics=['count', 'sum(amount)', 'avg(amount)', 'min(amount)'], start_block=0, end_block=10)
+    assert table == {'bucket': [1], 'count': [3], 'sum(amount)': [12], 'avg(amount)': [6], 'min(amount)': [4]}
+    assert 'LENGTH(data) >= 130' in fake_api.queries[0]
+
+
+def test_aggregate_and_plan_events_span_abi_versions(fake_api) -> None:
+    transfer = lambda inputs: {'type': 'event', 'name': 'Transfer', 'anonymous': False, 'inputs': [{'name': n, 'type': 'uint256', 'indexed': False} for n in inputs]}
+    v1, v2 = [transfer(['amount'])], [transfer(['amount', 'fee'])]
+    topic_1, topic_2 = next(iter(get_topic_map(v1))), next(iter(get_topic_map(v2)))
+    counts = [
+        {'bucket': 0, 'topic_0': topic_1, 'count': 5},
+        {'bucket': 0, 'topic_0': '0x' + 'ee' * 32, 'count': 7},
+        {'bucket': 100, 'topic_0': topic_2, 'count': 3}
+    ]
+    fake_api.override = lambda query: (200, json.dumps({'status': 'success', 'results': counts if 'COUNT(*)' in query else [{'block_number': 200}]}).encode())
+
+    contract = TransposeDecodedContract('0x' + '11' * 20, abi_versions=[{'abi': v1, 'start_block': 0, 'end_block': 100}, {'abi': v2, 'start_block': 100}], api_key='test')
+    assert contract.aggregate_events(event_name='Transfer', group_by=100, start_block=0, end_block=200) == {'bucket': [0, 100], 'count': [5, 3]}
+    assert contract.plan_events(event_name='Transfer', start_block=0, end_block=200, bucket_size=100).counts == {'Transfer': 8}
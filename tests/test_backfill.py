@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import sqlite3
+import time
+import json
+import os
+import pytest
+
+from transpose.backfill import BackfillCoordinator
+from transpose.contract import TransposeDecodedContract
+from transpose.sink.file import JSONLinesSink
+from transpose.utils.abi import get_topic_map
+from transpose.utils.plan import BackfillPlan
+from tests.fake_api import CONTRACT_ADDRESS, make_log
+
+
+ABI = [{'type': 'event', 'name': 'Ping', 'anonymous': False, 'inputs': [{'name': 'value', 'type': 'uint256', 'indexed': False}]}]
+TOPIC = next(iter(get_topic_map(ABI)))
+ERROR_RESPONSE = (400, json.dumps({'status': 'error', 'message': 'Invalid SQL'}).encode())
+
+
+@pytest.fixture
+def contract(fake_api) -> TransposeDecodedContract:
+    fake_api.logs = [make_log(b, 0, TOPIC, '0x{:064x}'.format(b)) for b in range(1, 31)]
+    return TransposeDecodedContract(CONTRACT_ADDRESS, abi=ABI, api_key='test')
+
+
+def read_partition(output_dir: str, job: str, start_block: int, end_block: int) -> list:
+    with open(os.path.join(output_dir, job, f'{start_block}-{end_block}.jsonl')) as f:
+        return [json.loads(line)['context']['block_number'] for line in f]
+
+
+def unit_status(path: str, job: str) -> dict:
+    with sqlite3.connect(path) as conn:
+        return {row[0]: row[1:] for row in conn.execute('SELECT start_block, status, attempts, items FROM units WHERE job = ?', (job,))}
+
+
+def test_leases_are_exclusive(tmp_path, contract) -> None:
+    path = str(tmp_path / 'jobs.db')
+    BackfillCoordinator(path).submit('job', contract, [(b, b + 5) for b in range(0, 200, 5)])
+    coordinators = [BackfillCoordinator(path) for _ in range(4)]
+
+    def lease_all(coordinator: BackfillCoordinator) -> list:
+        return [unit['start_block'] for unit in iter(lambda: coordinator.lease('job', str(id(coordinator))), None)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leased = [b for blocks in executor.map(lease_all, coordinators) for b in blocks]
+
+    assert sorted(leased) == list(range(0, 200, 5))
+    assert coordinators[0].progress('job')['units_leased'] == 40
+
+
+def test_expired_lease_resumes_from_checkpoint(tmp_path, contract) -> None:
+    path, output_dir = str(tmp_path / 'jobs.db'), str(tmp_path / 'out')
+    BackfillCoordinator(path).submit('job', contract, [(0, 100)])
+    written, resume = threading.Event(), threading.Event()
+
+    # the first worker stalls after writing its first page, before renewing its lease
+    class StallingSink(JSONLinesSink):
+        def write(self, items: list, state: dict) -> None:
+            super().write(items, state)
+            written.set()
+            resume.wait(10)
+            raise RuntimeError('Worker stalled')
+
+    stalled = BackfillCoordinator(path, lease_timeout=0.3)
+    sink_factory = lambda unit: StallingSink(os.path.join(output_dir, 'job', '0-100.jsonl'))
+    os.makedirs(os.path.join(output_dir, 'job'))
+    thread = threading.Thread(target=stalled.work, args=('job', contract), kwargs={'sink_factory': sink_factory, 'page_size': 10, 'max_units': 1})
+    thread.start()
+    assert written.wait(10)
+
+    # another worker takes over once the lease expires
+    try: items = BackfillCoordinator(path, lease_timeout=0.3).work('job', contract, output_dir=output_dir, page_size=10)
+    finally:
+        resume.set()
+        thread.join(10)
+
+    assert items == 20
+    assert read_partition(output_dir, 'job', 0, 100) == list(range(1, 31))
+    assert unit_status(path, 'job') == {0: ('done', 2, 30)}
+
+
+def test_failed_units_are_retried(tmp_path, fake_api, contract) -> None:
+    path, output_dir = str(tmp_path / 'jobs.db'), str(tmp_path / 'out')
+    coordinator = BackfillCoordinator(path, max_attempts=3)
+    coordinator.submit('job', contract, [(0, 15), (15, 100)])
+
+    # a transient error fails one attempt without stopping the worker
+    errors = [ERROR_RESPONSE]
+    fake_api.override = lambda query: errors.pop() if len(errors) > 0 else None
+    assert coordinator.work('job', contract, output_dir=output_dir, page_size=10) == 30
+    assert unit_status(path, 'job') == {0: ('done', 2, 14), 15: ('done', 1, 16)}
+
+
+def test_units_fail_after_max_attempts(tmp_path, fake_api, contract) -> None:
+    path, output_dir = str(tmp_path / 'jobs.db'), str(tmp_path / 'out')
+    coordinator = BackfillCoordinator(path, max_attempts=3)
+    coordinator.submit('job', contract, [(0, 15), (15, 100)])
+
+    fake_api.override = lambda query: ERROR_RESPONSE
+    assert coordinator.work('job', contract, output_dir=output_dir, page_size=10) == 0
+    assert unit_status(path, 'job') == {0: ('failed', 3, 0), 15: ('failed', 3, 0)}
+    assert coordinator.progress('job')['units_failed'] == 2
+
+    # failed units are reset with their attempts cleared
+    fake_api.override = None
+    assert coordinator.retry_failed('job') == 2
+    assert coordinator.work('job', contract, output_dir=output_dir, page_size=10) == 30
+    assert unit_status(path, 'job') == {0: ('done', 1, 14), 15: ('done', 1, 16)}
+
+
+def test_progress_is_weighted_by_estimated_items(tmp_path, contract) -> None:
+    coordinator = BackfillCoordinator(str(tmp_path / 'jobs.db'))
+    plan = BackfillPlan(0, 100, 50, {0: 30, 50: 10})
+    coordinator.submit('job', contract, [(0, 50), (50, 100)], plan=plan)
+
+    unit = coordinator.lease('job', 'worker')
+    assert unit['start_block'] == 0 and coordinator.complete(unit, 30)
+    time.sleep(0.01)
+
+    progress = coordinator.progress('job')
+    assert progress['units_done'] == 1 and progress['units_pending'] == 1
+    assert progress['items_done'] == 30
+    assert progress['fraction'] == pytest.approx(0.75)
+    assert progress['eta'] is not None and progress['eta'] > 0
@@ -0,0 +1,53 @@
+import pytest
+
+from transpose.utils.batch import QueryBatcher
+from transpose.utils.exceptions import TransposeAPIError
+
+
+QUERIES = ['SELECT 1', 'SELECT 2']
+ROWS = {
+    'SELECT 1': [{'timestamp': '2023-01-01T00:00:00Z', 'amount': 5}],
+    'SELECT 2': [{'timestamp': '2023-01-01T00:00:12.5Z', 'amount': 7}],
+}
+
+
+def fake_send(status_codes: list, combined_rows: list, sent: list):
+    """
+    Fake send_transpose_sql_request, failing combined requests with the given
+    status codes in turn and answering individual queries from ROWS.
+    """
+
+    def send(api_key: str, query: str) -> list:
+        sent.append(query)
+        if query in ROWS: return ROWS[query]
+        if status_codes: raise TransposeAPIError(status_code=status_codes.pop(0), message='Failed')
+        return combined_rows
+    return send
+
+
+def test_combined_results_match_individual_results(monkeypatch) -> None:
+    combined_rows = [
+        {'__batch_index': 0, '__batch_rows': [{'timestamp': '2023-01-01T00:00:00+00:00', 'amount': 5.0}]},
+        {'__batch_index': 1, '__batch_rows': '[{"timestamp": "2023-01-01T00:00:12.5", "amount": 7}]'},
+    ]
+    monkeypatch.setattr('transpose.utils.batch.send_transpose_sql_request', fake_send([], combined_rows, []))
+
+    results = QueryBatcher().send_many('key', QUERIES)
+    assert results == [ROWS[q] for q in QUERIES]
+    assert type(results[0][0]['amount']) is int
+
+
+@pytest.mark.parametrize('status_code, combine', [(503, True), (None, True), (400, False)])
+def test_only_rejections_disable_combining(monkeypatch, status_code, combine) -> None:
+    sent = []
+    combined_rows = [{'__batch_index': i, '__batch_rows': ROWS[q]} for i, q in enumerate(QUERIES)]
+    monkeypatch.setattr('transpose.utils.batch.send_transpose_sql_request', fake_send([status_code], combined_rows, sent))
+
+    batcher = QueryBatcher()
+    assert batcher.send_many('key', QUERIES) == [ROWS[q] for q in QUERIES]
+    assert batcher.combine is combine
+
+    # combining resumes after a transient failure
+    sent.clear()
+    assert batcher.send_many('key', QUERIES) == [ROWS[q] for q in QUERIES]
+    assert len(sent) == (1 if combine else 2)
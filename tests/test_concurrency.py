@@ -0,0 +1,96 @@
+import threading
+import time
+import json
+
+from transpose.stream.event import EventStream
+from transpose.utils.abi import get_topic_map
+from tests.fake_api import CONTRACT_ADDRESS, make_log
+
+
+ABI = [{'type': 'event', 'name': 'Ping', 'anonymous': False, 'inputs': [{'name': 'value', 'type': 'uint256', 'indexed': False}]}]
+TOPIC = next(iter(get_topic_map(ABI)))
+
+
+def make_stream() -> EventStream:
+    return EventStream('test', 'ethereum', CONTRACT_ADDRESS, ABI, start_block=0, end_block=100000)
+
+
+def test_concurrent_iterators_share_items(fake_api) -> None:
+    fake_api.logs = [make_log(b, i, TOPIC, '0x{:064x}'.format(i)) for b in range(1, 200) for i in range(3)]
+    stream = make_stream()
+    results = [[] for _ in range(4)]
+
+    def consume(items: list) -> None:
+        for item in stream: items.append((item['context']['block_number'], item['context']['log_index']))
+    threads = [threading.Thread(target=consume, args=(items,)) for items in results]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join(10)
+
+    keys = [key for items in results for key in items]
+    assert len(set(keys)) == len(keys)
+    assert sorted(keys) == [(b, i) for b in range(1, 200) for i in range(3)]
+
+
+def test_iterator_decodes_outside_lock(fake_api) -> None:
+    fake_api.logs = [make_log(b, 0, TOPIC, '0x{:064x}'.format(b)) for b in range(1, 10)]
+    stream = make_stream()
+    decode_batch, unblocked = stream.decode_batch, []
+
+    # the stream state is readable from another thread while a batch decodes
+    def blocking_decode_batch(data: list) -> list:
+        reader = threading.Thread(target=lambda: stream.state, daemon=True)
+        reader.start()
+        reader.join(2)
+        unblocked.append(not reader.is_alive())
+        return decode_batch(data)
+    stream.decode_batch = blocking_decode_batch
+
+    assert [item['context']['block_number'] for item in stream] == list(range(1, 10))
+    assert len(unblocked) > 0 and all(unblocked)
+
+
+def test_concurrent_iterators_keep_stream_order(fake_api) -> None:
+    fake_api.logs = [make_log(b, 0, TOPIC, '0x{:064x}'.format(b)) for b in range(1, 250)]
+    stream = make_stream()
+    decode_batch = stream.decode_batch
+
+    # the stand-in API returns at most ten rows per query, so iterators fetch several pages
+    fake_api.override = lambda query: (200, json.dumps({'status': 'success', 'results': fake_api.query(query)[:10]}).encode())
+
+    # the first page decodes after the second has been fetched and decoded
+    def slow_first_page(data: list) -> list:
+        if len(data) > 0 and data[0]['block_number'] == 1: time.sleep(0.5)
+        return decode_batch(data)
+    stream.decode_batch = slow_first_page
+
+    first = []
+    threads = [threading.Thread(target=lambda: first.append(next(stream)['context']['block_number'])) for _ in range(2)]
+    threads[0].start()
+    time.sleep(0.1)
+    threads[1].start()
+    for thread in threads: thread.join(10)
+
+    assert sorted(first) == [1, 2]
+    assert [item['context']['block_number'] for item in stream] == list(range(3, 250))
+
+
+def test_state_is_readable_during_fetch(fake_api) -> None:
+    fake_api.logs = [make_log(b, 0, TOPIC, '0x{:064x}'.format(b)) for b in range(1, 10)]
+    stream = make_stream()
+    state = stream.state
+    started, release = threading.Event(), threading.Event()
+    fake_api.override = lambda query: (started.set(), release.wait(5), None)[-1]
+
+    thread = threading.Thread(target=stream.fetch_next, args=(5,))
+    thread.start()
+    try:
+        assert started.wait(5)
+        reader = threading.Thread(target=lambda: stream.state, daemon=True)
+        reader.start()
+        reader.join(1)
+        assert not reader.is_alive()
+    finally:
+        release.set()
+        thread.join(10)
+
+    assert stream.state != state
@@ -0,0 +1,56 @@
+import pytest
+
+from transpose.stream.call import CallStream
+from transpose.stream.event import EventStream
+from transpose.utils.decode import build_static_layout, decode_buffer, decode_static_words
+from transpose.utils.abi import get_function_map, get_topic_map
+from transpose.utils.exceptions import StreamError
+from tests.fake_api import CONTRACT_ADDRESS, make_call, make_log
+
+
+TYPES = ['uint8', 'int16', 'bool', 'address', 'bytes4', 'uint256', 'int256']
+WORDS = [
+    ['00' * 31 + 'ff', 'ff' * 31 + '80', '00' * 31 + '01', '00' * 12 + 'AbCdEf' * 6 + 'aBcD', 'deadbeef' + '00' * 28, 'ff' * 32, 'ff' * 32],
+    ['00' * 32, '00' * 31 + '7f', '00' * 32, '00' * 12 + 'FF' * 20, '00' * 32, '00' * 31 + '01', '7f' + 'ff' * 31],
+]
+INVALID_WORDS = {
+    'uint8': '00' * 30 + '0100',
+    'int16': 'ff' * 30 + '7fff',
+    'bool': '00' * 31 + '02',
+    'address': '01' + '00' * 31,
+    'bytes4': 'deadbeef01' + '00' * 27,
+}
+
+
+def test_bulk_decoding_matches_per_item_decoding() -> None:
+    layout = build_static_layout([{'type': t} for t in TYPES])
+    columns = decode_static_words(['0x' + ''.join(words) for words in WORDS], 2, layout)
+    rows = [decode_buffer(TYPES, bytes.fromhex(''.join(words))) for words in WORDS]
+
+    assert [tuple(row) for row in zip(*columns)] == rows
+    assert columns[3] == ['0x' + ('abcdef' * 6 + 'abcd'), '0x' + 'ff' * 20]
+
+
+@pytest.mark.parametrize('abi_type, word', INVALID_WORDS.items())
+def test_bulk_decoding_rejects_invalid_padding(abi_type: str, word: str) -> None:
+    with pytest.raises(ValueError): decode_static_words(['0x' + word], 2, build_static_layout([{'type': abi_type}]))
+    with pytest.raises(Exception): decode_buffer([abi_type], bytes.fromhex(word))
+
+
+def test_invalid_padding_falls_back_to_per_item_decoding() -> None:
+    abi = [
+        {'type': 'event', 'name': 'Ping', 'anonymous': False, 'inputs': [{'name': 'value', 'type': 'uint8', 'indexed': False}]},
+        {'type': 'function', 'name': 'get', 'stateMutability': 'view', 'inputs': [], 'outputs': [{'name': '', 'type': 'uint8'}]}
+    ]
+
+    # invalid event data fails the same way as when decoded per item
+    topic = next(iter(get_topic_map(abi)))
+    events = EventStream('test', 'ethereum', CONTRACT_ADDRESS, abi, start_block=0, end_block=10)
+    logs = [make_log(1, 0, topic, '0x' + '00' * 32), make_log(1, 1, topic, '0x' + '00' * 30 + '0100')]
+    with pytest.raises(StreamError, match='Failed to decode data'): events.decode_batch(logs)
+
+    # malformed outputs are left undecoded, as when decoded per item
+    selector = next(iter(get_function_map(abi)))
+    calls = CallStream('test', 'ethereum', CONTRACT_ADDRESS, abi, start_block=0, end_block=10)
+    decoded = calls.decode_batch([make_call(1, 0, 0, selector, '0x' + '00' * 31 + '05'), make_call(1, 1, 0, selector, '0x' + '00' * 30 + '0105')])
+    assert [call['output_data'] for call in decoded] == [{'': 5}, None]
@@ -0,0 +1,51 @@
+import json
+
+from transpose.stream.event import EventStream
+from transpose.stream.multichain import MultiChainStream
+from transpose.utils.abi import get_topic_map
+from tests.fake_api import CONTRACT_ADDRESS, make_log
+
+
+ABI = [{'type': 'event', 'name': 'Ping', 'anonymous': False, 'inputs': [{'name': 'value', 'type': 'uint256', 'indexed': False}]}]
+TOPIC = next(iter(get_topic_map(ABI)))
+
+
+def replay_cursor(fake_api) -> None:
+    """
+    Make the stand-in API return the item at each page's cursor again ahead of
+    any new items, as overlapping queries or retries would.
+    """
+
+    def override(query: str):
+        results = fake_api.query(query)
+        if len(results) > 0: results = fake_api.query(query.replace(') > (', ') >= ('))
+        return 200, json.dumps({'status': 'success', 'results': results}).encode()
+    fake_api.override = override
+
+
+def make_stream(chain: str) -> EventStream:
+    return EventStream('test', chain, CONTRACT_ADDRESS, ABI, start_block=0, end_block=100000)
+
+
+def test_stream_deduplicates_replayed_items(fake_api) -> None:
+    fake_api.logs = [make_log(b, i, TOPIC, '0x{:064x}'.format(i)) for b in range(1, 30) for i in range(3)]
+    replay_cursor(fake_api)
+
+    stream = make_stream('ethereum').deduplicate()
+    keys = [(item['context']['block_number'], item['context']['log_index']) for page in iter(lambda: stream.next(10), []) for item in page]
+    assert keys == [(b, i) for b in range(1, 30) for i in range(3)]
+
+
+def test_multichain_stream_deduplicates_each_chain(fake_api) -> None:
+    ethereum = [dict(make_log(b, i, TOPIC, '0x{:064x}'.format(i)), chain='ethereum') for b in range(50000, 50020) for i in range(2)]
+    polygon = [dict(make_log(b, i, TOPIC, '0x{:064x}'.format(i)), chain='polygon') for b in range(10, 30) for i in range(2)]
+    fake_api.logs = ethereum + polygon
+    replay_cursor(fake_api)
+
+    # polygon's block numbers are far behind ethereum's, but its items are not dropped
+    stream = MultiChainStream({'ethereum': make_stream('ethereum'), 'polygon': make_stream('polygon')}, page_size=7).deduplicate()
+    items = [item for page in iter(lambda: stream.next(10), []) for item in page]
+    keys = [(item['chain'], item['context']['block_number'], item['context']['log_index']) for item in items]
+
+    assert len(set(keys)) == len(keys)
+    assert sorted(keys) == sorted([('ethereum', r['block_number'], r['log_index']) for r in ethereum] + [('polygon', r['block_number'], r['log_index']) for r in polygon])
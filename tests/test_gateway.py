@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+import time
+import json
+import pytest
+
+from transpose.gateway import TransposeGateway
+from transpose.sql.events import events_query
+from transpose.utils.exceptions import TransposeAPIError
+from transpose.utils.request import send_transpose_sql_request, set_gateway_url
+from tests.fake_api import CONTRACT_ADDRESS, make_log
+
+
+TOPIC = '0x' + 'ab' * 32
+
+
+@pytest.fixture
+def gateway(fake_api) -> Iterator[TransposeGateway]:
+    fake_api.logs = [make_log(b, 0, TOPIC) for b in range(1, 21)]
+    gateway = TransposeGateway(port=0, api_url=fake_api.url, cache_ttl=0).start()
+    set_gateway_url(gateway.url)
+    try: yield gateway
+    finally:
+        set_gateway_url(None)
+        gateway.stop()
+
+
+def logs_query(from_block: int) -> str:
+    return events_query('ethereum', CONTRACT_ADDRESS, from_block, -1, limit=5)
+
+
+def test_gateway_routes_queries_upstream(fake_api, gateway) -> None:
+    results = send_transpose_sql_request('gateway-routing', logs_query(10))
+
+    assert [row['block_number'] for row in results] == [10, 11, 12, 13, 14]
+    assert fake_api.queries == [logs_query(10)]
+    assert gateway.stats['requests'] == 1 and gateway.stats['upstream'] == 1
+
+
+def test_gateway_shares_rate_limit_between_clients(fake_api, gateway) -> None:
+    limited = TransposeGateway(port=0, api_url=fake_api.url, cache_ttl=0, rate_limit=20).start()
+    set_gateway_url(limited.url)
+
+    # clients skip their own token bucket, so the gateway paces every request
+    start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=11) as executor:
+            results = list(executor.map(lambda b: send_transpose_sql_request('gateway-rate-limit', logs_query(b)), range(1, 12)))
+    finally: limited.stop()
+    elapsed = time.monotonic() - start
+
+    assert all(len(r) > 0 for r in results)
+    assert len(fake_api.queries) == 11
+    assert elapsed >= 10 / 20 * 0.9
+
+
+def test_gateway_propagates_api_errors(fake_api, gateway) -> None:
+    fake_api.override = lambda query: (400, json.dumps({'status': 'error', 'message': 'Invalid SQL'}).encode())
+
+    with pytest.raises(TransposeAPIError) as e:
+        send_transpose_sql_request('gateway-errors', logs_query(1), max_retries=0)
+    assert e.value.status_code == 400 and e.value.message == 'Invalid SQL'
+
+
+def test_gateway_responds_to_malformed_upstream_responses(fake_api, gateway) -> None:
+    fake_api.override = lambda query: (200, json.dumps({'unexpected': True}).encode())
+
+    with pytest.raises(TransposeAPIError) as e:
+        send_transpose_sql_request('gateway-malformed', logs_query(1), max_retries=0)
+    assert e.value.status_code == 502 and e.value.message.startswith('Invalid response')
+
+
+def test_gateway_responds_to_unexpected_failures(gateway, monkeypatch) -> None:
+    def fail(**kwargs) -> None: raise RuntimeError('Unexpected')
+    monkeypatch.setattr('transpose.gateway.send_transpose_sql_request', fail)
+
+    with pytest.raises(TransposeAPIError) as e:
+        send_transpose_sql_request('gateway-unexpected', logs_query(1), max_retries=0)
+    assert e.value.status_code == 502 and 'RuntimeError' in e.value.message
+
+
+def test_gateway_does_not_retry_upstream(fake_api, gateway) -> None:
+    fake_api.override = lambda query: (503, json.dumps({'status': 'error', 'message': 'Unavailable'}).encode())
+
+    # each client attempt reaches the upstream once
+    with pytest.raises(TransposeAPIError) as e:
+        send_transpose_sql_request('gateway-retries', logs_query(1), max_retries=2, backoff_factor=0.01)
+    assert e.value.status_code == 503
+    assert len(fake_api.queries) == 3
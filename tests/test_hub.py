@@ -0,0 +1,25 @@
+from transpose.stream.call import CallStream
+from transpose.stream.hub import StreamHub
+from transpose.utils.abi import get_function_map
+from tests.fake_api import CONTRACT_ADDRESS, make_call
+
+
+ABI = [{
+    'type': 'function', 'name': 'ping', 'stateMutability': 'nonpayable',
+    'inputs': [{'name': 'value', 'type': 'uint256'}], 'outputs': []
+}]
+PING_SELECTOR = next(iter(get_function_map(ABI)))
+UNKNOWN_SELECTOR = '0xdeadbeef'
+
+
+def test_hub_continues_past_pages_that_decode_to_nothing(fake_api) -> None:
+    fake_api.transactions = [make_call(b, 0, 0, UNKNOWN_SELECTOR) for b in range(1, 11)]
+    fake_api.transactions += [make_call(b, 0, 0, PING_SELECTOR + '{:064x}'.format(b)) for b in range(11, 16)]
+
+    stream = CallStream('test', 'ethereum', CONTRACT_ADDRESS, ABI, start_block=0, end_block=100, call_sources={'transactions'})
+    hub = StreamHub(stream, page_size=3)
+    subscription = hub.subscribe()
+    hub.start()
+
+    assert [item['input_data']['value'] for item in subscription] == list(range(11, 16))
+    hub.stop()
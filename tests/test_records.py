@@ -0,0 +1,34 @@
+import tracemalloc
+import pytest
+
+from transpose.stream.event import EventStream
+from transpose.utils.records import EventContext, to_dict
+from tests.fake_api import CONTRACT_ADDRESS, make_log
+from tests.test_concurrency import ABI, TOPIC
+
+
+def decode_and_measure(compact: bool) -> tuple:
+    stream = EventStream('test', 'ethereum', CONTRACT_ADDRESS, ABI, start_block=0, end_block=100000, compact=compact)
+    tracemalloc.start()
+    try:
+        # the raw logs are freed once decoded, as in a stream
+        events = stream.decode_batch([make_log(b, i, TOPIC, '0x{:064x}'.format(i)) for b in range(1, 501) for i in range(4)])
+        return events, tracemalloc.get_traced_memory()[0]
+    finally: tracemalloc.stop()
+
+
+def test_records_are_unhashable_like_dicts() -> None:
+    context = EventContext('2023-01-01T00:00:00Z', 1, 0, '0x00', 0, True)
+    assert context == to_dict(context)
+    with pytest.raises(TypeError): hash(context)
+
+
+def test_compact_output_uses_less_memory() -> None:
+    # warm up one-time allocations, e.g. growing the interned string table
+    decode_and_measure(False), decode_and_measure(True)
+
+    default_events, default_memory = decode_and_measure(False)
+    compact_events, compact_memory = decode_and_measure(True)
+
+    assert [to_dict(e) for e in compact_events] == default_events
+    assert compact_memory < 0.75 * default_memory
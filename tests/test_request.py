@@ -0,0 +1,26 @@
+import json
+import pytest
+
+from transpose.utils.exceptions import TransposeAPIError
+from transpose.utils.request import DEFAULT_API_URL, get_api_url, send_transpose_sql_request, set_api_url
+
+
+@pytest.mark.parametrize('body', [{'unexpected': True}, {'status': 'success'}, ['results']])
+def test_malformed_responses_raise_api_errors(fake_api, body) -> None:
+    fake_api.override = lambda query: (200, json.dumps(body).encode())
+
+    with pytest.raises(TransposeAPIError) as e:
+        send_transpose_sql_request('malformed', 'SELECT 1', max_retries=0)
+    assert e.value.status_code == 200 and e.value.message.startswith('Invalid response')
+
+
+def test_set_api_url_restores_environment_default(monkeypatch) -> None:
+    try:
+        monkeypatch.setenv('TRANSPOSE_API_URL', 'http://127.0.0.1:1/sql')
+        set_api_url(None)
+        assert get_api_url() == 'http://127.0.0.1:1/sql'
+
+        monkeypatch.delenv('TRANSPOSE_API_URL')
+        set_api_url(None)
+        assert get_api_url() == DEFAULT_API_URL
+    finally: set_api_url(None)
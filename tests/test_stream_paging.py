@@ -0,0 +1,83 @@
+from typing import List, Tuple
+import pytest
+
+from transpose.stream.base import Stream
+from transpose.stream.call import CallStream
+from transpose.stream.event import EventStream
+from transpose.utils.abi import get_function_map, get_topic_map
+from tests.fake_api import CONTRACT_ADDRESS, make_call, make_log
+
+
+EVENT_ABI = [{'type': 'event', 'name': 'Ping', 'anonymous': False, 'inputs': [{'name': 'value', 'type': 'uint256', 'indexed': False}]}]
+FUNCTION_ABI = [{'type': 'function', 'name': 'ping', 'stateMutability': 'nonpayable', 'inputs': [{'name': 'value', 'type': 'uint256'}], 'outputs': []}]
+TOPIC = next(iter(get_topic_map(EVENT_ABI)))
+SELECTOR = next(iter(get_function_map(FUNCTION_ABI)))
+LIMIT = 10
+
+# blocks with fewer, exactly as many, and more items than the page limit
+ITEMS_PER_BLOCK = {1: 1, 2: 3, 5: 10, 6: 26, 9: 2, 12: 11, 13: 1, 20: 7}
+
+
+def drain(stream: Stream, fake_api) -> Tuple[List[dict], List[int]]:
+    """
+    Fetch every page of a stream, returning the items and the number of
+    requests each page took, including the final empty page.
+    """
+
+    data, requests = [], []
+    while True:
+        before = len(fake_api.queries)
+        page, _ = stream.fetch_next(LIMIT)
+        requests.append(len(fake_api.queries) - before)
+        assert len(page) <= LIMIT
+        if len(page) == 0: return data, requests
+        data += page
+
+
+def assert_exact(keys: List[tuple], expected: List[tuple]) -> None:
+    assert len(set(keys)) == len(keys), 'duplicate items'
+    assert keys == expected, 'missing or out of order items'
+
+
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_event_pages_have_no_duplicates_or_gaps(fake_api, order: str) -> None:
+    fake_api.logs = [make_log(b, i, TOPIC, '0x{:064x}'.format(i)) for b, n in ITEMS_PER_BLOCK.items() for i in range(n)]
+    start_block, end_block = (0, 100) if order == 'asc' else (100, 0)
+    stream = EventStream('test', 'ethereum', CONTRACT_ADDRESS, EVENT_ABI, start_block=start_block, end_block=end_block, order=order)
+
+    data, requests = drain(stream, fake_api)
+    expected = sorted(((r['block_number'], r['log_index']) for r in fake_api.logs), reverse=order == 'desc')
+    assert_exact([(r['block_number'], r['log_index']) for r in data], expected)
+    assert requests == [1] * len(requests)
+    assert len(fake_api.queries) == len(requests)
+    assert len(stream.decode_batch(data)) == len(expected)
+
+
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+@pytest.mark.parametrize('call_sources', [{'transactions'}, {'traces'}, {'transactions', 'traces'}])
+def test_call_pages_have_no_duplicates_or_gaps(fake_api, order: str, call_sources: set) -> None:
+    calls = lambda b, n: [make_call(b, p, 0, SELECTOR + '{:064x}'.format(p)) for p in range(n)]
+    traces = lambda b, n: [make_call(b, p, t, SELECTOR + '{:064x}'.format(t)) for p in range(2) for t in range(1, n + 1)]
+    fake_api.transactions = [c for b, n in ITEMS_PER_BLOCK.items() for c in calls(b, n)]
+    fake_api.traces = [c for b, n in ITEMS_PER_BLOCK.items() for c in traces(b, n)]
+
+    start_block, end_block = (0, 100) if order == 'asc' else (100, 0)
+    stream = CallStream(
+        'test', 'ethereum', CONTRACT_ADDRESS, FUNCTION_ABI,
+        start_block=start_block,
+        end_block=end_block,
+        order=order,
+        call_sources=call_sources
+    )
+
+    data, requests = drain(stream, fake_api)
+    key = lambda r: (r['block_number'], r['transaction_position'], r['trace_index'])
+    rows = (fake_api.transactions if 'transactions' in call_sources else []) + (fake_api.traces if 'traces' in call_sources else [])
+    assert_exact([key(r) for r in data], sorted(map(key, rows), reverse=order == 'desc'))
+    assert len(stream.decode_batch(data)) == len(rows)
+
+    # one request per unexhausted source per page, and none once every source has
+    # returned its last calls before the stop block
+    assert all(1 <= n <= len(call_sources) for n in requests[:-1])
+    assert requests[-1] == 0
+    if len(call_sources) == 1: assert len(fake_api.queries) == len(requests) - 1
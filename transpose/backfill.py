@@ -0,0 +1,529 @@
+from multiprocessing import get_context
+from typing import Callable, List, Optional, Tuple
+import threading
+import argparse
+import sqlite3
+import socket
+import json
+import time
+import uuid
+import os
+
+from transpose.contract import TransposeDecodedContract
+from transpose.sink.base import Sink
+from transpose.sink.file import JSONLinesSink
+from transpose.utils.plan import BackfillPlan
+
+
+JOB_KINDS = ['events', 'calls']
+
+
+class BackfillCoordinator:
+    """
+    The BackfillCoordinator class splits a backfill of a contract's events or
+    calls into work units (block ranges) stored in a SQLite job table, so that
+    many worker processes, on one host or on several hosts sharing a filesystem,
+    can work through it together. Workers lease a unit at a time, stream it into
+    an output partition, and mark it done. A lease expires if its worker stops
+    renewing it (e.g. after a crash), after which the unit is leased again and
+    resumes from its partition's checkpoint. Each job also stores the contract's
+    address, chain, and ABI, so workers only need an API key to join.
+    """
+
+    def __init__(self, path: str,
+                 lease_timeout: float=300.0,
+                 max_attempts: int=5) -> None:
+
+        """
+        Initialize the coordinator, creating the job tables if needed.
+
+        :param path: The path to the SQLite database.
+        :param lease_timeout: The time in seconds after which a unit's lease expires unless renewed, which must exceed the time to fetch and write a page.
+        :param max_attempts: The number of times a unit is leased before it is marked as failed.
+        """
+
+        if not isinstance(lease_timeout, (int, float)) or lease_timeout <= 0: raise ValueError('Invalid lease timeout')
+        elif not isinstance(max_attempts, int) or max_attempts < 1: raise ValueError('Invalid max attempts')
+
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.__lock = threading.Lock()
+
+        # open database in autocommit mode, with explicit write transactions
+        self.__conn = sqlite3.connect(path, timeout=60.0, isolation_level=None, check_same_thread=False)
+        with self.__transaction():
+            self.__conn.execute('CREATE TABLE IF NOT EXISTS jobs (name TEXT PRIMARY KEY, kind TEXT NOT NULL, chain TEXT NOT NULL, contract_address TEXT NOT NULL, abi TEXT NOT NULL, params TEXT NOT NULL, created REAL NOT NULL)')
+            self.__conn.execute(
+                'CREATE TABLE IF NOT EXISTS units (job TEXT NOT NULL, start_block INTEGER NOT NULL, end_block INTEGER NOT NULL, estimate REAL NOT NULL, '
+                'status TEXT NOT NULL, worker TEXT, lease_expires REAL, attempts INTEGER NOT NULL, items INTEGER NOT NULL, error TEXT, started REAL, finished REAL, '
+                'PRIMARY KEY (job, start_block))'
+            )
+
+
+    def submit(self, job: str, contract: TransposeDecodedContract, shards: List[Tuple[int, int]],
+               kind: str='events',
+               plan: BackfillPlan=None,
+               **params) -> int:
+
+        """
+        Submit a backfill job as a set of work units. Submitting a job again adds
+        any new units and leaves existing ones as they are, so a job can be
+        submitted by every node without coordination.
+
+        :param job: The job name.
+        :param contract: The contract to backfill.
+        :param shards: The (start block, end block) ranges of the units, e.g. from BackfillPlan.shards().
+        :param kind: The kind of activity to backfill (one of "events" or "calls").
+        :param plan: The backfill plan of the range, used to weight units by their estimated items when reporting progress.
+        :param params: The parameters to pass to stream_events() or stream_calls(), e.g. event_name, which must be JSON serializable.
+        :return: The number of units added.
+        """
+
+        if kind not in JOB_KINDS: raise ValueError('Invalid kind (must be "events" or "calls")')
+        elif not all(isinstance(s, (list, tuple)) and len(s) == 2 and 0 <= s[0] < s[1] for s in shards): raise ValueError('Invalid shards')
+        try: params = json.dumps(params, sort_keys=True)
+        except TypeError as e: raise ValueError('Stream parameters must be JSON serializable') from e
+
+        # store ABI versions with their block ranges if the contract has them
+        if contract.abi_versions is not None:
+            abi = {'versions': [{'abi': a, 'start_block': s, 'end_block': e} for s, e, a in contract.abi_versions.versions]}
+        else: abi = {'abi': contract.abi}
+
+        with self.__transaction():
+            row = self.__conn.execute('SELECT kind, chain, contract_address, params FROM jobs WHERE name = ?', (job,)).fetchone()
+            if row is None:
+                self.__conn.execute(
+                    'INSERT INTO jobs (name, kind, chain, contract_address, abi, params, created) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (job, kind, contract.chain, contract.contract_address, json.dumps(abi), params, time.time())
+                )
+            elif row != (kind, contract.chain, contract.contract_address, params): raise ValueError('Job exists with different parameters')
+
+            before = self.__conn.total_changes
+            self.__conn.executemany(
+                'INSERT OR IGNORE INTO units (job, start_block, end_block, estimate, status, attempts, items) VALUES (?, ?, ?, ?, ?, 0, 0)',
+                [(job, s, e, plan.estimate(s, e) if plan is not None else float(e - s), 'pending') for s, e in shards]
+            )
+            return self.__conn.total_changes - before
+
+
+    def lease(self, job: str, worker: str) -> Optional[dict]:
+        """
+        Lease the next pending unit of a job, or a unit whose lease has expired.
+        Units whose lease has expired on their last attempt are marked as failed.
+
+        :param job: The job name.
+        :param worker: The worker ID.
+        :return: The unit, or None if no unit is available.
+        """
+
+        now = time.time()
+        with self.__transaction():
+            self.__conn.execute(
+                "UPDATE units SET status = 'failed', error = COALESCE(error, 'Lease expired') WHERE job = ? AND status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (job, now, self.max_attempts)
+            )
+            row = self.__conn.execute(
+                "SELECT start_block, end_block, attempts, items FROM units WHERE job = ? AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) ORDER BY start_block LIMIT 1",
+                (job, now)
+            ).fetchone()
+            if row is None: return None
+
+            self.__conn.execute(
+                "UPDATE units SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, started = COALESCE(started, ?) WHERE job = ? AND start_block = ?",
+                (worker, now + self.lease_timeout, now, job, row[0])
+            )
+            return {'job': job, 'start_block': row[0], 'end_block': row[1], 'attempt': row[2] + 1, 'items': row[3], 'worker': worker}
+
+
+    def renew(self, unit: dict,
+              items: int=None) -> bool:
+
+        """
+        Renew the lease of a unit, recording the items written so far.
+
+        :param unit: The leased unit.
+        :param items: The number of items written to the unit's partition.
+        :return: Whether the worker still holds the lease.
+        """
+
+        with self.__transaction():
+            cursor = self.__conn.execute(
+                "UPDATE units SET lease_expires = ?, items = COALESCE(?, items) WHERE job = ? AND start_block = ? AND status = 'leased' AND worker = ? AND attempts = ?",
+                (time.time() + self.lease_timeout, items, unit['job'], unit['start_block'], unit['worker'], unit['attempt'])
+            )
+            return cursor.rowcount == 1
+
+
+    def complete(self, unit: dict, items: int) -> bool:
+        """
+        Mark a leased unit as done.
+
+        :param unit: The leased unit.
+        :param items: The number of items written to the unit's partition.
+        :return: Whether the worker still held the lease.
+        """
+
+        with self.__transaction():
+            cursor = self.__conn.execute(
+                "UPDATE units SET status = 'done', items = ?, lease_expires = NULL, error = NULL, finished = ? WHERE job = ? AND start_block = ? AND status = 'leased' AND worker = ? AND attempts = ?",
+                (items, time.time(), unit['job'], unit['start_block'], unit['worker'], unit['attempt'])
+            )
+            return cursor.rowcount == 1
+
+
+    def release(self, unit: dict,
+                error: str=None) -> None:
+
+        """
+        Release the lease of a unit so that it can be leased again, or mark it as
+        failed if it has been attempted too many times.
+
+        :param unit: The leased unit.
+        :param error: The error the unit failed with, if any.
+        """
+
+        status = 'failed' if error is not None and unit['attempt'] >= self.max_attempts else 'pending'
+        with self.__transaction():
+            self.__conn.execute(
+                "UPDATE units SET status = ?, lease_expires = NULL, error = ? WHERE job = ? AND start_block = ? AND status = 'leased' AND worker = ? AND attempts = ?",
+                (status, error, unit['job'], unit['start_block'], unit['worker'], unit['attempt'])
+            )
+
+
+    def retry_failed(self, job: str) -> int:
+        """
+        Reset the failed units of a job to pending, with their attempts cleared.
+
+        :param job: The job name.
+        :return: The number of units reset.
+        """
+
+        with self.__transaction():
+            return self.__conn.execute("UPDATE units SET status = 'pending', attempts = 0 WHERE job = ? AND status = 'failed'", (job,)).rowcount
+
+
+    def progress(self, job: str) -> dict:
+        """
+        Report the progress of a job, with the fraction done weighted by the
+        estimated items of each unit, and the remaining time at the job's
+        average rate so far.
+
+        :param job: The job name.
+        :return: The units per status, items done, fraction done, and ETA in seconds (None if unknown).
+        """
+
+        now = time.time()
+        with self.__lock:
+            rows = self.__conn.execute(
+                "SELECT CASE WHEN status = 'leased' AND lease_expires < ? THEN 'pending' ELSE status END, COUNT(*), SUM(estimate), SUM(items), MIN(started) FROM units WHERE job = ? GROUP BY 1",
+                (now, job)
+            ).fetchall()
+
+        units = {status: 0 for status in ['pending', 'leased', 'done', 'failed']}
+        estimates = dict(units)
+        items, started = 0, None
+        for status, count, estimate, status_items, status_started in rows:
+            units[status] += count
+            estimates[status] += estimate
+            if status == 'done': items = status_items
+            if status_started is not None: started = min(started, status_started) if started is not None else status_started
+
+        total = sum(estimates.values())
+        fraction = estimates['done'] / total if total > 0 else 1.0
+        elapsed = now - started if started is not None else 0.0
+        eta = elapsed * (1 - fraction) / fraction if fraction > 0 and elapsed > 0 else None
+        return {
+            'units_total': sum(units.values()),
+            **{f'units_{status}': count for status, count in units.items()},
+            'items_done': items,
+            'fraction': fraction,
+            'eta': eta
+        }
+
+
+    def load_contract(self, job: str, api_key: str) -> TransposeDecodedContract:
+        """
+        Load the contract of a job.
+
+        :param job: The job name.
+        :param api_key: The API key for the Transpose API.
+        :return: The contract.
+        """
+
+        chain, contract_address, abi = self.__get_job(job)[1:4]
+        return TransposeDecodedContract(
+            contract_address=contract_address,
+            abi=abi.get('abi'),
+            abi_versions=abi.get('versions'),
+            chain=chain,
+            api_key=api_key
+        )
+
+
+    def work(self, job: str,
+             contract: TransposeDecodedContract=None,
+             api_key: str=None,
+             output_dir: str=None,
+             sink_factory: Callable[[dict], Sink]=None,
+             page_size: int=10000,
+             worker: str=None,
+             max_units: int=None,
+             wait: bool=True) -> int:
+
+        """
+        Work through the units of a job until none are left. Each unit is
+        streamed page by page into its partition, renewing the lease before each
+        write, and is abandoned if the lease has been lost. A unit that fails is
+        released to be leased again, until it fails on its last attempt. While
+        other workers hold the last units, the worker waits to take over any
+        lease that expires, unless wait is False.
+
+        :param job: The job name.
+        :param contract: The contract to stream with, defaulting to the job's contract loaded with the API key.
+        :param api_key: The API key to load the job's contract with.
+        :param output_dir: The directory to write partitions to, as "{job}/{start block}-{end block}.jsonl" JSON lines files.
+        :param sink_factory: A function that returns the sink to write a unit to, instead of the default partition files.
+        :param page_size: The number of items to fetch and write at a time.
+        :param worker: The worker ID, defaulting to one made from the host name and process ID.
+        :param max_units: The maximum number of unit attempts to work on.
+        :param wait: Whether to wait for leased units to complete or expire when no unit is available.
+        :return: The number of items written.
+        """
+
+        if output_dir is None and sink_factory is None: raise ValueError('Output directory or sink factory is required')
+        elif not isinstance(page_size, int) or page_size < 1: raise ValueError('Invalid page size')
+
+        kind, _, _, _, params = self.__get_job(job)
+        if contract is None: contract = self.load_contract(job, api_key)
+        if worker is None: worker = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        if sink_factory is None: sink_factory = lambda unit: self.__open_partition(output_dir, unit)
+
+        items_written, units = 0, 0
+        while max_units is None or units < max_units:
+            unit = self.lease(job, worker)
+
+            # wait for leased units to complete or expire
+            if unit is None:
+                if not wait or self.progress(job)['units_leased'] == 0: break
+                time.sleep(min(self.lease_timeout / 4, 5.0))
+                continue
+
+            # release failed units to be retried, and stop only when interrupted
+            units += 1
+            try: items_written += self.__run_unit(unit, kind, params, contract, sink_factory, page_size)
+            except Exception as e: self.release(unit, error=repr(e))
+            except BaseException:
+                self.release(unit)
+                raise
+
+        return items_written
+
+
+    def close(self) -> None:
+        """
+        Close the database connection.
+        """
+
+        self.__conn.close()
+
+
+    def __run_unit(self, unit: dict, kind: str, params: dict, contract: TransposeDecodedContract,
+                   sink_factory: Callable[[dict], Sink], page_size: int) -> int:
+
+        """
+        Stream a leased unit into its sink, resuming from the sink's checkpoint.
+        The checkpoint holds the stream state together with the number of items
+        written to the sink, so the unit's item count is exact after a crash.
+
+        :param unit: The leased unit.
+        :param kind: The kind of activity.
+        :param params: The stream parameters.
+        :param contract: The contract to stream with.
+        :param sink_factory: A function that returns the sink to write the unit to.
+        :param page_size: The number of items to fetch and write at a time.
+        :return: The number of items written by this attempt.
+        """
+
+        stream_method = contract.stream_events if kind == 'events' else contract.stream_calls
+        stream = stream_method(start_block=unit['start_block'], end_block=unit['end_block'], **params)
+
+        written, total = 0, 0
+        with sink_factory(unit) as sink:
+            checkpoint = sink.checkpoint()
+            if checkpoint is not None: stream.state, total = checkpoint['state'], checkpoint['items']
+
+            while True:
+                data, state = stream.fetch_next(page_size)
+                if not self.renew(unit, total): return written
+                elif len(data) == 0: break
+                items = stream.decode_batch(data)
+                written += len(items)
+                total += len(items)
+                sink.write(items, {'state': state, 'items': total})
+
+        self.complete(unit, total)
+        return written
+
+
+    def __open_partition(self, output_dir: str, unit: dict) -> Sink:
+        """
+        Open the default partition file of a unit.
+
+        :param output_dir: The output directory.
+        :param unit: The unit.
+        :return: The sink.
+        """
+
+        path = os.path.join(output_dir, unit['job'])
+        os.makedirs(path, exist_ok=True)
+        return JSONLinesSink(os.path.join(path, f"{unit['start_block']}-{unit['end_block']}.jsonl"))
+
+
+    def __get_job(self, job: str) -> Tuple[str, str, str, dict, dict]:
+        """
+        Return the definition of a job.
+
+        :param job: The job name.
+        :return: The kind, chain, contract address, ABI, and stream parameters.
+        """
+
+        with self.__lock:
+            row = self.__conn.execute('SELECT kind, chain, contract_address, abi, params FROM jobs WHERE name = ?', (job,)).fetchone()
+        if row is None: raise ValueError('Unknown job')
+        return row[0], row[1], row[2], json.loads(row[3]), json.loads(row[4])
+
+
+    def __transaction(self) -> 'Transaction':
+        """
+        Return a context manager for a write transaction, which takes the database
+        write lock up front so that concurrent workers never lease the same unit.
+
+        :return: The transaction context manager.
+        """
+
+        return Transaction(self.__conn, self.__lock)
+
+
+class Transaction:
+    """
+    The Transaction class is a context manager for an immediate SQLite
+    transaction, which is committed on success and rolled back on error.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.Lock) -> None:
+        """
+        Initialize the transaction.
+
+        :param conn: The database connection, in autocommit mode.
+        :param lock: The lock guarding the connection within the process.
+        """
+
+        self.conn = conn
+        self.lock = lock
+
+
+    def __enter__(self) -> sqlite3.Connection:
+        """
+        Begin the transaction.
+
+        :return: The database connection.
+        """
+
+        self.lock.acquire()
+        try: self.conn.execute('BEGIN IMMEDIATE')
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.conn
+
+
+    def __exit__(self, exc_type: type, *args) -> None:
+        """
+        Commit or roll back the transaction.
+        """
+
+        try: self.conn.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+        finally: self.lock.release()
+
+
+def run_worker(path: str, job: str, api_key: str, output_dir: str,
+               lease_timeout: float=300.0,
+               page_size: int=10000) -> int:
+
+    """
+    Run a worker for a job with the job's contract, e.g. in a separate process.
+
+    :param path: The path to the SQLite database.
+    :param job: The job name.
+    :param api_key: The API key for the Transpose API.
+    :param output_dir: The directory to write partitions to.
+    :param lease_timeout: The time in seconds after which a unit's lease expires unless renewed.
+    :param page_size: The number of items to fetch and write at a time.
+    :return: The number of items written.
+    """
+
+    coordinator = BackfillCoordinator(path, lease_timeout=lease_timeout)
+    try: return coordinator.work(job, api_key=api_key, output_dir=output_dir, page_size=page_size)
+    finally: coordinator.close()
+
+
+def run_workers(path: str, job: str, api_key: str, output_dir: str,
+                processes: int=None,
+                lease_timeout: float=300.0,
+                page_size: int=10000) -> int:
+
+    """
+    Run workers for a job in several processes on this host and wait for them
+    to finish. To share the rate limit between processes, route their queries
+    through a local gateway.
+
+    :param path: The path to the SQLite database.
+    :param job: The job name.
+    :param api_key: The API key for the Transpose API.
+    :param output_dir: The directory to write partitions to.
+    :param processes: The number of worker processes, defaulting to the number of CPUs.
+    :param lease_timeout: The time in seconds after which a unit's lease expires unless renewed.
+    :param page_size: The number of items to fetch and write at a time.
+    :return: The number of items written.
+    """
+
+    processes = processes if processes is not None else os.cpu_count() or 1
+    if not isinstance(processes, int) or processes < 1: raise ValueError('Invalid number of processes')
+
+    args = [(path, job, api_key, output_dir, lease_timeout, page_size)] * processes
+    with get_context('spawn').Pool(processes) as pool:
+        return sum(pool.starmap(run_worker, args))
+
+
+def main(args: Optional[List[str]]=None) -> None:
+    """
+    Run workers or report progress for a backfill job from the command line.
+
+    :param args: The command line arguments.
+    """
+
+    parser = argparse.ArgumentParser(description='Work-queue coordinator for large Transpose backfills.')
+    parser.add_argument('command', choices=['work', 'progress', 'retry'])
+    parser.add_argument('path')
+    parser.add_argument('job')
+    parser.add_argument('--api-key', default=os.environ.get('TRANSPOSE_API_KEY'))
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--lease-timeout', type=float, default=300.0)
+    parser.add_argument('--page-size', type=int, default=10000)
+    args = parser.parse_args(args)
+
+    if args.command == 'work':
+        items = run_workers(args.path, args.job, args.api_key, args.output_dir, args.processes, args.lease_timeout, args.page_size)
+        print('Wrote {} items'.format(items))
+
+    else:
+        coordinator = BackfillCoordinator(args.path, lease_timeout=args.lease_timeout)
+        if args.command == 'retry': print('Reset {} failed units'.format(coordinator.retry_failed(args.job)))
+        print(json.dumps(coordinator.progress(args.job)))
+        coordinator.close()
+
+
+if __name__ == '__main__':
+    main()
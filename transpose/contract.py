@@ -1,12 +1,23 @@
-import json
+from datetime import datetime
+from typing import Dict, List, Set, Tuple, Union
 
 from transpose.stream.base import Stream
 from transpose.stream.event import EventStream
 from transpose.stream.call import CallStream
-from transpose.sql.general import latest_block_query
+from transpose.sql.general import latest_block_query, bucket_expression
+from transpose.sql.events import event_counts_query, event_words_query, log_word_expression
+from transpose.sql.calls import call_counts_query
 from transpose.utils.request import send_transpose_sql_request
+from transpose.utils.ratelimit import configure_rate_limit
+from transpose.utils.batch import QueryBatcher
 from transpose.utils.exceptions import ContractError
 from transpose.utils.address import to_checksum_address
+from transpose.utils.aggregate import Aggregator, parse_metric, head_slots, word_decoder, TIME_UNITS
+from transpose.utils.abi import VersionedAbi, load_abi, get_topic_map, get_function_map, find_by_name
+from transpose.utils.time import to_iso_timestamp
+from transpose.utils.blocktime import get_block_time_index
+from transpose.utils.plan import BackfillPlan
+from transpose.utils.signatures import SignatureResolver
 
 
 class TransposeDecodedContract:
@@ -20,13 +31,19 @@ class TransposeDecodedContract:
 
     The stream can then be used to get the next decoded event or contract call with the next() method. The stream
     can also be used as an iterator, which will return the next decoded event or contract call on each iteration.
+
+    A contract is not modified after it is initialized, so it can be shared between threads. All contracts and
+    streams in a process send their queries through one pooled HTTP session, paced by the shared rate limit.
     """
     
     def __init__(self, contract_address: str,
                  abi: dict=None, 
                  abi_path: str=None,
                  chain: str='ethereum',
-                 api_key: str=None) -> None:
+                 api_key: str=None,
+                 rate_limit: float=None,
+                 batcher: QueryBatcher=None,
+                 abi_versions: List[dict]=None) -> None:
 
         """
         Initialize the TransposeDecodedContract class with a valid target contract and
@@ -37,6 +54,9 @@ class TransposeDecodedContract:
         :param abi_path: The path to the ABI, supplied as a JSON file.
         :param chain: The chain the contract is deployed on.
         :param api_key: The API key for the Transpose API.
+        :param rate_limit: The maximum number of requests per second, shared by all users of the API key.
+        :param batcher: The query batcher to coalesce requests with, which may be shared between contracts.
+        :param abi_versions: The versions of the ABI (e.g. of a proxy's implementations) instead of a single ABI, each a dict with the "abi" or "abi_path", and the "start_block" (inclusive) and "end_block" (exclusive) it is valid for.
         """
 
         # validate contract address
@@ -44,11 +64,16 @@ class TransposeDecodedContract:
         if self.contract_address is None: raise ContractError('Invalid contract address')
 
         # validate ABI
-        if abi is None and abi_path is None: raise ContractError('ABI is required')
+        self.abi_versions = None
+        if abi_versions is not None:
+            if abi is not None or abi_path is not None: raise ContractError('Only one of ABI, ABI path, or ABI versions can be supplied')
+            self.abi_versions = self.__load_abi_versions(abi_versions)
+            self.abi = self.abi_versions.abi
+        elif abi is None and abi_path is None: raise ContractError('ABI is required')
         elif abi is not None and abi_path is not None: raise ContractError('Only one of ABI or ABI path can be supplied')
         elif abi is not None: self.abi = abi
         elif abi_path is not None:
-            try: self.abi = json.load(open(abi_path))
+            try: self.abi = load_abi(abi_path)
             except: raise ContractError('Invalid ABI path')
 
         # validate ABI object
@@ -64,12 +89,22 @@ class TransposeDecodedContract:
         if api_key is None or not isinstance(api_key, str) or len(api_key) <= 0: 
             raise ContractError('Transpose API key is required')
         self.api_key = api_key
-        
-        # run test query
-        send_transpose_sql_request(
-            api_key=self.api_key,
-            query=latest_block_query('ethereum')
-        )
+        self.batcher = batcher
+
+        # configure rate limit
+        if rate_limit is not None:
+            try: configure_rate_limit(self.api_key, rate_limit)
+            except ValueError as e: raise ContractError(str(e)) from e
+
+
+    def validate(self) -> None:
+        """
+        Run a test query to check the API key. The contract does not contact the
+        API when it is constructed, so an invalid API key otherwise surfaces as a
+        TransposeAPIError on the first query of a stream.
+        """
+
+        self.__get_latest_block()
 
 
     def stream_events(self, 
@@ -78,7 +113,13 @@ class TransposeDecodedContract:
                       end_block: int=None,
                       order: str='asc',
                       live_stream: bool=False,
-                      live_refresh_interval: int=3) -> Stream:
+                      live_refresh_interval: int=3,
+                      compact: bool=False,
+                      start_time: Union[datetime, str, int]=None,
+                      end_time: Union[datetime, str, int]=None,
+                      use_activity_index: bool=False,
+                      raw_unknown: bool=False,
+                      signature_resolver: SignatureResolver=None) -> Stream:
         
         """
         Initiate a stream for contract events.
@@ -89,6 +130,12 @@ class TransposeDecodedContract:
         :param order: The order to stream the events in.
         :param live_stream: Whether to stream live data.
         :param live_refresh_interval: The interval for refreshing the data in seconds when live.
+        :param compact: Whether to return slotted records with interned values to reduce memory usage.
+        :param start_time: The time to start streaming from, inclusive, instead of a start block.
+        :param end_time: The time to stop streaming at, exclusive, instead of an end block.
+        :param use_activity_index: Whether to skip block ranges known from earlier streams to have no activity.
+        :param raw_unknown: Whether to return events that are not in the ABI undecoded instead of dropping them.
+        :param signature_resolver: The resolver to decode events that are not in the ABI with, if any.
         :return: A Stream object.
         """
 
@@ -98,6 +145,9 @@ class TransposeDecodedContract:
         elif order == 'desc' and live_stream:
             raise ContractError('Cannot stream in descending order when live')
 
+        # resolve start and end times
+        start_block, end_block = self.__resolve_time_range(start_block, end_block, start_time, end_time, order)
+
         # set start and stop blocks
         next_block = self.__get_latest_block() + 1
         if live_stream: 
@@ -124,7 +174,13 @@ class TransposeDecodedContract:
             end_block=end_block,
             order=order,
             live_stream=live_stream,
-            live_refresh_interval=live_refresh_interval
+            live_refresh_interval=live_refresh_interval,
+            compact=compact,
+            batcher=self.batcher,
+            use_activity_index=use_activity_index,
+            raw_unknown=raw_unknown,
+            signature_resolver=signature_resolver,
+            abi_versions=self.abi_versions
         )
 
 
@@ -134,7 +190,15 @@ class TransposeDecodedContract:
                      end_block: int=None,
                      order: str='asc',
                      live_stream: bool=False,
-                     live_refresh_interval: int=3) -> Stream:
+                     live_refresh_interval: int=3,
+                     call_sources: Set[str]=None,
+                     compact: bool=False,
+                     start_time: Union[datetime, str, int]=None,
+                     end_time: Union[datetime, str, int]=None,
+                     use_activity_index: bool=False,
+                     decode_policy: Union[str, Dict[str, str]]='full',
+                     raw_unknown: bool=False,
+                     signature_resolver: SignatureResolver=None) -> Stream:
         
         """
         Initiate a stream for contract calls.
@@ -145,6 +209,14 @@ class TransposeDecodedContract:
         :param order: The order to stream the calls in.
         :param live_stream: Whether to stream live data.
         :param live_refresh_interval: The interval for refreshing the data in seconds when live.
+        :param call_sources: The sources to stream calls from (any of "transactions" and "traces"), defaults to both.
+        :param compact: Whether to return slotted records with interned values to reduce memory usage.
+        :param start_time: The time to start streaming from, inclusive, instead of a start block.
+        :param end_time: The time to stop streaming at, exclusive, instead of an end block.
+        :param use_activity_index: Whether to skip block ranges known from earlier streams to have no activity.
+        :param decode_policy: What to decode for each call (one of "full", "input", "output", or "raw"), or a dict of policies by function name, with "*" for the default.
+        :param raw_unknown: Whether to return calls to functions not in the ABI undecoded instead of dropping them.
+        :param signature_resolver: The resolver to decode the inputs of calls to functions not in the ABI with, if any.
         :return: A Stream object.
         """
 
@@ -154,6 +226,15 @@ class TransposeDecodedContract:
         elif order == 'desc' and live_stream:
             raise ContractError('Cannot stream in descending order when live')
 
+        # check call sources
+        if call_sources is not None:
+            if isinstance(call_sources, str): call_sources = {call_sources}
+            if len(call_sources) == 0 or not set(call_sources).issubset({'transactions', 'traces'}):
+                raise ContractError('Invalid call sources (must be any of "transactions" and "traces")')
+
+        # resolve start and end times
+        start_block, end_block = self.__resolve_time_range(start_block, end_block, start_time, end_time, order)
+
         # set start and stop blocks
         next_block = self.__get_latest_block() + 1
         if live_stream: 
@@ -176,14 +257,365 @@ class TransposeDecodedContract:
             contract_address=self.contract_address,
             abi=self.abi,
             function_name=function_name,
+            call_sources=call_sources,
             start_block=start_block,
             end_block=end_block,
             order=order,
             live_stream=live_stream,
-            live_refresh_interval=live_refresh_interval
+            live_refresh_interval=live_refresh_interval,
+            compact=compact,
+            batcher=self.batcher,
+            use_activity_index=use_activity_index,
+            decode_policy=decode_policy,
+            raw_unknown=raw_unknown,
+            signature_resolver=signature_resolver,
+            abi_versions=self.abi_versions
         )
     
 
+    def aggregate_events(self,
+                         event_name: str=None,
+                         group_by='day',
+                         metrics: List[str]=None,
+                         start_block: int=None,
+                         end_block: int=None,
+                         page_size: int=10000) -> Dict[str, list]:
+
+        """
+        Aggregate contract events into buckets of time or blocks. Counts are computed
+        by the Transpose API, while metrics over event parameters (sum, min, max, and
+        avg) are computed by selecting only the needed 32-byte words of each log and
+        decoding them in bulk, one page at a time. Parameters missing from a log's
+        data are ignored by the metrics. With ABI versions, an event whose signature
+        changed between versions is aggregated over all of its signatures.
+
+        :param event_name: The name of the event, or None to count all events.
+        :param group_by: The bucket size (one of "hour", "day", "week", "month", "block", or a number of blocks).
+        :param metrics: The metrics to compute (e.g. "count" or "sum(wad)"), defaults to counts.
+        :param start_block: The block to start aggregating from, inclusive.
+        :param end_block: The block to stop aggregating at, exclusive.
+        :param page_size: The number of logs to fetch per page when decoding parameters.
+        :return: The table, as a dict of column names to lists of values.
+        """
+
+        # validate group by
+        if isinstance(group_by, bool) or not (group_by in TIME_UNITS + ['block'] or (isinstance(group_by, int) and group_by > 0)):
+            raise ContractError('Invalid group by (must be a time unit, "block", or a number of blocks)')
+        parse_bucket = to_iso_timestamp if group_by in TIME_UNITS else int
+
+        # validate metrics
+        metrics = metrics if metrics is not None else ['count']
+        try: params = list(dict.fromkeys(param for _, param in map(parse_metric, metrics) if param is not None))
+        except ValueError as e: raise ContractError(str(e)) from e
+
+        # get target events
+        topic_map = self.__get_topic_map()
+        topics = self.__find_topics(event_name) if event_name is not None else None
+        if topics is None and len(params) > 0:
+            raise ContractError('Event name is required for parameter metrics')
+
+        # set start and stop blocks
+        start_block = max(start_block, 0) if start_block is not None else 0
+        end_block = end_block if end_block is not None else self.__get_latest_block() + 1
+        if start_block > end_block: raise ContractError('Invalid start and end blocks')
+        aggregator = Aggregator(metrics)
+
+        # push down counts when no parameters are needed
+        if len(params) == 0:
+            for row in self.__request(
+                event_counts_query(
+                    chain=self.chain,
+                    contract_address=self.contract_address,
+                    bucket=bucket_expression(group_by),
+                    from_block=start_block,
+                    topic_0=topics,
+                    stop_block=end_block
+                )
+            ):
+                if topics is None: aggregator.add_count(row['bucket'], row['count'], key=row['topic_0'])
+                elif row['topic_0'] in topics: aggregator.add_count(row['bucket'], row['count'])
+
+            if topics is not None: return aggregator.table(parse_bucket)
+            return aggregator.table(parse_bucket, 'event_name', lambda t: topic_map[t]['name'] if t in topic_map else None)
+
+        # locate parameter words of each event signature
+        targets = []
+        for topic_0 in topics:
+            words, decoders = {}, {}
+            topic_params, data_params = topic_map[topic_0]['topics']['params'], topic_map[topic_0]['data']['params']
+            topic_names, data_names = [p['name'] for p in topic_params], [p['name'] for p in data_params]
+            for i, param in enumerate(params):
+                if param in topic_names:
+                    abi_param = topic_params[topic_names.index(param)]
+                    words[f'p{i}'] = log_word_expression(topic_index=topic_names.index(param) + 1)
+                elif param in data_names:
+                    abi_param = data_params[data_names.index(param)]
+                    slot = sum(head_slots(p) for p in data_params[:data_names.index(param)])
+                    words[f'p{i}'] = log_word_expression(data_slot=slot)
+                else: raise ContractError('Invalid parameter "{}"'.format(param))
+                try: decoders[param] = (f'p{i}', word_decoder(abi_param['type']))
+                except ValueError as e: raise ContractError(str(e)) from e
+            targets.append((topic_0, words, decoders))
+
+        # page through words and decode in bulk
+        for topic_0, words, decoders in targets:
+            cursor = (start_block, -1)
+            while True:
+                data = self.__request(
+                    event_words_query(
+                        chain=self.chain,
+                        contract_address=self.contract_address,
+                        topic_0=topic_0,
+                        bucket=bucket_expression(group_by),
+                        words=words,
+                        from_block=cursor[0],
+                        from_log_index=cursor[1],
+                        stop_block=end_block,
+                        limit=page_size
+                    )
+                )
+
+                if len(data) == 0: break
+                aggregator.add_page(
+                    buckets=[row['bucket'] for row in data],
+                    columns={param: decode([row[alias] for row in data]) for param, (alias, decode) in decoders.items()}
+                )
+
+                if len(data) < page_size: break
+                cursor = (data[-1]['block_number'], data[-1]['log_index'])
+
+        return aggregator.table(parse_bucket)
+
+
+    def plan_events(self,
+                    event_name: str=None,
+                    start_block: int=None,
+                    end_block: int=None,
+                    start_time: Union[datetime, str, int]=None,
+                    end_time: Union[datetime, str, int]=None,
+                    bucket_size: int=10000) -> BackfillPlan:
+
+        """
+        Plan a backfill of contract events by counting the events in each bucket of
+        blocks over a range with a single query. The resulting plan can be used to
+        shard the range, size pages, and report progress.
+
+        :param event_name: The name of the event, or None for all events.
+        :param start_block: The block to start from, inclusive.
+        :param end_block: The block to end at, exclusive.
+        :param start_time: The time to start from, inclusive, instead of a start block.
+        :param end_time: The time to end at, exclusive, instead of an end block.
+        :param bucket_size: The number of blocks per bucket.
+        :return: The backfill plan.
+        """
+
+        # get target events
+        topic_map = self.__get_topic_map()
+        topics = self.__find_topics(event_name) if event_name is not None else list(topic_map)
+
+        start_block, end_block = self.__get_plan_range(start_block, end_block, start_time, end_time, bucket_size)
+        rows = self.__request(
+            event_counts_query(
+                chain=self.chain,
+                contract_address=self.contract_address,
+                bucket=bucket_expression(bucket_size),
+                from_block=start_block,
+                topic_0=topics if event_name is not None else None,
+                stop_block=end_block
+            )
+        )
+
+        # only count target events in the ABI
+        rows = [row for row in rows if row['topic_0'] in topics]
+        return self.__build_plan(start_block, end_block, bucket_size, [(row['bucket'], topic_map[row['topic_0']]['name'], row['count']) for row in rows])
+
+
+    def plan_calls(self,
+                   function_name: str=None,
+                   start_block: int=None,
+                   end_block: int=None,
+                   start_time: Union[datetime, str, int]=None,
+                   end_time: Union[datetime, str, int]=None,
+                   call_sources: Set[str]=None,
+                   bucket_size: int=10000) -> BackfillPlan:
+
+        """
+        Plan a backfill of contract calls by counting the transactions and traces
+        in each bucket of blocks over a range, with a single query per source. The
+        resulting plan can be used to shard the range, size pages, and report
+        progress.
+
+        :param function_name: The name of the function, or None for all functions.
+        :param start_block: The block to start from, inclusive.
+        :param end_block: The block to end at, exclusive.
+        :param start_time: The time to start from, inclusive, instead of a start block.
+        :param end_time: The time to end at, exclusive, instead of an end block.
+        :param call_sources: The sources to count calls from (any of "transactions" and "traces"), defaults to both.
+        :param bucket_size: The number of blocks per bucket.
+        :return: The backfill plan.
+        """
+
+        # get target functions
+        function_map = self.__get_function_map()
+        selectors = self.__find_functions(function_name) if function_name is not None else list(function_map)
+
+        # check call sources
+        if call_sources is None: call_sources = {'transactions', 'traces'}
+        elif isinstance(call_sources, str): call_sources = {call_sources}
+        if len(call_sources) == 0 or not set(call_sources).issubset({'transactions', 'traces'}):
+            raise ContractError('Invalid call sources (must be any of "transactions" and "traces")')
+
+        start_block, end_block = self.__get_plan_range(start_block, end_block, start_time, end_time, bucket_size)
+        queries = [
+            call_counts_query(
+                chain=self.chain,
+                contract_address=self.contract_address,
+                source=source,
+                bucket=bucket_expression(bucket_size),
+                from_block=start_block,
+                function_selector=selectors if function_name is not None else None,
+                stop_block=end_block
+            )
+            for source in sorted(call_sources)
+        ]
+
+        # only count calls to target functions in the ABI
+        if self.batcher is not None: results = self.batcher.send_many(self.api_key, queries)
+        else: results = [self.__request(query) for query in queries]
+        rows = [row for result in results for row in result if row['function_selector'] in selectors]
+        return self.__build_plan(start_block, end_block, bucket_size, [(row['bucket'], function_map[row['function_selector']]['name'], row['count']) for row in rows])
+
+
+    def __get_plan_range(self, start_block: int, end_block: int,
+                         start_time: Union[datetime, str, int],
+                         end_time: Union[datetime, str, int],
+                         bucket_size: int) -> Tuple[int, int]:
+
+        """
+        Resolve and validate the block range of a backfill plan.
+
+        :param start_block: The start block, if supplied.
+        :param end_block: The end block, if supplied.
+        :param start_time: The start time, if supplied.
+        :param end_time: The end time, if supplied.
+        :param bucket_size: The number of blocks per bucket.
+        :return: The start and end blocks.
+        """
+
+        if isinstance(bucket_size, bool) or not isinstance(bucket_size, int) or bucket_size <= 0:
+            raise ContractError('Invalid bucket size')
+
+        start_block, end_block = self.__resolve_time_range(start_block, end_block, start_time, end_time, 'asc')
+        next_block = self.__get_latest_block() + 1
+        start_block = max(start_block, 0) if start_block is not None else 0
+        end_block = min(end_block, next_block) if end_block is not None else next_block
+        if start_block > end_block: raise ContractError('Invalid start and end blocks')
+        return start_block, end_block
+
+
+    @staticmethod
+    def __build_plan(start_block: int, end_block: int, bucket_size: int, counts: List[Tuple[int, str, int]]) -> BackfillPlan:
+        """
+        Build a backfill plan from counts per bucket and name.
+
+        :param start_block: The start block, inclusive.
+        :param end_block: The end block, exclusive.
+        :param bucket_size: The number of blocks per bucket.
+        :param counts: The (bucket, name, count) of each row.
+        :return: The backfill plan.
+        """
+
+        buckets, names = {}, {}
+        for bucket, name, count in counts:
+            buckets[bucket] = buckets.get(bucket, 0) + count
+            names[name] = names.get(name, 0) + count
+        return BackfillPlan(start_block, end_block, bucket_size, buckets, names)
+
+
+    def __resolve_time_range(self, start_block: int, end_block: int,
+                             start_time: Union[datetime, str, int],
+                             end_time: Union[datetime, str, int],
+                             order: str) -> Tuple[int, int]:
+
+        """
+        Resolve the start and end times of a stream to blocks with the chain's
+        block time index. In ascending order, the blocks cover the timestamps from
+        the start time (inclusive) to the end time (exclusive), and in descending
+        order, the timestamps from the start time (inclusive) down to the end time
+        (exclusive).
+
+        :param start_block: The start block, if supplied.
+        :param end_block: The end block, if supplied.
+        :param start_time: The start time, if supplied.
+        :param end_time: The end time, if supplied.
+        :param order: The order of the stream.
+        :return: The start and end blocks.
+        """
+
+        index = get_block_time_index(self.chain)
+        resolved = []
+        for block, time, name in [(start_block, start_time, 'start'), (end_block, end_time, 'end')]:
+            if time is not None and block is not None:
+                raise ContractError('Only one of {} block or {} time can be supplied'.format(name, name))
+            elif time is not None:
+                try: block = index.resolve(time, self.__request, after=order == 'desc')
+                except ValueError: raise ContractError('Invalid {} time'.format(name))
+                if order == 'desc': block -= 1
+            resolved.append(block)
+
+        return resolved[0], resolved[1]
+
+
+    def __get_topic_map(self) -> Dict[str, dict]:
+        """
+        Get the topic map of the contract's ABI, or of all its ABI versions, with
+        later versions taking precedence.
+
+        :return: The topic map.
+        """
+
+        return self.abi_versions.topic_map if self.abi_versions is not None else get_topic_map(self.abi)
+
+
+    def __get_function_map(self) -> Dict[str, dict]:
+        """
+        Get the function map of the contract's ABI, or of all its ABI versions,
+        with later versions taking precedence.
+
+        :return: The function map.
+        """
+
+        return self.abi_versions.function_map if self.abi_versions is not None else get_function_map(self.abi)
+
+
+    def __find_topics(self, event_name: str) -> List[str]:
+        """
+        Find the signatures of an event, one per ABI version it changed in.
+
+        :param event_name: The event name.
+        :return: The event signatures.
+        """
+
+        try:
+            if self.abi_versions is not None: return self.abi_versions.find_topics(event_name)
+            return find_by_name([get_topic_map(self.abi)], event_name)
+        except ValueError: raise ContractError('Invalid event name')
+
+
+    def __find_functions(self, function_name: str) -> List[str]:
+        """
+        Find the selectors of a function, one per ABI version it changed in.
+
+        :param function_name: The function name.
+        :return: The function selectors.
+        """
+
+        try:
+            if self.abi_versions is not None: return self.abi_versions.find_functions(function_name)
+            return find_by_name([get_function_map(self.abi)], function_name)
+        except ValueError: raise ContractError('Invalid function name')
+
+
     def __get_latest_block(self) -> int:
         """
         Get the latest block number for the current chain.
@@ -191,7 +623,46 @@ class TransposeDecodedContract:
         :return: The latest block number.
         """
 
+        return self.__request(latest_block_query(self.chain))[0]['block_number']
+
+
+    def __request(self, query: str) -> List[dict]:
+        """
+        Send a SQL query to the Transpose API, through the contract's query
+        batcher if one is set.
+
+        :param query: The SQL query.
+        :return: The response results.
+        """
+
+        if self.batcher is not None: return self.batcher.send(self.api_key, query)
         return send_transpose_sql_request(
             api_key=self.api_key,
-            query=latest_block_query(self.chain)
-        )[0]['block_number']
\ No newline at end of file
+            query=query
+        )
+
+
+    def __load_abi_versions(self, abi_versions: List[dict]) -> VersionedAbi:
+        """
+        Load and validate the versions of the ABI.
+
+        :param abi_versions: The ABI versions, each with an ABI or ABI path and a block range.
+        :return: The versioned ABI.
+        """
+
+        if not isinstance(abi_versions, list) or not all(isinstance(v, dict) for v in abi_versions):
+            raise ContractError('ABI versions must be a list of dicts')
+
+        versions = []
+        for version in abi_versions:
+            if ('abi' in version) == ('abi_path' in version): raise ContractError('Each ABI version requires one of ABI or ABI path')
+            elif 'abi' in version: abi = version['abi']
+            else:
+                try: abi = load_abi(version['abi_path'])
+                except: raise ContractError('Invalid ABI path')
+
+            if not isinstance(abi, list) or not all(isinstance(item, dict) for item in abi): raise ContractError('ABI must be a list of dicts')
+            versions.append({'abi': abi, 'start_block': version.get('start_block', 0), 'end_block': version.get('end_block')})
+
+        try: return VersionedAbi(versions)
+        except ValueError as e: raise ContractError(str(e)) from e
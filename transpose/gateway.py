@@ -0,0 +1,336 @@
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import threading
+import argparse
+import json
+import time
+import re
+
+from transpose.utils.exceptions import TransposeAPIError
+from transpose.utils.ratelimit import configure_rate_limit
+from transpose.utils.request import send_transpose_sql_request, get_api_url
+
+
+TIP_QUERY_PATTERN = re.compile(r'^SELECT block_number FROM (\w+)\.blocks ORDER BY block_number DESC LIMIT 1;?$', re.IGNORECASE)
+
+
+class TransposeGateway:
+    """
+    The TransposeGateway class is a local daemon that multiplexes access to the
+    Transpose API for many worker processes on the same host. It serves the same
+    /sql interface as the API over localhost HTTP, and processes route their
+    queries through it by setting the TRANSPOSE_GATEWAY_URL environment variable
+    (or calling set_gateway_url). Identical queries in flight are sent upstream
+    once, successful responses are cached for a short time, the latest block of
+    each chain is polled once for all processes, and every upstream request
+    shares a single rate budget per API key. Upstream requests are not retried,
+    so that clients retry failed requests through the rate budget.
+    """
+
+    def __init__(self, host: str='127.0.0.1',
+                 port: int=8787,
+                 api_url: str=None,
+                 rate_limit: float=None,
+                 burst: int=1,
+                 cache_ttl: float=2.0,
+                 cache_size: int=1024,
+                 tip_interval: float=3.0,
+                 tip_idle_timeout: float=60.0) -> None:
+
+        """
+        Initialize the gateway.
+
+        :param host: The host to listen on.
+        :param port: The port to listen on, or 0 for any free port.
+        :param api_url: The upstream API URL, defaulting to the configured API URL.
+        :param rate_limit: The maximum number of upstream requests per second per API key.
+        :param burst: The maximum number of upstream requests sent back-to-back per API key.
+        :param cache_ttl: The time in seconds to cache successful responses for.
+        :param cache_size: The maximum number of cached responses.
+        :param tip_interval: The time in seconds between latest block polls.
+        :param tip_idle_timeout: The time in seconds after which an unused tip poller stops.
+        """
+
+        if rate_limit is not None and (not isinstance(rate_limit, (int, float)) or rate_limit <= 0):
+            raise ValueError('Invalid rate limit')
+        elif not isinstance(cache_ttl, (int, float)) or cache_ttl < 0: raise ValueError('Invalid cache TTL')
+        elif not isinstance(cache_size, int) or cache_size < 0: raise ValueError('Invalid cache size')
+        elif not isinstance(tip_interval, (int, float)) or tip_interval <= 0: raise ValueError('Invalid tip interval')
+
+        self.api_url = api_url if api_url is not None else get_api_url()
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.tip_interval = tip_interval
+        self.tip_idle_timeout = tip_idle_timeout
+        self.stats = {'requests': 0, 'upstream': 0, 'deduplicated': 0, 'cached': 0, 'tip': 0}
+
+        self.__lock = threading.Lock()
+        self.__api_keys = set()
+        self.__in_flight: Dict[Tuple[str, str], Future] = {}
+        self.__cache: 'OrderedDict[Tuple[str, str], Tuple[float, List[dict]]]' = OrderedDict()
+        self.__tips: Dict[Tuple[str, str], dict] = {}
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__server = ThreadingHTTPServer((host, port), make_handler(self))
+        self.__server.daemon_threads = True
+
+
+    @property
+    def url(self) -> str:
+        """
+        The base URL of the gateway, for use as TRANSPOSE_GATEWAY_URL.
+
+        :return: The gateway URL.
+        """
+
+        host, port = self.__server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+
+    def serve_forever(self) -> None:
+        """
+        Serve requests until stop() is called.
+        """
+
+        self.__server.serve_forever(poll_interval=0.1)
+
+
+    def start(self) -> 'TransposeGateway':
+        """
+        Serve requests on a background thread.
+
+        :return: The gateway.
+        """
+
+        self.__thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+
+    def stop(self) -> None:
+        """
+        Stop serving requests and stop all tip pollers.
+        """
+
+        self.__stop.set()
+        self.__server.shutdown()
+        self.__server.server_close()
+        if self.__thread is not None: self.__thread.join()
+
+
+    def query(self, api_key: str, query: str) -> List[dict]:
+        """
+        Return the results of a SQL query, from the tip poller or response cache
+        if possible, and otherwise from a single upstream request shared by all
+        identical queries in flight.
+
+        :param api_key: A valid API key for Transpose.
+        :param query: A valid SQL query.
+        :return: The response results.
+        """
+
+        self.__register(api_key)
+        with self.__lock: self.stats['requests'] += 1
+
+        # serve latest block queries from tip poller
+        match = TIP_QUERY_PATTERN.match(' '.join(query.split()))
+        if match: return self.__get_tip(api_key, match.group(1), query)
+
+        # serve from cache or join identical query in flight
+        key = (api_key, query)
+        with self.__lock:
+            cached = self.__cache.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self.stats['cached'] += 1
+                return cached[1]
+
+            future = self.__in_flight.get(key)
+            leader = future is None
+            if leader: future = self.__in_flight[key] = Future()
+            else: self.stats['deduplicated'] += 1
+
+        if leader: self.__send(key, future)
+        return future.result()
+
+
+    def __send(self, key: Tuple[str, str], future: Future) -> None:
+        """
+        Send a query upstream, cache a successful response, and resolve the
+        future shared by identical queries in flight.
+
+        :param key: The API key and query.
+        :param future: The future to resolve.
+        """
+
+        try:
+            with self.__lock: self.stats['upstream'] += 1
+            results = send_transpose_sql_request(api_key=key[0], query=key[1], url=self.api_url, max_retries=0)
+            with self.__lock:
+                if self.cache_ttl > 0 and self.cache_size > 0:
+                    self.__cache[key] = (time.monotonic() + self.cache_ttl, results)
+                    self.__cache.move_to_end(key)
+                    while len(self.__cache) > self.cache_size: self.__cache.popitem(last=False)
+            future.set_result(results)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self.__lock: self.__in_flight.pop(key, None)
+
+
+    def __get_tip(self, api_key: str, chain: str, query: str) -> List[dict]:
+        """
+        Return the latest block of a chain from its tip poller, starting the
+        poller and waiting for its first result if needed.
+
+        :param api_key: A valid API key for Transpose.
+        :param chain: The chain name.
+        :param query: The latest block query.
+        :return: The response results.
+        """
+
+        key = (api_key, chain)
+        with self.__lock:
+            tip = self.__tips.get(key)
+            if tip is None:
+                tip = self.__tips[key] = {'ready': threading.Event(), 'results': None, 'error': None}
+                threading.Thread(target=self.__poll_tip, args=(key, query, tip), daemon=True).start()
+            tip['last_request'] = time.monotonic()
+            self.stats['tip'] += 1
+
+        tip['ready'].wait()
+        if tip['error'] is not None: raise tip['error']
+        return tip['results']
+
+
+    def __poll_tip(self, key: Tuple[str, str], query: str, tip: dict) -> None:
+        """
+        Poll the latest block of a chain until the gateway stops or the tip has
+        not been requested for the idle timeout.
+
+        :param key: The API key and chain name.
+        :param query: The latest block query.
+        :param tip: The tip state shared with requests.
+        """
+
+        while not self.__stop.is_set():
+            try:
+                tip['results'] = send_transpose_sql_request(api_key=key[0], query=query, url=self.api_url, max_retries=0)
+                tip['error'] = None
+            except Exception as e:
+                if tip['results'] is None: tip['error'] = e
+
+            with self.__lock:
+                self.stats['upstream'] += 1
+                tip['ready'].set()
+
+                # stop idle pollers, failing pollers that never succeeded
+                if time.monotonic() - tip['last_request'] > self.tip_idle_timeout or tip['error'] is not None:
+                    self.__tips.pop(key, None)
+                    return
+
+            self.__stop.wait(self.tip_interval)
+
+
+    def __register(self, api_key: str) -> None:
+        """
+        Apply the gateway's rate limit to an API key the first time it is seen.
+
+        :param api_key: The API key.
+        """
+
+        with self.__lock:
+            if api_key in self.__api_keys: return
+            self.__api_keys.add(api_key)
+        if self.rate_limit is not None: configure_rate_limit(api_key, self.rate_limit, self.burst)
+
+
+def make_handler(gateway: TransposeGateway) -> type:
+    """
+    Returns an HTTP request handler class that serves the Transpose SQL API
+    interface through a gateway.
+
+    :param gateway: The gateway.
+    :return: The request handler class.
+    """
+
+    class GatewayRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self) -> None:
+            if self.path.rstrip('/') != '/sql':
+                self.__respond(404, {'status': 'error', 'message': 'Not found'})
+                return
+
+            # parse request
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                query, api_key = body['sql'], self.headers['X-Api-Key']
+                if not isinstance(query, str) or not isinstance(api_key, str): raise ValueError
+            except (ValueError, KeyError, TypeError):
+                self.__respond(400, {'status': 'error', 'message': 'Invalid request'})
+                return
+
+            # run query through gateway
+            try: self.__respond(200, {'status': 'success', 'results': gateway.query(api_key, query)})
+            except TransposeAPIError as e:
+                status_code = e.status_code if e.status_code is not None and e.status_code >= 400 else 502
+                self.__respond(status_code, {'status': 'error', 'message': e.message})
+            except Exception as e:
+                self.__respond(502, {'status': 'error', 'message': 'Gateway error: {}'.format(repr(e))})
+
+        def do_GET(self) -> None:
+            if self.path.rstrip('/') == '/health': self.__respond(200, {'status': 'success', 'stats': gateway.stats})
+            else: self.__respond(404, {'status': 'error', 'message': 'Not found'})
+
+        def __respond(self, status_code: int, body: dict) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return GatewayRequestHandler
+
+
+def main(args: Optional[List[str]]=None) -> None:
+    """
+    Run the gateway from the command line.
+
+    :param args: The command line arguments.
+    """
+
+    parser = argparse.ArgumentParser(description='Local gateway that multiplexes Transpose API access for many processes.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--api-url', default=None)
+    parser.add_argument('--rate-limit', type=float, default=None)
+    parser.add_argument('--burst', type=int, default=1)
+    parser.add_argument('--cache-ttl', type=float, default=2.0)
+    parser.add_argument('--tip-interval', type=float, default=3.0)
+    args = parser.parse_args(args)
+
+    gateway = TransposeGateway(
+        host=args.host,
+        port=args.port,
+        api_url=args.api_url,
+        rate_limit=args.rate_limit,
+        burst=args.burst,
+        cache_ttl=args.cache_ttl,
+        tip_interval=args.tip_interval
+    )
+
+    print('Serving Transpose gateway at {}'.format(gateway.url))
+    try: gateway.serve_forever()
+    except KeyboardInterrupt: gateway.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, List, Optional
+import threading
+import json
+import time
+
+from transpose.utils.records import Record, to_dict
+
+
+DATA_FIELDS = ['event_data', 'input_data', 'output_data']
+
+
+class Sink(ABC):
+    """
+    The Sink class is an abstract base class for all sink objects, which persist
+    decoded stream items in batches. Each sink implementation must inherit from
+    this class and implement the write() and checkpoint() methods. A write must
+    persist a batch of items together with the stream state after them, such that
+    either both or neither are persisted, so that a stream can always be resumed
+    from the sink's checkpoint without losing or duplicating items.
+    """
+
+    @abstractmethod
+    def write(self, items: List[dict], state: dict) -> None:
+        """
+        Persist a batch of decoded items and the stream state after them. This is
+        an abstract method that must be implemented by the child class.
+
+        :param items: The decoded items.
+        :param state: The stream state after the items.
+        """
+
+        raise NotImplementedError
+
+
+    @abstractmethod
+    def checkpoint(self) -> Optional[dict]:
+        """
+        Return the stream state of the last persisted batch, or None if nothing
+        has been persisted yet. This is an abstract method that must be
+        implemented by the child class.
+
+        :return: The stream state.
+        """
+
+        raise NotImplementedError
+
+
+    def close(self) -> None:
+        """
+        Release any resources held by the sink.
+        """
+
+        pass
+
+
+    def __enter__(self) -> 'Sink':
+        """
+        Enter the sink's context.
+
+        :return: The sink.
+        """
+
+        return self
+
+
+    def __exit__(self, *args: Any) -> None:
+        """
+        Close the sink when leaving its context.
+        """
+
+        self.close()
+
+
+class BatchWriter:
+    """
+    The BatchWriter class accumulates pages of decoded items and writes them to a
+    sink in large batches, flushing once a batch has enough rows or once the flush
+    interval has elapsed. Items are only flushed once the stream state after them
+    is known, so every write can checkpoint the exact position of its last item.
+    """
+
+    def __init__(self, sink: Sink, batch_rows: int, flush_interval: float) -> None:
+        """
+        Initialize the batch writer.
+
+        :param sink: The sink to write to.
+        :param batch_rows: The number of rows to accumulate before flushing.
+        :param flush_interval: The maximum time in seconds between flushes.
+        """
+
+        self.sink = sink
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.__lock = threading.Lock()
+        self.__pending: List[dict] = []
+        self.__ready: List[dict] = []
+        self.__state = None
+        self.__flushed_state = None
+        self.__last_flush = time.monotonic()
+
+
+    def add(self, items: List[dict]) -> None:
+        """
+        Add a page of decoded items, to be flushed once its state is committed.
+
+        :param items: The decoded items.
+        """
+
+        with self.__lock: self.__pending.extend(items)
+
+
+    def commit(self, state: dict) -> None:
+        """
+        Mark the pending items as ready with the stream state after them, and
+        flush if the batch is full or the flush interval has elapsed.
+
+        :param state: The stream state after the pending items.
+        """
+
+        with self.__lock:
+            self.__ready.extend(self.__pending)
+            self.__pending = []
+            self.__state = state
+            if len(self.__ready) >= self.batch_rows or time.monotonic() - self.__last_flush >= self.flush_interval:
+                self.__flush()
+
+
+    def flush(self, due_only: bool=False) -> None:
+        """
+        Write the ready items and their state to the sink.
+
+        :param due_only: Whether to only flush if the flush interval has elapsed.
+        """
+
+        with self.__lock:
+            if due_only and time.monotonic() - self.__last_flush < self.flush_interval: return
+            self.__flush()
+
+
+    def __flush(self) -> None:
+        """
+        Write the ready items and their state to the sink. Must be called while
+        holding the lock.
+        """
+
+        self.__last_flush = time.monotonic()
+        if self.__state is None or (len(self.__ready) == 0 and self.__state == self.__flushed_state): return
+        self.sink.write(self.__ready, self.__state)
+        self.rows_written += len(self.__ready)
+        self.__flushed_state = self.__state
+        self.__ready = []
+
+
+def flatten_item(item: dict) -> dict:
+    """
+    Flatten a decoded item into a single-level row for tabular sinks. The fields
+    of the item, context, and call data are merged into the row, while the decoded
+    parameters, which vary between events and functions, are encoded as a JSON
+    string per data field.
+
+    :param item: The decoded item.
+    :return: The flattened row.
+    """
+
+    row = {}
+    for key, value in item.items():
+        if key in DATA_FIELDS: row[key] = encode_json(value)
+        elif isinstance(value, (dict, Record)):
+            for field in value: row[field] = value[field]
+        else: row[key] = value
+
+    return row
+
+
+def to_scalar(value: Any) -> Any:
+    """
+    Convert a row value to a scalar for text-based sinks, with timestamps as
+    ISO-8601 strings, bytes as 0x-prefixed hex strings, and lists and dicts
+    as JSON strings.
+
+    :param value: The value.
+    :return: The converted value.
+    """
+
+    if isinstance(value, datetime): return value.isoformat()
+    elif isinstance(value, (bytes, bytearray)): return '0x' + bytes(value).hex()
+    elif isinstance(value, (list, tuple, dict, Record)): return encode_json(value)
+    return value
+
+
+def encode_json(value: Any) -> str:
+    """
+    Encode a decoded value as a JSON string, with bytes as 0x-prefixed hex
+    strings and timestamps as ISO-8601 strings.
+
+    :param value: The value to encode.
+    :return: The JSON string.
+    """
+
+    return json.dumps(value, default=json_default, separators=(',', ':'))
+
+
+def json_default(value: Any) -> Any:
+    """
+    Convert values that are not natively JSON serializable.
+
+    :param value: The value to convert.
+    :return: The converted value.
+    """
+
+    if isinstance(value, (bytes, bytearray)): return '0x' + bytes(value).hex()
+    elif isinstance(value, datetime): return value.isoformat()
+    elif isinstance(value, Record): return to_dict(value)
+    elif isinstance(value, tuple): return list(value)
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
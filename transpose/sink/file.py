@@ -0,0 +1,141 @@
+from abc import abstractmethod
+from typing import List, Optional
+import csv
+import io
+import os
+
+from transpose.sink.base import Sink, flatten_item, to_scalar, encode_json
+from transpose.utils.cache import read_json, write_json
+from transpose.utils.exceptions import SinkError
+
+
+class FileSink(Sink):
+    """
+    The FileSink class is an abstract base class for sinks that append encoded
+    batches to a single file. After each batch is appended and synced to disk, a
+    checkpoint sidecar file holding the stream state and the file's length is
+    atomically replaced. When the sink is reopened, anything appended after the
+    last checkpoint is truncated, so the file and its checkpoint always agree.
+    Each sink implementation must implement the encode() method.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initialize the sink, truncating the file to its last checkpoint.
+
+        :param path: The path to the output file.
+        """
+
+        self.path = path
+        self.checkpoint_path = path + '.checkpoint.json'
+
+        # load checkpoint, refusing to append to files not written by a sink
+        self.__metadata = read_json(self.checkpoint_path)
+        if not isinstance(self.__metadata, dict):
+            if os.path.exists(path) and os.path.getsize(path) > 0: raise SinkError('File exists without a checkpoint')
+            self.__metadata = {'state': None, 'offset': 0}
+            write_json(self.checkpoint_path, self.__metadata)
+
+        # discard data written after the checkpoint
+        self.__file = open(path, 'ab')
+        self.__file.truncate(self.__metadata['offset'])
+
+
+    def write(self, items: List[dict], state: dict) -> None:
+        """
+        Append a batch of decoded items to the file and then checkpoint the
+        stream state.
+
+        :param items: The decoded items.
+        :param state: The stream state after the items.
+        """
+
+        metadata = dict(self.__metadata)
+        if len(items) > 0:
+            self.__file.write(self.encode(items, metadata))
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+
+        metadata['state'] = state
+        metadata['offset'] = self.__file.tell()
+        write_json(self.checkpoint_path, metadata)
+        self.__metadata = metadata
+
+
+    def checkpoint(self) -> Optional[dict]:
+        """
+        Return the stream state of the last persisted batch.
+
+        :return: The stream state, or None.
+        """
+
+        return self.__metadata['state']
+
+
+    def close(self) -> None:
+        """
+        Close the file.
+        """
+
+        self.__file.close()
+
+
+    @abstractmethod
+    def encode(self, items: List[dict], metadata: dict) -> bytes:
+        """
+        Encode a batch of decoded items into bytes to append to the file. This is
+        an abstract method that must be implemented by the child class.
+
+        :param items: The decoded items.
+        :param metadata: The checkpoint metadata, which may be updated to persist format state.
+        :return: The encoded bytes.
+        """
+
+        raise NotImplementedError
+
+
+class CSVSink(FileSink):
+    """
+    The CSVSink class writes decoded items to a CSV file, one flattened row per
+    item. The header is written with the first batch, and its columns are kept
+    in the checkpoint so that later batches match it.
+    """
+
+    def encode(self, items: List[dict], metadata: dict) -> bytes:
+        """
+        Encode a batch of decoded items as CSV rows.
+
+        :param items: The decoded items.
+        :param metadata: The checkpoint metadata.
+        :return: The encoded bytes.
+        """
+
+        rows = [flatten_item(item) for item in items]
+        buffer = io.StringIO()
+
+        # write header with first batch
+        if metadata.get('columns') is None:
+            metadata['columns'] = list(rows[0].keys())
+            csv.writer(buffer).writerow(metadata['columns'])
+
+        writer = csv.DictWriter(buffer, fieldnames=metadata['columns'])
+        writer.writerows({key: to_scalar(value) for key, value in row.items()} for row in rows)
+        return buffer.getvalue().encode()
+
+
+class JSONLinesSink(FileSink):
+    """
+    The JSONLinesSink class writes decoded items to a JSON lines file, one JSON
+    object per item, keeping the nested structure of the items.
+    """
+
+    def encode(self, items: List[dict], metadata: dict) -> bytes:
+        """
+        Encode a batch of decoded items as JSON lines.
+
+        :param items: The decoded items.
+        :param metadata: The checkpoint metadata.
+        :return: The encoded bytes.
+        """
+
+        return ''.join([encode_json(item) + '\n' for item in items]).encode()
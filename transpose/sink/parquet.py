@@ -0,0 +1,94 @@
+from typing import List, Optional
+import tempfile
+import os
+import re
+
+from transpose.sink.base import Sink, flatten_item
+from transpose.utils.cache import read_json, write_json
+from transpose.utils.exceptions import SinkError
+
+
+PART_PATTERN = re.compile(r'^part-(\d+)\.parquet$')
+STRING_COLUMNS = ['eth_value']
+
+
+class ParquetSink(Sink):
+    """
+    The ParquetSink class writes decoded items to a directory of Parquet files,
+    one flattened row per item and one part file per batch. Each part file is
+    written in full and renamed into place before the checkpoint is updated, and
+    part files written after the last checkpoint are removed when the sink is
+    reopened. Values that may exceed 64 bits (e.g. ETH values in wei) are stored
+    as decimal strings. Requires the optional pyarrow package.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initialize the sink, removing part files written after its last checkpoint.
+
+        :param path: The path to the output directory.
+        """
+
+        try: import pyarrow
+        except ImportError: raise SinkError('The pyarrow package is required for Parquet sinks')
+
+        self.path = path
+        self.checkpoint_path = os.path.join(path, '_checkpoint.json')
+        os.makedirs(path, exist_ok=True)
+
+        # load checkpoint, refusing to write to directories not written by a sink
+        parts = {int(m.group(1)): name for name in os.listdir(path) for m in [PART_PATTERN.match(name)] if m}
+        self.__metadata = read_json(self.checkpoint_path)
+        if not isinstance(self.__metadata, dict):
+            if len(parts) > 0: raise SinkError('Directory contains part files without a checkpoint')
+            self.__metadata = {'state': None, 'parts': 0}
+            write_json(self.checkpoint_path, self.__metadata)
+
+        # discard parts written after the checkpoint
+        for index, name in parts.items():
+            if index >= self.__metadata['parts']: os.remove(os.path.join(path, name))
+
+
+    def write(self, items: List[dict], state: dict) -> None:
+        """
+        Write a batch of decoded items to a new part file and then checkpoint the
+        stream state.
+
+        :param items: The decoded items.
+        :param state: The stream state after the items.
+        """
+
+        import pyarrow
+        import pyarrow.parquet
+
+        metadata = dict(self.__metadata)
+        if len(items) > 0:
+            rows = [flatten_item(item) for item in items]
+            for row in rows:
+                for column in STRING_COLUMNS:
+                    if row.get(column) is not None: row[column] = str(row[column])
+
+            # write part file atomically
+            fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            os.close(fd)
+            try:
+                pyarrow.parquet.write_table(pyarrow.Table.from_pylist(rows), tmp_path)
+                os.replace(tmp_path, os.path.join(self.path, 'part-{:06d}.parquet'.format(metadata['parts'])))
+            except BaseException:
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+                raise
+            metadata['parts'] += 1
+
+        metadata['state'] = state
+        write_json(self.checkpoint_path, metadata)
+        self.__metadata = metadata
+
+
+    def checkpoint(self) -> Optional[dict]:
+        """
+        Return the stream state of the last persisted batch.
+
+        :return: The stream state, or None.
+        """
+
+        return self.__metadata['state']
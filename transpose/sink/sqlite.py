@@ -0,0 +1,124 @@
+from typing import Any, List, Optional
+import sqlite3
+import json
+import re
+
+from transpose.sink.base import Sink, flatten_item, to_scalar
+from transpose.utils.exceptions import SinkError
+
+
+IDENTIFIER_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+CHECKPOINT_TABLE = '_transpose_checkpoints'
+
+
+class SQLiteSink(Sink):
+    """
+    The SQLiteSink class writes decoded items to a table in a SQLite database,
+    one flattened row per item. Each batch is inserted with a single executemany
+    in the same transaction as the stream checkpoint, which is stored in a
+    separate checkpoints table under the sink's name. The table is created from
+    the columns of the first batch if it does not exist.
+    """
+
+    def __init__(self, path: str, table: str,
+                 name: str=None) -> None:
+
+        """
+        Initialize the sink.
+
+        :param path: The path to the SQLite database.
+        :param table: The table to insert rows into.
+        :param name: The name to store the checkpoint under, defaulting to the table name.
+        """
+
+        if not IDENTIFIER_PATTERN.match(table): raise SinkError('Invalid table name')
+        self.path = path
+        self.table = table
+        self.name = name if name is not None else table
+        self.__columns = None
+
+        # open database, allowing writes from the pipeline's worker threads
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        with self.__conn:
+            self.__conn.execute(f'CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (name TEXT PRIMARY KEY, state TEXT NOT NULL)')
+
+
+    def write(self, items: List[dict], state: dict) -> None:
+        """
+        Insert a batch of decoded items and update the checkpoint in a single
+        transaction.
+
+        :param items: The decoded items.
+        :param state: The stream state after the items.
+        """
+
+        rows = [flatten_item(item) for item in items]
+        with self.__conn:
+            if len(rows) > 0:
+                if self.__columns is None: self.__columns = self.__create_table(list(rows[0].keys()))
+                self.__conn.executemany(
+                    f'INSERT INTO {self.table} ({quote_columns(self.__columns)}) VALUES ({", ".join("?" * len(self.__columns))})',
+                    [tuple(sql_value(row.get(column)) for column in self.__columns) for row in rows]
+                )
+
+            self.__conn.execute(
+                f'INSERT OR REPLACE INTO {CHECKPOINT_TABLE} (name, state) VALUES (?, ?)',
+                (self.name, json.dumps(state))
+            )
+
+
+    def checkpoint(self) -> Optional[dict]:
+        """
+        Return the stream state of the last persisted batch.
+
+        :return: The stream state, or None.
+        """
+
+        row = self.__conn.execute(f'SELECT state FROM {CHECKPOINT_TABLE} WHERE name = ?', (self.name,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+
+    def close(self) -> None:
+        """
+        Close the database connection.
+        """
+
+        self.__conn.close()
+
+
+    def __create_table(self, columns: List[str]) -> List[str]:
+        """
+        Create the table with the given columns if it does not exist, and return
+        the columns of the table.
+
+        :param columns: The columns of the rows to insert.
+        :return: The table columns.
+        """
+
+        self.__conn.execute(f'CREATE TABLE IF NOT EXISTS {self.table} ({quote_columns(columns)})')
+        return [row[1] for row in self.__conn.execute(f'PRAGMA table_info({self.table})')]
+
+
+def sql_value(value: Any) -> Any:
+    """
+    Convert a row value to a type SQLite can store. Integers outside the 64-bit
+    range (e.g. wei amounts) are stored as decimal strings.
+
+    :param value: The value.
+    :return: The converted value.
+    """
+
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value if -(1 << 63) <= value < (1 << 63) else str(value)
+    return to_scalar(value)
+
+
+def quote_columns(columns: List[str]) -> str:
+    """
+    Returns a comma-separated list of quoted column names.
+
+    :param columns: The column names.
+    :return: The quoted column list.
+    """
+
+    return ', '.join('"{}"'.format(column.replace('"', '""')) for column in columns)
@@ -1,94 +1,106 @@
-def calls_query(chain: str, contract_address: str, from_block: int, from_transaction_position: int, from_trace_index: int,
-                function_selector: str=None,
+from typing import List, Union
+
+from transpose.sql.general import match_condition
+
+
+def calls_query(chain: str, contract_address: str, source: str, from_block: int, from_transaction_position: int, from_trace_index: int,
+                function_selector: Union[str, List[str]]=None,
                 stop_block: int=None,
                 order: str='asc',
                 limit: int=None) -> str:
 
     """
-    Defines a SQL query that returns transactions and traces for a given contract.
+    Defines a SQL query that returns either the transactions or the traces for a given
+    contract after a call cursor. The cursor is the (block number, transaction position,
+    trace index) key of the last call returned, exclusive, where transactions have a
+    trace index of zero and traces have their trace index offset by one. Each query
+    reads a single table with a keyset predicate on that table's own sort key, so that
+    it can be satisfied by an index scan.
 
     :param chain: The chain name.
     :param contract_address: The contract address.
-    :param from_block: The starting block number, inclusive.
-    :param from_transaction_position: The starting transaction position, inclusive.
-    :param from_trace_index: The starting trace index, inclusive.
-    :param function_selector: The function selector.
+    :param source: The table to query (one of "transactions" or "traces").
+    :param from_block: The cursor block number, exclusive.
+    :param from_transaction_position: The cursor transaction position, exclusive.
+    :param from_trace_index: The cursor trace index, exclusive.
+    :param function_selector: The function selector, or a list of function selectors.
     :param stop_block: The ending block number, exclusive.
-    :param order: The order to return the transactions and traces in.
-    :param limit: The maximum number of transactions and traces to return.
+    :param order: The order to return the transactions or traces in.
+    :param limit: The maximum number of transactions or traces to return.
     :return: The SQL query.
     """
 
-    if order == 'asc':
+    if source == 'transactions':
+
+        # a transaction sorts before its traces, so it is past the cursor if its
+        # position is past the cursor, or equal to it when the cursor is on a trace
+        if order == 'asc': comparison = '>=' if from_trace_index < 0 else '>'
+        else: comparison = '<=' if from_trace_index > 0 else '<'
+
         return \
             f"""
-            SELECT * FROM (
-
-                (SELECT 
-                    timestamp, block_number, transaction_hash, position AS transaction_position,
-                    0 AS trace_index, array[]::integer[] AS trace_address, 'call' AS trace_type,
-                    from_address, value, input, output, __confirmed
-                FROM {chain}.transactions
-                WHERE to_address = '{contract_address}'
-                {f"AND LEFT(input, 10) = '{function_selector}'" if function_selector is not None else ""}
-                AND (block_number, position) >= ({from_block}, {from_transaction_position})
-                {f"AND block_number < {stop_block}" if stop_block is not None else ""}
-                ORDER BY block_number ASC, transaction_position ASC
-                {f"LIMIT {limit}" if limit is not None else ""})
-
-                UNION ALL
-
-                (SELECT 
-                    timestamp, block_number, transaction_hash, transaction_position, 
-                    trace_index + 1, trace_address, trace_type, 
-                    from_address, value, input, output, __confirmed
-                FROM {chain}.traces
-                WHERE to_address = '{contract_address}'
-                {f"AND LEFT(input, 10) = '{function_selector}'" if function_selector is not None else ""}
-                AND (block_number, transaction_position, trace_index) >= ({from_block}, {from_transaction_position}, {from_trace_index})
-                {f"AND block_number < {stop_block}" if stop_block is not None else ""}
-                ORDER BY block_number ASC, transaction_position ASC, trace_index ASC
-                {f"LIMIT {limit}" if limit is not None else ""})
-            
-            ) AS t
-
-            ORDER BY block_number ASC, transaction_position ASC, trace_index ASC
+            SELECT
+                timestamp, block_number, transaction_hash, position AS transaction_position,
+                0 AS trace_index, array[]::integer[] AS trace_address, 'call' AS trace_type,
+                from_address, value, input, output, __confirmed
+            FROM {chain}.transactions
+            WHERE to_address = '{contract_address}'
+            {f"AND {match_condition('LEFT(input, 10)', function_selector)}" if function_selector is not None else ""}
+            AND (block_number, position) {comparison} ({from_block}, {from_transaction_position})
+            {f"AND block_number {'<' if order == 'asc' else '>'} {stop_block}" if stop_block is not None else ""}
+            ORDER BY block_number {order.upper()}, position {order.upper()}
             {f"LIMIT {limit}" if limit is not None else ""}
             """
-    
-    else:
+
+    elif source == 'traces':
         return \
             f"""
-            SELECT * FROM (
-
-                (SELECT 
-                    timestamp, block_number, transaction_hash, position AS transaction_position,
-                    0 AS trace_index, array[]::integer[] AS trace_address, 'call' AS trace_type,
-                    from_address, value, input, output, __confirmed
-                FROM {chain}.transactions
-                WHERE to_address = '{contract_address}'
-                {f"AND LEFT(input, 10) = '{function_selector}'" if function_selector is not None else ""}
-                AND (block_number, position) <= ({from_block}, {from_transaction_position})
-                {f"AND block_number > {stop_block}" if stop_block is not None else ""}
-                ORDER BY block_number DESC, transaction_position DESC
-                {f"LIMIT {limit}" if limit is not None else ""})
-
-                UNION ALL
-
-                (SELECT 
-                    timestamp, block_number, transaction_hash, transaction_position, 
-                    trace_index + 1, trace_address, trace_type, 
-                    from_address, value, input, output, __confirmed
-                FROM {chain}.traces
-                WHERE to_address = '{contract_address}'
-                {f"AND LEFT(input, 10) = '{function_selector}'" if function_selector is not None else ""}
-                AND (block_number, transaction_position, trace_index) <= ({from_block}, {from_transaction_position}, {from_trace_index})
-                {f"AND block_number > {stop_block}" if stop_block is not None else ""}
-                ORDER BY block_number DESC, transaction_position DESC, trace_index DESC
-                {f"LIMIT {limit}" if limit is not None else ""})
-            
-            ) AS t
-
-            ORDER BY block_number DESC, transaction_position DESC, trace_index DESC
+            SELECT
+                timestamp, block_number, transaction_hash, transaction_position,
+                trace_index + 1 AS trace_index, trace_address, trace_type,
+                from_address, value, input, output, __confirmed
+            FROM {chain}.traces
+            WHERE to_address = '{contract_address}'
+            {f"AND {match_condition('LEFT(input, 10)', function_selector)}" if function_selector is not None else ""}
+            AND (block_number, transaction_position, trace_index) {'>' if order == 'asc' else '<'} ({from_block}, {from_transaction_position}, {from_trace_index - 1})
+            {f"AND block_number {'<' if order == 'asc' else '>'} {stop_block}" if stop_block is not None else ""}
+            ORDER BY block_number {order.upper()}, transaction_position {order.upper()}, trace_index {order.upper()}
             {f"LIMIT {limit}" if limit is not None else ""}
-            """
\ No newline at end of file
+            """
+
+    else:
+        raise ValueError('Invalid call source (must be "transactions" or "traces")')
+
+
+def call_counts_query(chain: str, contract_address: str, source: str, bucket: str, from_block: int,
+                      function_selector: Union[str, List[str]]=None,
+                      stop_block: int=None) -> str:
+
+    """
+    Defines a SQL query that returns the number of transactions or traces for a
+    given contract in each bucket, per function selector.
+
+    :param chain: The chain name.
+    :param contract_address: The contract address.
+    :param source: The table to query (one of "transactions" or "traces").
+    :param bucket: The SQL expression for the bucket of each call.
+    :param from_block: The starting block number, inclusive.
+    :param function_selector: The function selector, or a list of function selectors.
+    :param stop_block: The ending block number, exclusive.
+    :return: The SQL query.
+    """
+
+    if source not in ['transactions', 'traces']:
+        raise ValueError('Invalid call source (must be "transactions" or "traces")')
+
+    return \
+        f"""
+        SELECT {bucket} AS bucket, LEFT(input, 10) AS function_selector, COUNT(*) AS count
+        FROM {chain}.{source}
+        WHERE to_address = '{contract_address}'
+        {f"AND {match_condition('LEFT(input, 10)', function_selector)}" if function_selector is not None else ""}
+        AND block_number >= {from_block}
+        {f"AND block_number < {stop_block}" if stop_block is not None else ""}
+        GROUP BY 1, 2
+        ORDER BY 1 ASC, 2 ASC
+        """
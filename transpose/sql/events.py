@@ -1,17 +1,24 @@
+from typing import Dict, List, Union
+
+from transpose.sql.general import match_condition
+
+
 def events_query(chain: str, contract_address: str, from_block: int, from_log_index: int,
-                 topic_0: str=None,
+                 topic_0: Union[str, List[str]]=None,
                  stop_block: int=None,
                  order: str='asc',
                  limit: int=None) -> str:
 
     """
-    Defines a SQL query that returns logs for a given contract.
+    Defines a SQL query that returns logs for a given contract after a log
+    cursor. The cursor is the (block number, log index) key of the last log
+    returned, exclusive, in the order of the query.
 
     :param chain: The chain name.
     :param contract_address: The contract address.
-    :param from_block: The starting block number, inclusive.
-    :param from_log_index: The starting log index, inclusive.
-    :param topic_0: The event signature.
+    :param from_block: The cursor block number, exclusive.
+    :param from_log_index: The cursor log index, exclusive.
+    :param topic_0: The event signature, or a list of event signatures.
     :param stop_block: The ending block number, exclusive.
     :param order: The order to return the logs in.
     :param limit: The maximum number of logs to return.
@@ -24,8 +31,8 @@ def events_query(chain: str, contract_address: str, from_block: int, from_log_in
             SELECT timestamp, block_number, log_index, transaction_hash, transaction_position, address, data, topic_0, topic_1, topic_2, topic_3, __confirmed
             FROM {chain}.logs
             WHERE address = '{contract_address}'
-            {f"AND topic_0 = '{topic_0}'" if topic_0 is not None else ""}
-            AND (block_number, log_index) >= ({from_block}, {from_log_index})
+            {f"AND {match_condition('topic_0', topic_0)}" if topic_0 is not None else ""}
+            AND (block_number, log_index) > ({from_block}, {from_log_index})
             {f"AND block_number < {stop_block}" if stop_block is not None else ""}
             ORDER BY block_number ASC, log_index ASC
             {f"LIMIT {limit}" if limit is not None else ""}
@@ -37,9 +44,91 @@ def events_query(chain: str, contract_address: str, from_block: int, from_log_in
             SELECT timestamp, block_number, log_index, transaction_hash, transaction_position, address, data, topic_0, topic_1, topic_2, topic_3, __confirmed
             FROM {chain}.logs
             WHERE address = '{contract_address}'
-            {f"AND topic_0 = '{topic_0}'" if topic_0 is not None else ""}
-            AND (block_number, log_index) <= ({from_block}, {from_log_index})
+            {f"AND {match_condition('topic_0', topic_0)}" if topic_0 is not None else ""}
+            AND (block_number, log_index) < ({from_block}, {from_log_index})
             {f"AND block_number > {stop_block}" if stop_block is not None else ""}
             ORDER BY block_number DESC, log_index DESC
             {f"LIMIT {limit}" if limit is not None else ""}
-            """
\ No newline at end of file
+            """
+
+def event_counts_query(chain: str, contract_address: str, bucket: str, from_block: int,
+                       topic_0: Union[str, List[str]]=None,
+                       stop_block: int=None) -> str:
+
+    """
+    Defines a SQL query that returns the number of logs for a given contract
+    in each bucket, per event signature.
+
+    :param chain: The chain name.
+    :param contract_address: The contract address.
+    :param bucket: The SQL expression for the bucket of each log.
+    :param from_block: The starting block number, inclusive.
+    :param topic_0: The event signature, or a list of event signatures.
+    :param stop_block: The ending block number, exclusive.
+    :return: The SQL query.
+    """
+
+    return \
+        f"""
+        SELECT {bucket} AS bucket, topic_0, COUNT(*) AS count
+        FROM {chain}.logs
+        WHERE address = '{contract_address}'
+        {f"AND {match_condition('topic_0', topic_0)}" if topic_0 is not None else ""}
+        AND block_number >= {from_block}
+        {f"AND block_number < {stop_block}" if stop_block is not None else ""}
+        GROUP BY 1, 2
+        ORDER BY 1 ASC, 2 ASC
+        """
+
+
+def event_words_query(chain: str, contract_address: str, topic_0: str, bucket: str, words: Dict[str, str],
+                      from_block: int, from_log_index: int,
+                      stop_block: int=None,
+                      limit: int=None) -> str:
+
+    """
+    Defines a SQL query that returns the bucket and selected raw 32-byte words of
+    each log for a given contract and event, after a (block number, log index)
+    cursor. Words are selected as whole topics or as 64-character slices of the
+    data, so that only the needed parameters are transferred.
+
+    :param chain: The chain name.
+    :param contract_address: The contract address.
+    :param topic_0: The event signature.
+    :param bucket: The SQL expression for the bucket of each log.
+    :param words: The column aliases and SQL expressions of the words to select.
+    :param from_block: The cursor block number, exclusive.
+    :param from_log_index: The cursor log index, exclusive.
+    :param stop_block: The ending block number, exclusive.
+    :param limit: The maximum number of logs to return.
+    :return: The SQL query.
+    """
+
+    return \
+        f"""
+        SELECT block_number, log_index, {bucket} AS bucket{''.join(f', {expr} AS {alias}' for alias, expr in words.items())}
+        FROM {chain}.logs
+        WHERE address = '{contract_address}'
+        AND topic_0 = '{topic_0}'
+        AND (block_number, log_index) > ({from_block}, {from_log_index})
+        {f"AND block_number < {stop_block}" if stop_block is not None else ""}
+        ORDER BY block_number ASC, log_index ASC
+        {f"LIMIT {limit}" if limit is not None else ""}
+        """
+
+
+def log_word_expression(topic_index: int=None,
+                        data_slot: int=None) -> str:
+
+    """
+    Defines a SQL expression that selects a single 32-byte word from a log,
+    either an indexed topic or a slot in the head of the log data. Slots past
+    the end of the data are NULL.
+
+    :param topic_index: The index of the topic (1-3).
+    :param data_slot: The index of the 32-byte slot in the data.
+    :return: The SQL expression.
+    """
+
+    if topic_index is not None: return f'topic_{topic_index}'
+    return f'CASE WHEN LENGTH(data) >= {2 + 64 * (data_slot + 1)} THEN SUBSTRING(data FROM {3 + 64 * data_slot} FOR 64) END'
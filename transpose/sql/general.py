@@ -1,3 +1,6 @@
+from typing import List, Union
+
+
 def latest_block_query(chain: str) -> str:
     """
     Defines a SQL query that returns the latest block number.
@@ -12,4 +15,103 @@ def latest_block_query(chain: str) -> str:
         FROM {chain}.blocks 
         ORDER BY block_number DESC 
         LIMIT 1;
-        """
\ No newline at end of file
+        """
+
+def batch_query(queries: List[str]) -> str:
+    """
+    Defines a SQL query that runs several independent queries in a single
+    request. Each query is aggregated into a JSON array of its rows, and the
+    result contains one row per query with its index and rows.
+
+    :param queries: The SQL queries.
+    :return: The SQL query.
+    """
+
+    return '\nUNION ALL\n'.join(
+        f"""
+        (SELECT {i} AS __batch_index, json_agg(t) AS __batch_rows
+        FROM ({query.strip().rstrip(';')}) AS t)
+        """
+        for i, query in enumerate(queries)
+    )
+
+
+def match_condition(column: str, values: Union[str, List[str]]) -> str:
+    """
+    Defines a SQL condition that matches a column against a value, or against
+    any of several values.
+
+    :param column: The SQL expression of the column.
+    :param values: The value or values.
+    :return: The SQL condition.
+    """
+
+    if isinstance(values, str): return f"{column} = '{values}'"
+    quoted = ', '.join(f"'{v}'" for v in values)
+    return f"{column} IN ({quoted})"
+
+
+def bucket_expression(group_by) -> str:
+    """
+    Defines a SQL expression that assigns each row to a bucket, either by
+    truncating its timestamp to a unit of time or by rounding its block
+    number down to a multiple of a block interval.
+
+    :param group_by: The time unit (one of "hour", "day", "week", or "month"), "block", or a number of blocks.
+    :return: The SQL expression.
+    """
+
+    if group_by == 'block': return 'block_number'
+    elif isinstance(group_by, int): return f'block_number / {group_by} * {group_by}'
+    else: return f"date_trunc('{group_by}', timestamp)"
+
+
+def block_times_query(chain: str, block_numbers: List[int]) -> str:
+    """
+    Defines a SQL query that returns the timestamps of specific blocks, as well
+    as the latest block and its timestamp.
+
+    :param chain: The chain name.
+    :param block_numbers: The block numbers.
+    :return: The SQL query.
+    """
+
+    return \
+        f"""
+        (SELECT block_number, timestamp FROM {chain}.blocks
+        WHERE block_number IN ({', '.join(str(b) for b in block_numbers)}))
+        UNION ALL
+        (SELECT block_number, timestamp FROM {chain}.blocks
+        ORDER BY block_number DESC
+        LIMIT 1)
+        """
+
+
+def block_at_time_query(chain: str, timestamp: str, from_block: int,
+                        to_block: int=None) -> str:
+
+    """
+    Defines a SQL query that returns the pair of blocks that straddle a timestamp
+    within a block range, i.e. the last block before the timestamp and the first
+    block at or after it. Either block is missing if it is outside the range.
+
+    :param chain: The chain name.
+    :param timestamp: The ISO-8601 timestamp.
+    :param from_block: The starting block number, inclusive.
+    :param to_block: The ending block number, inclusive.
+    :return: The SQL query.
+    """
+
+    block_range = f"block_number >= {from_block}" + (f" AND block_number <= {to_block}" if to_block is not None else "")
+    return \
+        f"""
+        (SELECT block_number, timestamp FROM {chain}.blocks
+        WHERE {block_range} AND timestamp < '{timestamp}'
+        ORDER BY block_number DESC
+        LIMIT 1)
+        UNION ALL
+        (SELECT block_number, timestamp FROM {chain}.blocks
+        WHERE {block_range} AND timestamp >= '{timestamp}'
+        ORDER BY block_number ASC
+        LIMIT 1)
+        """
@@ -1,8 +1,16 @@
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Hashable, List, Optional, Tuple
+import threading
 import time
 
 from transpose.utils.exceptions import StreamError
+from transpose.utils.request import send_transpose_sql_request
+from transpose.utils.batch import QueryBatcher
+from transpose.utils.activity import ActivityIndex
+from transpose.utils.dedup import Deduplicator
+
+if TYPE_CHECKING: from transpose.sink.base import Sink
 
 
 class Stream(ABC):
@@ -12,6 +20,12 @@ class Stream(ABC):
     decode() methods. Then, you can continuously call the next() method to
     retrieve the next batch of data from the stream. You may also use the stream
     as an iterator, which will return a single item on each iteration.
+
+    Streams are thread-safe: concurrent calls to next() or fetch_next() each
+    receive a disjoint page, since the cursor is read and advanced under a lock,
+    while pages are decoded outside of it. Pages are fetched one at a time,
+    since each starts after the previous one, so to fetch concurrently, use
+    separate streams over disjoint block ranges.
     """
 
     def __init__(self, api_key: str,
@@ -19,7 +33,8 @@ class Stream(ABC):
                  end_block: int=None,
                  order: str='asc',
                  live_stream: bool=False,
-                 live_refresh_interval: int=3) -> None:
+                 live_refresh_interval: int=3,
+                 batcher: QueryBatcher=None) -> None:
 
         """
         Initialize the stream.
@@ -30,6 +45,7 @@ class Stream(ABC):
         :param order: The order to stream the events in.
         :param live_stream: Whether to scroll the iterator when reaches live.
         :param live_refresh_interval: The delay between scroll attempts in seconds.
+        :param batcher: The query batcher to coalesce requests with, if any.
         """
 
         self.api_key = api_key
@@ -38,9 +54,19 @@ class Stream(ABC):
         self.order = order
         self.live_stream = live_stream
         self.live_refresh_interval = live_refresh_interval
+        self.batcher = batcher
+        self.activity_index: Optional[ActivityIndex] = None
+        self.activity_keys: List[str] = []
+        self.deduplicator: Optional[Deduplicator] = None
         self.__state = None
-        self.__it_idx = None
-        self.__it_data = None
+        self.__it_idx = 0
+        self.__it_data = []
+        self.__it_generation = 0
+        self.__it_issued = 0
+        self.__it_buffered = 0
+        self.__lock = threading.RLock()
+        self.__buffered = threading.Condition(self.__lock)
+        self.__fetch_lock = threading.RLock()
 
         # validate order
         if order not in ['asc', 'desc']:
@@ -75,11 +101,48 @@ class Stream(ABC):
         return self
 
 
+    @property
+    def state(self) -> dict:
+        """
+        The stream's cursor, i.e. the state after the last batch fetched. The
+        state can be saved and later assigned to a new stream with the same
+        parameters to resume from it.
+
+        :return: The stream state.
+        """
+
+        with self.__lock:
+            if self.__state is None: self.__state = self.reset(self.start_block)
+            return self.__state
+
+
+    @state.setter
+    def state(self, state: dict) -> None:
+        """
+        Restore the stream's cursor, discarding any buffered items. Waits for a
+        fetch in progress to finish.
+
+        :param state: The stream state.
+        """
+
+        with self.__fetch_lock, self.__lock:
+            self.reset(self.start_block)
+            if self.deduplicator is not None: self.deduplicator.clear()
+            self.__state = state
+            self.__it_idx = 0
+            self.__it_data = []
+            self.__it_generation += 1
+            self.__it_issued = 0
+            self.__it_buffered = 0
+            self.__buffered.notify_all()
+
+
     def next(self, 
              limit: int=100) -> List[dict]:
              
         """
-        Return the next batch of data from the stream.
+        Return the next batch of data from the stream. Concurrent callers each
+        receive a different batch.
 
         :param limit: The maximum number of items to return.
         :return: The next batch of data.
@@ -90,37 +153,61 @@ class Stream(ABC):
     
     def __next__(self) -> dict:
         """
-        Return the next item from the stream.
+        Return the next item from the stream. Concurrent iterators decode and
+        wait for live data in parallel, and items are returned in stream order,
+        since each page is added to the buffer in the order it was fetched.
 
         :return: The next item.
         """
 
         try:
-
-            # check if we have any data left
-            if self.__it_idx is None or self.__it_idx >= len(self.__it_data):
-                self.__it_data = self.__load_next_batch(None)
-                self.__it_idx = 0
-
-                # if scroll iterator is enabled, wait for data
-                if len(self.__it_data) == 0 and self.live_stream:
-                    while len(self.__it_data) == 0:
-                        time.sleep(self.live_refresh_interval)
-                        self.__it_data = self.__load_next_batch(None)
-                
-                # otherwise, raise StopIteration
-                elif len(self.__it_data) == 0:
-                    raise StopIteration
-                
-            # get next item
-            item = self.__it_data[self.__it_idx]
-            self.__it_idx += 1
-            return item
+            while True:
+
+                # get next buffered item
+                with self.__lock:
+                    if self.__it_idx < len(self.__it_data):
+                        item = self.__it_data[self.__it_idx]
+                        self.__it_idx += 1
+                        return item
+
+                # fetch the next page with a ticket for its place in the buffer, and decode it
+                data, _, ticket = self.__fetch_page(None, ticket=True)
+                items = []
+                try: items = self.decode_batch(data)
+                finally: self.__buffer_page(ticket, items)
+
+                # stop on an empty page, or wait for data if scroll iterator is enabled
+                if len(data) == 0:
+                    with self.__lock:
+                        if self.__it_idx < len(self.__it_data): continue
+                    if not self.live_stream: raise StopIteration
+                    time.sleep(self.live_refresh_interval)
 
         except KeyboardInterrupt:
             raise StopIteration
 
 
+    def __buffer_page(self, ticket: Tuple[int, int], items: List[dict]) -> None:
+        """
+        Add the decoded items of a page to the iterator buffer, after the pages
+        fetched before it. Pages fetched before the stream state was restored are
+        discarded.
+
+        :param ticket: The stream generation and index of the page.
+        :param items: The decoded items.
+        """
+
+        generation, index = ticket
+        with self.__buffered:
+            while generation == self.__it_generation and index != self.__it_buffered: self.__buffered.wait()
+            if generation != self.__it_generation: return
+
+            self.__it_data = self.__it_data[self.__it_idx:] + items
+            self.__it_idx = 0
+            self.__it_buffered += 1
+            self.__buffered.notify_all()
+
+
     def __load_next_batch(self, limit: int) -> List[dict]:
         """
         Private implementation to fetch the next batch of data from the stream.
@@ -128,26 +215,254 @@ class Stream(ABC):
         :param limit: The maximum number of items to return.
         """
 
-        # set initial state
-        if self.__state is None:
-            self.__state = self.reset(self.start_block)
+        data, _ = self.fetch_next(limit)
+        return self.decode_batch(data)
+
+
+    def fetch_next(self, limit: int=None) -> Tuple[List[dict], dict]:
+        """
+        Fetch the next batch of raw data from the stream without decoding it, and
+        advance the stream's cursor past it. The batch can be decoded separately
+        with decode_batch(). Each call returns a new state object, so states of
+        earlier batches remain valid checkpoints. Since each batch starts where
+        the previous one ended, concurrent callers fetch one at a time and
+        receive disjoint batches, while reading the state or buffered items does
+        not wait for the fetch.
+
+        :param limit: The maximum number of items to return.
+        :return: A tuple containing the raw batch data and the resulting state.
+        """
+
+        data, state, _ = self.__fetch_page(limit)
+        return data, state
+
 
-        # fetch data
-        data, self.__state = self.fetch(
-            state=self.__state,
-            stop_block=self.end_block,
-            order=self.order,
-            limit=limit
+    def __fetch_page(self, limit: Optional[int],
+                     ticket: bool=False) -> Tuple[List[dict], dict, Optional[Tuple[int, int]]]:
+
+        """
+        Private implementation to fetch the next batch of raw data and advance
+        the stream's cursor, optionally issuing a ticket for the batch's place in
+        the iterator buffer.
+
+        :param limit: The maximum number of items to return.
+        :param ticket: Whether to issue an iterator buffer ticket.
+        :return: A tuple containing the raw batch data, the resulting state, and the ticket, if any.
+        """
+
+        with self.__fetch_lock:
+
+            # fetch until a page has unseen items when deduplicating
+            state = self.state
+            while True:
+                data, state = self.fetch(
+                    state=dict(state),
+                    stop_block=self.end_block,
+                    order=self.order,
+                    limit=limit
+                )
+
+                if self.deduplicator is None or len(data) == 0: break
+                data = self.deduplicator.filter(data)
+                if len(data) > 0: break
+
+            # advance cursor and issue ticket in fetch order
+            with self.__lock:
+                self.__state = state
+                if not ticket: return data, state, None
+                self.__it_issued += 1
+                return data, state, (self.__it_generation, self.__it_issued - 1)
+
+
+    def deduplicate(self, window_blocks: int=128) -> 'Stream':
+        """
+        Drop items that have already been returned, such as items delivered again
+        by overlapping queries or retries, so that each item is returned exactly
+        once. The keys of items in the most recent blocks are kept exactly, and
+        items behind that window are dropped, so memory use is bounded by the
+        window rather than the length of the stream. The window is cleared when
+        the stream's state is restored, since the cursor then determines which
+        items have been returned.
+
+        :param window_blocks: The number of recent blocks to keep item keys for.
+        :return: The stream.
+        """
+
+        try: self.deduplicator = Deduplicator(self.item_key, window_blocks, self.order)
+        except ValueError as e: raise StreamError(str(e)) from e
+        return self
+
+
+    def to_sink(self, sink: 'Sink',
+                batch_rows: int=10000,
+                flush_interval: float=5.0,
+                page_size: int=None,
+                decode_workers: int=1) -> int:
+
+        """
+        Write the stream to a sink in micro-batches, resuming from the sink's
+        checkpoint if it has one. Decoded items are accumulated and flushed
+        together once a batch has enough rows or the flush interval has elapsed,
+        and each flush persists the stream state after its last item along with
+        the items. Fetching, decoding, and writing overlap, with fetching paused
+        while the sink falls behind. Returns once the stream is exhausted, or
+        when interrupted, after flushing any remaining items.
+
+        :param sink: The sink to write to.
+        :param batch_rows: The number of rows to accumulate before flushing.
+        :param flush_interval: The maximum time in seconds between flushes.
+        :param page_size: The number of items to fetch per request, defaulting to the batch size.
+        :param decode_workers: The number of threads decoding pages.
+        :return: The number of items written.
+        """
+
+        from transpose.stream.pipeline import StreamPipeline
+        from transpose.sink.base import BatchWriter
+
+        if not isinstance(batch_rows, int) or batch_rows < 1: raise StreamError('Invalid batch rows')
+        elif not isinstance(flush_interval, (int, float)) or flush_interval < 0: raise StreamError('Invalid flush interval')
+
+        # resume from sink checkpoint
+        checkpoint = sink.checkpoint()
+        if checkpoint is not None: self.state = checkpoint
+
+        writer = BatchWriter(sink, batch_rows, flush_interval)
+        pipeline = StreamPipeline(
+            stream=self,
+            sink=writer.add,
+            page_size=page_size if page_size is not None else batch_rows,
+            decode_workers=decode_workers,
+            on_commit=writer.commit
         )
 
-        # decode data
-        decoded_data = []
-        for item in data:
-            decoded_item = self.decode(item)
-            if decoded_item is not None:
-                decoded_data.append(decoded_item)
+        # run pipeline, flushing on the interval while it is idle
+        errors = []
+        def run() -> None:
+            try: pipeline.run()
+            except BaseException as e: errors.append(e)
 
-        return decoded_data
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            while thread.is_alive():
+                thread.join(timeout=min(flush_interval, 0.5) if flush_interval > 0 else 0.5)
+                writer.flush(due_only=True)
+        except KeyboardInterrupt:
+            pipeline.stop()
+            thread.join()
+        except BaseException:
+            pipeline.stop()
+            thread.join()
+            raise
+
+        if len(errors) > 0: raise errors[0]
+        writer.flush()
+        return writer.rows_written
+
+
+    def request(self, query: str) -> List[dict]:
+        """
+        Send a SQL query to the Transpose API with the stream's API key, through
+        the stream's query batcher if one is set.
+
+        :param query: The SQL query.
+        :return: The response results.
+        """
+
+        if self.batcher is not None: return self.batcher.send(self.api_key, query)
+        return send_transpose_sql_request(api_key=self.api_key, query=query)
+
+
+    def request_many(self, queries: List[str]) -> List[List[dict]]:
+        """
+        Send several independent SQL queries to the Transpose API concurrently,
+        as a single batch if the stream has a query batcher.
+
+        :param queries: The SQL queries.
+        :return: The response results for each query, in order.
+        """
+
+        if self.batcher is not None: return self.batcher.send_many(self.api_key, queries)
+        elif len(queries) == 1: return [self.request(queries[0])]
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            return list(executor.map(self.request, queries))
+
+
+    def state_after(self, data: dict) -> dict:
+        """
+        Return the stream state just after a raw item, so that a stream restored
+        to it continues with the item that follows. Streams that can resume from
+        any item implement this method.
+
+        :param data: The raw item.
+        :return: The stream state.
+        """
+
+        raise NotImplementedError
+
+
+    def item_key(self, data: dict) -> Hashable:
+        """
+        Return the unique key of a raw item, used to drop duplicate items. The
+        key defaults to the stream state just after the item.
+
+        :param data: The raw item.
+        :return: The item key.
+        """
+
+        return tuple(self.state_after(data).values())
+
+
+    def skip_inactive(self, block_number: int,
+                      stop_block: int=None,
+                      order: str='asc') -> Optional[int]:
+
+        """
+        Return the first block from a block onwards, in the stream order, that
+        the stream's activity index does not know to be empty, or None if the
+        rest of the stream is known to be empty. Returns the block itself if the
+        stream has no activity index.
+
+        :param block_number: The block of the stream's cursor.
+        :param stop_block: The block to stop streaming at, exclusive.
+        :param order: The order of the stream.
+        :return: The block number, or None.
+        """
+
+        if self.activity_index is None: return block_number
+        return self.activity_index.skip(self.activity_keys, block_number, stop_block, order)
+
+
+    def record_activity(self, block_number: int, data: List[dict], complete: bool,
+                        stop_block: int=None,
+                        order: str='asc') -> None:
+
+        """
+        Record the blocks scanned by a fetch, and the blocks with activity in
+        them, in the stream's activity index. The block of the last item of an
+        incomplete page is not recorded as scanned, since it may have only been
+        partially fetched.
+
+        :param block_number: The block of the stream's cursor before the fetch.
+        :param data: The raw data fetched, in the stream order.
+        :param complete: Whether the data includes every item up to the stop block.
+        :param stop_block: The block to stop streaming at, exclusive.
+        :param order: The order of the stream.
+        """
+
+        if self.activity_index is None: return
+        block_numbers = [item['block_number'] for item in data]
+
+        if order == 'asc':
+            start_block = block_number
+            if not complete: end_block = block_numbers[-1] if len(block_numbers) > 0 else block_number
+            else: end_block = stop_block
+        else:
+            end_block = block_number
+            if not complete: start_block = block_numbers[-1] + 1 if len(block_numbers) > 0 else block_number
+            else: start_block = stop_block + 1 if stop_block is not None else 0
+
+        self.activity_index.record(self.activity_keys[0], start_block, end_block, block_numbers, self.request)
 
 
     @abstractmethod
@@ -193,4 +508,23 @@ class Stream(ABC):
         :param data: The data to decode.
         """
 
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+
+    def decode_batch(self, data: List[dict]) -> List[dict]:
+        """
+        Decode a batch of items from the stream, dropping items that cannot be
+        decoded. Decodes each item with decode() by default, but may be
+        overridden by the child class to decode the batch in bulk.
+
+        :param data: The data to decode.
+        :return: The decoded data.
+        """
+
+        decoded_data = []
+        for item in data:
+            decoded_item = self.decode(item)
+            if decoded_item is not None:
+                decoded_data.append(decoded_item)
+
+        return decoded_data
\ No newline at end of file
@@ -1,11 +1,21 @@
-from typing import Tuple, List
+from typing import Dict, Hashable, Tuple, List, Optional, Set, Union
+import heapq
+import math
+import sys
 
 from transpose.stream.base import Stream
 from transpose.sql.calls import calls_query
 from transpose.utils.exceptions import StreamError
-from transpose.utils.request import send_transpose_sql_request
-from transpose.utils.decode import build_function_map, decode_hex_data, resolve_decoded_data
+from transpose.utils.batch import QueryBatcher
+from transpose.utils.abi import VersionedAbi, get_function_map, find_by_name
+from transpose.utils.activity import get_activity_index
+from transpose.utils.decode import build_static_layout, decode_buffer, decode_hex_data, decode_static_words, hex_to_bytes, resolve_decoded_data
 from transpose.utils.time import to_iso_timestamp
+from transpose.utils.records import CallItem, CallContext, CallData, intern_values
+from transpose.utils.signatures import SignatureResolver
+
+
+DECODE_POLICIES = ['full', 'input', 'output', 'raw']
 
 
 class CallStream(Stream):
@@ -21,7 +31,15 @@ class CallStream(Stream):
                  end_block: int=None,
                  order: str='asc',
                  live_stream: bool=False,
-                 live_refresh_interval: int=3) -> None:
+                 live_refresh_interval: int=3,
+                 call_sources: Set[str]=None,
+                 compact: bool=False,
+                 batcher: QueryBatcher=None,
+                 use_activity_index: bool=False,
+                 decode_policy: Union[str, Dict[str, str]]='full',
+                 raw_unknown: bool=False,
+                 signature_resolver: SignatureResolver=None,
+                 abi_versions: VersionedAbi=None) -> None:
 
         """
         Initialize the stream.
@@ -35,6 +53,14 @@ class CallStream(Stream):
         :param order: The order to stream the calls in.
         :param live_stream: Whether to stream live data.
         :param live_refresh_interval: The interval for refreshing the data in seconds when live.
+        :param call_sources: The sources to stream calls from (any of "transactions" and "traces"), defaults to both.
+        :param compact: Whether to return slotted records with interned values for the item, context, and call data.
+        :param batcher: The query batcher to coalesce requests with, if any.
+        :param use_activity_index: Whether to skip block ranges known to have no calls, and record the ranges scanned.
+        :param decode_policy: What to decode for each call (one of "full", "input", "output", or "raw"), or a dict of policies by function name, with "*" for the default.
+        :param raw_unknown: Whether to return calls to functions not in the ABI undecoded instead of dropping them.
+        :param signature_resolver: The resolver to decode the inputs of calls to functions not in the ABI with, if any.
+        :param abi_versions: The versions of the ABI to decode each call with by its block number, if any, in which case the ABI is the merged ABI.
         """
 
         super().__init__(
@@ -43,39 +69,76 @@ class CallStream(Stream):
             end_block=end_block,
             order=order,
             live_stream=live_stream,
-            live_refresh_interval=live_refresh_interval
+            live_refresh_interval=live_refresh_interval,
+            batcher=batcher
         )
 
         self.chain = chain
-        self.contract_address = contract_address
+        self.contract_address = sys.intern(contract_address)
         self.abi = abi
+        self.compact = compact
+        self.__items = {}
+        self.__transaction_share = 0.5
+        self.__exhausted = set()
+        self.__static_layouts = {}
+
+        # validate call sources
+        if call_sources is None: call_sources = {'transactions', 'traces'}
+        elif isinstance(call_sources, str): call_sources = {call_sources}
+        self.call_sources = set(call_sources)
+        if len(self.call_sources) == 0 or not self.call_sources.issubset({'transactions', 'traces'}):
+            raise StreamError('Invalid call sources (must be any of "transactions" and "traces")')
 
         # build function map
-        try: self.function_map = build_function_map(self.abi)
+        try: self.function_map = get_function_map(self.abi)
         except Exception as e: raise StreamError('Invalid ABI') from e
 
-        # get target function selector
+        # get target function selector, or selectors if the function changed between ABI versions
         self.function_selector = None
         if function_name is not None:
-            matching_function_selectors = [k for k, v in self.function_map.items() if v['name'] == function_name]
-            if len(matching_function_selectors) != 1: raise StreamError('Invalid function name')
-            self.function_selector = matching_function_selectors[0]
+            try: matching_function_selectors = abi_versions.find_functions(function_name) if abi_versions is not None else find_by_name([self.function_map], function_name)
+            except ValueError: raise StreamError('Invalid function name')
+            self.function_selector = matching_function_selectors[0] if len(matching_function_selectors) == 1 else matching_function_selectors
+
+        # resolve decode policy per function selector
+        if isinstance(decode_policy, str): decode_policy = {'*': decode_policy}
+        if not isinstance(decode_policy, dict) or not all(p in DECODE_POLICIES for p in decode_policy.values()):
+            raise StreamError('Invalid decode policy (must be "full", "input", "output", or "raw")')
+        function_names = {v['name'] for v in self.function_map.values()}
+        if not all(name == '*' or name in function_names for name in decode_policy):
+            raise StreamError('Invalid function name in decode policy')
+        self.decode_policy = dict(decode_policy)
+        self.raw_unknown = raw_unknown
+        self.signature_resolver = signature_resolver
+        self.abi_versions = abi_versions
+
+        # track activity per call sources and function selector, and consult
+        # the activity of both sources, which includes that of either source
+        if use_activity_index:
+            sources_keys = ['+'.join(sorted(self.call_sources))]
+            if len(self.call_sources) == 1: sources_keys.append('+'.join(sorted({'transactions', 'traces'})))
+            selectors = ['+'.join(sorted(matching_function_selectors)), '*'] if function_name is not None else ['*']
+            self.activity_index = get_activity_index(chain, contract_address, 'calls')
+            self.activity_keys = [f'{sources_key}:{selector}' for sources_key in sources_keys for selector in selectors]
 
     
     def reset(self, start_block: int) -> dict:
         """
-        Reset the stream state to the default state. The default stream
-        state is simply the start block, the zero transaction position,
-        and the zero trace index.
+        Reset the stream state to the default state. The stream state is the
+        (block number, transaction position, trace index) key of the last call
+        returned, exclusive, so the default state is a key just before the
+        start block in the stream order.
 
         :param start_block: The block to reset the stream to.
         :return: The default stream state.
         """
 
+        self.__transaction_share = 0.5
+        self.__exhausted = set()
         return {
-            'block_number': start_block,
-            'transaction_position': 0,
-            'trace_index': 0
+            'block_number': start_block if self.order == 'asc' else start_block + 1,
+            'transaction_position': -1,
+            'trace_index': -1
         }
 
 
@@ -85,8 +148,12 @@ class CallStream(Stream):
               limit: int=None) -> Tuple[List[dict], dict]:
 
         """
-        Fetch the next set of raw calls for the stream and update
-        the stream state.
+        Fetch the next set of raw calls for the stream and update the stream
+        state. Transactions and traces are queried separately with per-source
+        limits sized from the observed mix of the two, then merged on the
+        client. Only the merged calls that are known to precede every unread
+        call are returned, so each page transfers close to the limit. Streams
+        with a single call source query that source's table directly.
 
         :param state: The current stream state.
         :param stop_block: The block to stop fetching at, exclusive.
@@ -94,48 +161,146 @@ class CallStream(Stream):
         :param limit: The maximum number of calls to fetch.
         """
 
-        # build query
-        query = calls_query(
-            chain=self.chain,
-            contract_address=self.contract_address,
-            from_block=state['block_number'],
-            from_transaction_position=state['transaction_position'],
-            from_trace_index=state['trace_index'],
-            function_selector=self.function_selector,
-            stop_block=stop_block,
-            order=order,
-            limit=limit
-        )
+        # size per-source limits
+        sources = [source for source in ['transactions', 'traces'] if source in self.call_sources and source not in self.__exhausted]
+        if len(sources) == 0: return [], state
+        source_limits = {source: self.__source_limit(source, limit, len(sources)) for source in sources}
 
-        # send request
-        data = send_transpose_sql_request(
-            api_key=self.api_key,
-            query=query
-        )
+        # skip ranges known to have no calls, from the first block the cursor includes
+        at_block_start = state['transaction_position'] == -1 and state['trace_index'] == -1
+        cursor_block = state['block_number'] - 1 if order == 'desc' and at_block_start else state['block_number']
+        from_block = self.skip_inactive(cursor_block, stop_block, order)
+        if from_block is None: return [], state
+        elif from_block != cursor_block:
+            state = {'block_number': from_block if order == 'asc' else from_block + 1, 'transaction_position': -1, 'trace_index': -1}
+        from_block = state['block_number']
 
-        # update state
-        if len(data) > 0:
-            if order == 'asc':
+        # build queries
+        queries = [
+            calls_query(
+                chain=self.chain,
+                contract_address=self.contract_address,
+                source=source,
+                from_block=state['block_number'],
+                from_transaction_position=state['transaction_position'],
+                from_trace_index=state['trace_index'],
+                function_selector=self.function_selector,
+                stop_block=stop_block,
+                order=order,
+                limit=source_limits[source]
+            )
+            for source in sources
+        ]
+
+        # send requests
+        results = dict(zip(sources, self.request_many(queries)))
+
+        # a single source is already in order
+        if len(sources) == 1:
+            data = results[sources[0]]
+            if len(data) > 0:
                 state['block_number'] = data[-1]['block_number']
                 state['transaction_position'] = data[-1]['transaction_position']
-                state['trace_index'] = data[-1]['trace_index'] + 1
-            else:
-                if data[0]['trace_index'] == 0:
-                    state['block_number'] = data[-1]['block_number']
-                    state['transaction_position'] = data[-1]['transaction_position'] - 1
-                    state['trace_index'] = int(1e9)
-                elif data[0]['transaction_position'] == 0:
-                    state['block_number'] = data[-1]['block_number'] - 1
-                    state['transaction_position'] = int(1e9)
-                    state['trace_index'] = int(1e9)
+                state['trace_index'] = data[-1]['trace_index']
+            if stop_block is not None and (limit is None or len(data) < limit): self.__exhausted.add(sources[0])
+            self.record_activity(from_block, data, limit is None or len(data) < limit, stop_block, order)
+            return data, state
+
+        # find the last key that every truncated source has reached
+        frontier = None
+        for source in sources:
+            source_data = results[source]
+            if source_limits[source] is not None and len(source_data) >= source_limits[source]:
+                key = self.__call_key(source_data[-1])
+                if frontier is None: frontier = key
+                else: frontier = min(frontier, key) if order == 'asc' else max(frontier, key)
+
+        # merge sources up to frontier
+        data = []
+        for item in heapq.merge(*results.values(), key=self.__call_key, reverse=order == 'desc'):
+            if limit is not None and len(data) >= limit: break
+            elif frontier is not None:
+                key = self.__call_key(item)
+                if (key > frontier if order == 'asc' else key < frontier): break
+            data.append(item)
+
+        # skip sources that have returned all their calls before the stop block
+        if stop_block is not None:
+            for source in sources:
+                source_data = results[source]
+                if source_limits[source] is not None and len(source_data) >= source_limits[source]: continue
+                elif len(source_data) == 0: self.__exhausted.add(source)
                 else:
-                    state['block_number'] = data[-1]['block_number']
-                    state['transaction_position'] = data[-1]['transaction_position']
-                    state['trace_index'] = data[-1]['trace_index'] - 1
+                    key, last_key = self.__call_key(source_data[-1]), self.__call_key(data[-1])
+                    if (key <= last_key if order == 'asc' else key >= last_key): self.__exhausted.add(source)
+
+        self.record_activity(from_block, data, frontier is None and (limit is None or len(data) < limit), stop_block, order)
+
+        # update transaction share and state
+        if len(data) > 0:
+            observed_share = sum(1 for item in data if item['trace_index'] == 0) / len(data)
+            self.__transaction_share = min(0.98, max(0.02, (self.__transaction_share + observed_share) / 2))
+            state['block_number'] = data[-1]['block_number']
+            state['transaction_position'] = data[-1]['transaction_position']
+            state['trace_index'] = data[-1]['trace_index']
 
         return data, state
 
 
+    def __source_limit(self, source: str, limit: int, num_sources: int) -> int:
+        """
+        Compute the limit for a single source query from the page limit and
+        the observed share of transactions, with headroom for variance.
+
+        :param source: The call source.
+        :param limit: The page limit.
+        :param num_sources: The number of sources being queried.
+        :return: The source limit.
+        """
+
+        if limit is None or num_sources == 1: return limit
+        share = self.__transaction_share if source == 'transactions' else 1 - self.__transaction_share
+        return min(limit, math.ceil(limit * share * 1.25) + 1)
+
+
+    def state_after(self, data: dict) -> dict:
+        """
+        Return the stream state just after a raw call, i.e. its key.
+
+        :param data: The raw transaction/trace data.
+        :return: The stream state.
+        """
+
+        return {
+            'block_number': data['block_number'],
+            'transaction_position': data['transaction_position'],
+            'trace_index': data['trace_index']
+        }
+
+
+    def item_key(self, data: dict) -> Tuple[str, int]:
+        """
+        Return the unique key of a raw call, i.e. its transaction hash and trace index.
+
+        :param data: The raw transaction/trace data.
+        :return: The item key.
+        """
+
+        return data['transaction_hash'], data['trace_index']
+
+
+    @staticmethod
+    def __call_key(data: dict) -> Tuple[int, int, int]:
+        """
+        Return the sort key of a raw call.
+
+        :param data: The raw transaction/trace data.
+        :return: The (block number, transaction position, trace index) key.
+        """
+
+        return data['block_number'], data['transaction_position'], data['trace_index']
+
+
     def decode(self, data: dict) -> dict:
         """
         Decode the raw transaction/trace data into a decoded call. The decoded 
@@ -144,48 +309,256 @@ class CallStream(Stream):
         on the target activity, the context field contains information on the
         context of the activity, the call_data contains information on the underlying
         call, and the input_data and output_data fields contain the decoded input 
-        and output data for the call.
+        and output data for the call. Input or output data that is not decoded
+        under the function's decode policy is None, or the raw hex data under the
+        "raw" policy. Output data is also None if the call reverted or returned
+        data that cannot be decoded. Calls to functions that are not in the ABI
+        have their input decoded with the stream's signature resolver if
+        possible, and are otherwise dropped, or returned with the raw hex data
+        if raw_unknown is set.
 
         :param data: The raw transaction/trace data.
         :return: The decoded call data.
         """
 
         # check if function selector is in function map
+        _, target_function = self.__get_function(data)
+        if target_function is None: return self.__decode_unknown(data)
+        return self.__decode_call(data, target_function)
+
+
+    def __get_function(self, data: dict) -> Tuple[Hashable, Optional[dict]]:
+        """
+        Return the function map entry to decode a raw call with, from the ABI
+        version in effect at its block if the stream has ABI versions, and a key
+        that identifies the entry.
+
+        :param data: The raw transaction/trace data.
+        :return: The key and the function map entry, or None if the function is unknown.
+        """
+
         function_selector = data['input'][:10]
-        if function_selector not in self.function_map: return None
-        target_function = self.function_map[function_selector]
+        if self.abi_versions is None: return function_selector, self.function_map.get(function_selector)
+        version, target_function = self.abi_versions.get_function(function_selector, data['block_number'])
+        return (function_selector, version), target_function
+
+
+    def __get_policy(self, target_function: dict) -> str:
+        """
+        Return the decode policy of a function.
+
+        :param target_function: The function map entry.
+        :return: The decode policy.
+        """
+
+        return self.decode_policy.get(target_function['name'], self.decode_policy.get('*', 'full'))
+
+
+    def __decode_call(self, data: dict, target_function: dict) -> dict:
+        """
+        Decode a raw call with its function map entry, under the function's
+        decode policy.
+
+        :param data: The raw transaction/trace data.
+        :param target_function: The function map entry for the call.
+        :return: The decoded call data.
+        """
+
+        policy = self.__get_policy(target_function)
+        if policy == 'raw': return self.__format(data, target_function, data['input'], data['output'])
 
         # decode input
-        try:
-            decoded_input = decode_hex_data(target_function['inputs']['types'], '0x' + data['input'][10:])
-            input_data = resolve_decoded_data(target_function['inputs']['params'], decoded_input)
-        except Exception as e:
-            raise StreamError('Failed to decode input data') from e
-
-        # order input data
-        input_data = dict(sorted(
-            input_data.items(),
-            key=lambda item: target_function['input_order'].index(item[0])
-        ))
-
-        # decode output
-        try:
-            decoded_output = decode_hex_data(target_function['outputs']['types'], data['output'])
-            output_data = resolve_decoded_data(target_function['outputs']['params'], decoded_output)
-        except Exception as e:
-            raise StreamError('Failed to decode output data') from e
-
-        # order output data
-        output_data = dict(sorted(
-            output_data.items(),
-            key=lambda item: target_function['output_order'].index(item[0])
-        ))
+        input_data = None
+        if policy != 'output':
+            try:
+                decoded_input = decode_buffer(target_function['inputs']['types'], hex_to_bytes(data['input']), offset=4)
+                input_data = resolve_decoded_data(target_function['inputs']['params'], decoded_input)
+            except Exception as e:
+                raise StreamError('Failed to decode input data') from e
+
+            # order input data
+            input_data = dict(sorted(
+                input_data.items(),
+                key=lambda item: target_function['input_order'].index(item[0])
+            ))
+
+        # decode output, leaving reverted and malformed outputs undecoded
+        output_data = None
+        if policy != 'input' and len(target_function['outputs']['types']) == 0: output_data = {}
+        elif policy != 'input' and data['output'] is not None and len(data['output']) > 2:
+            try:
+                decoded_output = decode_hex_data(target_function['outputs']['types'], data['output'])
+                output_data = resolve_decoded_data(target_function['outputs']['params'], decoded_output)
+            except Exception:
+                output_data = None
+
+            # order output data
+            if output_data is not None:
+                output_data = dict(sorted(
+                    output_data.items(),
+                    key=lambda item: target_function['output_order'].index(item[0])
+                ))
+
+        return self.__format(data, target_function, input_data, output_data)
+
+
+    def __decode_unknown(self, data: dict) -> Optional[dict]:
+        """
+        Decode the input of a call to a function that is not in the ABI with the
+        signature resolver, trying each signature with the call's selector in
+        turn, and falling back to the raw call if raw_unknown is set.
+
+        :param data: The raw transaction/trace data.
+        :return: The decoded or raw call, or None.
+        """
+
+        # decode with resolved signatures, which may be wrong guesses
+        if self.signature_resolver is not None:
+            for target_function in self.signature_resolver.resolve_function(data['input'][:10]):
+                try:
+                    decoded_input = decode_buffer(target_function['inputs']['types'], hex_to_bytes(data['input']), offset=4)
+                    input_data = resolve_decoded_data(target_function['inputs']['params'], decoded_input)
+                except Exception:
+                    continue
+                return self.__format(data, target_function, input_data, None)
+
+        return self.__format(data, None, data['input'], data['output']) if self.raw_unknown else None
+
+
+    def decode_batch(self, data: List[dict]) -> List[dict]:
+        """
+        Decode a page of raw transaction/trace data into decoded calls. Calls are
+        grouped by function selector (and ABI version), and the calls of functions whose decoded
+        inputs and/or outputs (per the function's decode policy) are all static
+        elementary types are decoded together, one column per parameter, from a
+        single buffer per page. All other calls are decoded one at a time.
+
+        :param data: The raw transaction/trace data.
+        :return: The decoded calls.
+        """
+
+        # group calls by function selector and ABI version
+        groups = {}
+        decoded = [None] * len(data)
+        for i, item in enumerate(data):
+            key, target_function = self.__get_function(item)
+            if target_function is not None: groups.setdefault(key, (target_function, []))[1].append(i)
+            elif self.raw_unknown or self.signature_resolver is not None: decoded[i] = self.__decode_unknown(item)
+
+        for key, (target_function, indices) in groups.items():
+            policy = self.__get_policy(target_function)
+            input_layout, output_layout = self.__get_static_layout(key, target_function)
+            decode_input, decode_output = policy in ['full', 'input'], policy in ['full', 'output']
+
+            # decode raw and dynamic calls by row
+            if policy == 'raw' or (decode_input and input_layout is None) or (decode_output and output_layout is None):
+                for i in indices: decoded[i] = self.__decode_call(data[i], target_function)
+                continue
+
+            # split calls that match the static layout
+            static_indices = []
+            input_length = 10 + 64 * len(input_layout) if decode_input else None
+            output_length = 2 + 64 * len(output_layout) if decode_output and len(output_layout) > 0 else None
+            for i in indices:
+                item = data[i]
+                if (input_length is None or len(item['input']) == input_length) and (output_length is None or (item['output'] is not None and len(item['output']) == output_length)):
+                    static_indices.append(i)
+                else: decoded[i] = self.__decode_call(item, target_function)
+
+            # decode static calls by column
+            if len(static_indices) == 0: continue
+            items = [data[i] for i in static_indices]
+            try:
+                input_columns = decode_static_words([item['input'] for item in items], 10, input_layout) if decode_input else []
+                output_columns = decode_static_words([item['output'] for item in items], 2, output_layout) if output_length is not None else []
+
+            # fall back to decoding by row, e.g. on invalid padding
+            except ValueError:
+                for i in static_indices: decoded[i] = self.__decode_call(data[i], target_function)
+                continue
+
+            # format decoded calls
+            input_names = target_function['input_order']
+            output_names = target_function['output_order']
+            input_rows = zip(*input_columns) if len(input_columns) > 0 else [()] * len(items)
+            output_rows = zip(*output_columns) if len(output_columns) > 0 else [()] * len(items)
+            for i, input_values, output_values in zip(static_indices, input_rows, output_rows):
+                decoded[i] = self.__format(
+                    data[i], target_function,
+                    dict(zip(input_names, input_values)) if decode_input else None,
+                    dict(zip(output_names, output_values)) if decode_output else None
+                )
+
+        return [item for item in decoded if item is not None]
+
+
+    def __get_static_layout(self, key: Hashable, target_function: dict) -> Tuple[Optional[list], Optional[list]]:
+        """
+        Return the static layouts of the inputs and outputs of a function, each
+        None if it has any dynamic or composite parameters. Layouts are cached
+        per function selector and ABI version.
+
+        :param key: The key of the function map entry.
+        :param target_function: The function map entry.
+        :return: The input layout and output layout.
+        """
+
+        if key not in self.__static_layouts:
+            input_layout = build_static_layout(target_function['inputs']['params'])
+            output_layout = build_static_layout(target_function['outputs']['params'])
+            self.__static_layouts[key] = (input_layout, output_layout)
+
+        return self.__static_layouts[key]
+
+
+    def __format(self, data: dict, target_function: Optional[dict],
+                 input_data: Union[dict, str, None],
+                 output_data: Union[dict, str, None]) -> dict:
+
+        """
+        Format a decoded call with its item, context, and call data.
+
+        :param data: The raw transaction/trace data.
+        :param target_function: The function map entry for the call, or None if the function is unknown.
+        :param input_data: The decoded input data.
+        :param output_data: The decoded output data.
+        :return: The decoded call.
+        """
+
+        # format compact decoded call
+        function_name = target_function['name'] if target_function is not None else None
+        if self.compact:
+            item = self.__items.get(function_name)
+            if item is None:
+                item = self.__items.setdefault(function_name, CallItem(self.contract_address, sys.intern(function_name) if function_name is not None else None))
+
+            return {
+                'item': item,
+                'context': CallContext(
+                    to_iso_timestamp(data['timestamp']),
+                    data['block_number'],
+                    sys.intern(data['transaction_hash']),
+                    data['transaction_position'],
+                    data['trace_index'],
+                    data['trace_address'],
+                    sys.intern(data['trace_type']),
+                    data['__confirmed']
+                ),
+                'call_data': CallData(
+                    'transaction' if data['trace_index'] == 0 else 'internal_transaction',
+                    sys.intern(data['from_address']),
+                    self.contract_address,
+                    data['value'] // 10**18
+                ),
+                'input_data': intern_values(input_data) if isinstance(input_data, dict) else input_data,
+                'output_data': intern_values(output_data) if isinstance(output_data, dict) else output_data
+            }
 
         # format decoded log
         return {
             'item': {
                 'contract_address': self.contract_address,
-                'function_name': target_function['name']
+                'function_name': function_name
             },
             'context': {
                 'timestamp': to_iso_timestamp(data['timestamp']),
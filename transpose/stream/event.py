@@ -1,11 +1,16 @@
-from typing import Tuple, List
+from typing import Hashable, Tuple, List, Optional
+import sys
 
 from transpose.stream.base import Stream
 from transpose.sql.events import events_query
 from transpose.utils.exceptions import StreamError
-from transpose.utils.request import send_transpose_sql_request
-from transpose.utils.decode import build_topic_map, decode_hex_data, resolve_decoded_data
+from transpose.utils.batch import QueryBatcher
+from transpose.utils.abi import VersionedAbi, get_topic_map, find_by_name
+from transpose.utils.activity import get_activity_index
+from transpose.utils.decode import build_static_layout, decode_hex_data, decode_static_words, decode_topics, resolve_decoded_data
 from transpose.utils.time import to_iso_timestamp
+from transpose.utils.records import EventItem, EventContext, intern_values
+from transpose.utils.signatures import SignatureResolver
 
 
 class EventStream(Stream):
@@ -21,7 +26,13 @@ class EventStream(Stream):
                  end_block: int=None,
                  order: str='asc',
                  live_stream: bool=False,
-                 live_refresh_interval: int=3) -> None:
+                 live_refresh_interval: int=3,
+                 compact: bool=False,
+                 batcher: QueryBatcher=None,
+                 use_activity_index: bool=False,
+                 raw_unknown: bool=False,
+                 signature_resolver: SignatureResolver=None,
+                 abi_versions: VersionedAbi=None) -> None:
 
         """
         Initialize the stream.
@@ -35,6 +46,12 @@ class EventStream(Stream):
         :param order: The order to stream the events in.
         :param live_stream: Whether to stream live data.
         :param live_refresh_interval: The interval for refreshing the data in seconds when live.
+        :param compact: Whether to return slotted records with interned values for the item and context.
+        :param batcher: The query batcher to coalesce requests with, if any.
+        :param use_activity_index: Whether to skip block ranges known to have no events, and record the ranges scanned.
+        :param raw_unknown: Whether to return events that are not in the ABI undecoded instead of dropping them.
+        :param signature_resolver: The resolver to decode events that are not in the ABI with, if any.
+        :param abi_versions: The versions of the ABI to decode each log with by its block number, if any, in which case the ABI is the merged ABI.
         """
 
         super().__init__(
@@ -43,37 +60,52 @@ class EventStream(Stream):
             end_block=end_block,
             order=order,
             live_stream=live_stream,
-            live_refresh_interval=live_refresh_interval
+            live_refresh_interval=live_refresh_interval,
+            batcher=batcher
         )
 
         self.chain = chain
-        self.contract_address = contract_address
+        self.contract_address = sys.intern(contract_address)
         self.abi = abi
+        self.compact = compact
+        self.raw_unknown = raw_unknown
+        self.signature_resolver = signature_resolver
+        self.abi_versions = abi_versions
+        self.__items = {}
+        self.__static_layouts = {}
 
         # build topic map
-        try: self.topic_map = build_topic_map(self.abi)
+        try: self.topic_map = get_topic_map(self.abi)
         except Exception as e: raise StreamError('Invalid ABI') from e
 
-        # get target event signature
+        # get target event signature, or signatures if the event changed between ABI versions
         self.event_signature = None
         if event_name is not None:
-            matching_event_signatures = [k for k, v in self.topic_map.items() if v['name'] == event_name]
-            if len(matching_event_signatures) != 1: raise StreamError('Invalid event name')
-            self.event_signature = matching_event_signatures[0]
+            try: matching_event_signatures = self.abi_versions.find_topics(event_name) if self.abi_versions is not None else find_by_name([self.topic_map], event_name)
+            except ValueError: raise StreamError('Invalid event name')
+            self.event_signature = matching_event_signatures[0] if len(matching_event_signatures) == 1 else matching_event_signatures
+
+        # track activity per event signature
+        if use_activity_index:
+            self.activity_index = get_activity_index(chain, contract_address, 'events')
+            signature_key = '+'.join(sorted(matching_event_signatures)) if event_name is not None else None
+            self.activity_keys = [signature_key, '*'] if signature_key is not None else ['*']
             
 
     def reset(self, start_block: int) -> dict:
         """
-        Reset the stream state to the default state. The default stream
-        state is simply the start block and the zero log index.
+        Reset the stream state to the default state. The stream state is the
+        (block number, log index) key of the last event returned, exclusive,
+        so the default state is a key just before the start block in the
+        stream order.
 
         :param start_block: The block to reset the stream to.
         :return: The default stream state.
         """
 
         return {
-            'block_number': start_block,
-            'log_index': 0
+            'block_number': start_block if self.order == 'asc' else start_block + 1,
+            'log_index': -1
         }
 
     
@@ -84,7 +116,9 @@ class EventStream(Stream):
 
         """
         Fetch the next set of raw events for the stream and update the 
-        stream state.
+        stream state. The state is advanced to the key of the last event
+        fetched, so each page starts exactly after the previous one in
+        either order.
 
         :param state: The current stream state.
         :param stop_block: The block to stop fetching at, exclusive.
@@ -92,6 +126,13 @@ class EventStream(Stream):
         :param limit: The maximum number of events to fetch.
         """
 
+        # skip ranges known to have no events, from the first block the cursor includes
+        cursor_block = state['block_number'] - 1 if order == 'desc' and state['log_index'] == -1 else state['block_number']
+        from_block = self.skip_inactive(cursor_block, stop_block, order)
+        if from_block is None: return [], state
+        elif from_block != cursor_block:
+            state = {'block_number': from_block if order == 'asc' else from_block + 1, 'log_index': -1}
+
         # build query
         query = events_query(
             chain=self.chain,
@@ -105,27 +146,39 @@ class EventStream(Stream):
         )
 
         # send request
-        data = send_transpose_sql_request(
-            api_key=self.api_key,
-            query=query
-        )
+        data = self.request(query)
+        self.record_activity(state['block_number'], data, limit is None or len(data) < limit, stop_block, order)
 
         # update state
-        if len(data) > 0:
-            if order == 'asc':
-                state['block_number'] = data[-1]['block_number']
-                state['log_index'] = data[-1]['log_index'] + 1
-            else:
-                if data[0]['log_index'] == 0:
-                    state['block_number'] = data[-1]['block_number'] - 1
-                    state['log_index'] = int(1e9)
-                else:
-                    state['block_number'] = data[-1]['block_number']
-                    state['log_index'] = data[-1]['log_index'] - 1
-
+        if len(data) > 0: state = self.state_after(data[-1])
         return data, state
 
 
+    def state_after(self, data: dict) -> dict:
+        """
+        Return the stream state just after a raw log, i.e. its key.
+
+        :param data: The raw log data.
+        :return: The stream state.
+        """
+
+        return {
+            'block_number': data['block_number'],
+            'log_index': data['log_index']
+        }
+
+
+    def item_key(self, data: dict) -> Tuple[str, int]:
+        """
+        Return the unique key of a raw log, i.e. its transaction hash and log index.
+
+        :param data: The raw log data.
+        :return: The item key.
+        """
+
+        return data['transaction_hash'], data['log_index']
+
+
     def decode(self, data: dict) -> dict:
         """
         Decode the raw log data into a decoded event. The decoded event
@@ -133,20 +186,49 @@ class EventStream(Stream):
         the event_data. The item field contains information on the target
         activity, the context field contains information on the context 
         of the activity, and the event_data field contains the decoded
-        data from the log.
+        data from the log. Logs of events that are not in the ABI are
+        decoded with the stream's signature resolver if possible, and are
+        otherwise dropped, or returned undecoded with a None event name and
+        the raw topics and data as the event_data if raw_unknown is set.
 
         :param data: The raw log data.
         :return: The decoded log.
         """
 
         # check if log is in topic map
-        if data['topic_0'] not in self.topic_map: return None
-        target_topic = self.topic_map[data['topic_0']]
-        
+        _, target_topic = self.__get_topic(data)
+        if target_topic is None: return self.__decode_unknown(data)
+        return self.__decode_log(data, target_topic)
+
+
+    def __get_topic(self, data: dict) -> Tuple[Hashable, Optional[dict]]:
+        """
+        Return the topic map entry to decode a raw log with, from the ABI version
+        in effect at its block if the stream has ABI versions, and a key that
+        identifies the entry.
+
+        :param data: The raw log data.
+        :return: The key and the topic map entry, or None if the event is unknown.
+        """
+
+        if self.abi_versions is None: return data['topic_0'], self.topic_map.get(data['topic_0'])
+        version, target_topic = self.abi_versions.get_topic(data['topic_0'], data['block_number'])
+        return (data['topic_0'], version), target_topic
+
+
+    def __decode_log(self, data: dict, target_topic: dict) -> dict:
+        """
+        Decode a raw log with its topic map entry.
+
+        :param data: The raw log data.
+        :param target_topic: The topic map entry for the log.
+        :return: The decoded log.
+        """
+
         # decode topics
         try:
-            topics_data = '0x' + ''.join(data[f'topic_{i}'][2:] for i in range(1, 4) if data[f'topic_{i}'] is not None)
-            decoded_topics = decode_hex_data(target_topic['topics']['types'], topics_data)
+            topics = [data[f'topic_{i}'] for i in range(1, 4) if data[f'topic_{i}'] is not None]
+            decoded_topics = decode_topics(target_topic['topics']['params'], topics)
             topics_data = resolve_decoded_data(target_topic['topics']['params'], decoded_topics)
         except Exception as e: 
             raise StreamError('Failed to decode log') from e
@@ -164,11 +246,147 @@ class EventStream(Stream):
             key=lambda item: target_topic['order'].index(item[0])
         ))
 
+        return self.__format(data, target_topic, event_data)
+
+
+    def __decode_unknown(self, data: dict) -> Optional[dict]:
+        """
+        Decode a raw log of an event that is not in the ABI with the signature
+        resolver, falling back to the raw log if raw_unknown is set.
+
+        :param data: The raw log data.
+        :return: The decoded or raw log, or None.
+        """
+
+        # decode with resolved signature, which may be a wrong guess
+        if self.signature_resolver is not None:
+            num_indexed = sum(1 for i in range(1, 4) if data[f'topic_{i}'] is not None)
+            target_topic = self.signature_resolver.resolve_event(data['topic_0'], num_indexed)
+            if target_topic is not None:
+                try: return self.__decode_log(data, target_topic)
+                except StreamError: pass
+
+        if not self.raw_unknown: return None
+        topics = [data[f'topic_{i}'] for i in range(4) if data[f'topic_{i}'] is not None]
+        return self.__format(data, None, {'topics': topics, 'data': data['data']})
+
+
+    def decode_batch(self, data: List[dict]) -> List[dict]:
+        """
+        Decode a page of raw log data into decoded events. Logs are grouped by
+        event signature (and ABI version), and the logs of events whose parameters are all static
+        elementary types are decoded together, one column per parameter, from a
+        single buffer per page. All other logs are decoded one at a time.
+
+        :param data: The raw log data.
+        :return: The decoded logs.
+        """
+
+        # group logs by event signature and ABI version
+        groups = {}
+        decoded = [None] * len(data)
+        for i, item in enumerate(data):
+            key, target_topic = self.__get_topic(item)
+            if target_topic is not None: groups.setdefault(key, (target_topic, []))[1].append(i)
+            elif self.raw_unknown or self.signature_resolver is not None: decoded[i] = self.__decode_unknown(item)
+        for key, (target_topic, indices) in groups.items():
+            layout = self.__get_static_layout(key, target_topic)
+
+            # decode dynamic logs by row
+            if layout is None:
+                for i in indices: decoded[i] = self.__decode_log(data[i], target_topic)
+                continue
+
+            # split logs that match the static layout
+            static_indices = []
+            topic_layouts, data_layout = layout
+            data_length = 2 + 64 * len(data_layout)
+            for i in indices:
+                item = data[i]
+                if len(item['data']) == data_length and all(item[f'topic_{t}'] is not None for t in range(1, len(topic_layouts) + 1)):
+                    static_indices.append(i)
+                else: decoded[i] = self.__decode_log(item, target_topic)
+
+            # decode static logs by column
+            if len(static_indices) == 0: continue
+            items = [data[i] for i in static_indices]
+            try:
+                columns = []
+                for t, topic_layout in enumerate(topic_layouts, 1):
+                    columns += decode_static_words([item[f'topic_{t}'] for item in items], 2, [topic_layout])
+                columns += decode_static_words([item['data'] for item in items], 2, data_layout)
+
+            # fall back to decoding by row, e.g. on invalid padding
+            except ValueError:
+                for i in static_indices: decoded[i] = self.__decode_log(data[i], target_topic)
+                continue
+
+            # order event data
+            names = [p['name'] for p in target_topic['topics']['params']] + [p['name'] for p in target_topic['data']['params']]
+            ordered = sorted(zip(names, columns), key=lambda column: target_topic['order'].index(column[0]))
+            names, columns = [name for name, _ in ordered], [column for _, column in ordered]
+            rows = zip(*columns) if len(columns) > 0 else [()] * len(items)
+            for i, values in zip(static_indices, rows):
+                decoded[i] = self.__format(data[i], target_topic, dict(zip(names, values)))
+
+        return [item for item in decoded if item is not None]
+
+
+    def __get_static_layout(self, key: Hashable, target_topic: dict) -> Optional[Tuple[list, list]]:
+        """
+        Return the static layouts of the topics and data of an event, or None
+        if the event has any dynamic or composite parameters. Layouts are
+        cached per event signature and ABI version.
+
+        :param key: The key of the topic map entry.
+        :param target_topic: The topic map entry.
+        :return: The topic layouts and data layout, or None.
+        """
+
+        if key not in self.__static_layouts:
+            topic_layout = build_static_layout(target_topic['topics']['params'])
+            data_layout = build_static_layout(target_topic['data']['params'])
+            if topic_layout is None or data_layout is None: self.__static_layouts[key] = None
+            else: self.__static_layouts[key] = (topic_layout, data_layout)
+
+        return self.__static_layouts[key]
+
+
+    def __format(self, data: dict, target_topic: Optional[dict], event_data: dict) -> dict:
+        """
+        Format a decoded log with its item and context.
+
+        :param data: The raw log data.
+        :param target_topic: The topic map entry for the log, or None if the event is unknown.
+        :param event_data: The decoded event data.
+        :return: The decoded log.
+        """
+
+        # format compact decoded log
+        event_name = target_topic['name'] if target_topic is not None else None
+        if self.compact:
+            item = self.__items.get(event_name)
+            if item is None:
+                item = self.__items.setdefault(event_name, EventItem(self.contract_address, sys.intern(event_name) if event_name is not None else None))
+
+            return {
+                'item': item,
+                'context': EventContext(
+                    to_iso_timestamp(data['timestamp']),
+                    data['block_number'],
+                    data['log_index'],
+                    sys.intern(data['transaction_hash']),
+                    data['transaction_position'],
+                    data['__confirmed']
+                ),
+                'event_data': intern_values(event_data)
+            }
+
         # format decoded log
         return {
             'item': {
                 'contract_address': self.contract_address,
-                'event_name': target_topic['name']
+                'event_name': event_name
             },
             'context': {
                 'timestamp': to_iso_timestamp(data['timestamp']),
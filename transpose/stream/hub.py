@@ -0,0 +1,309 @@
+from collections import deque
+from typing import Callable, List, Optional, Set
+import threading
+
+from transpose.stream.base import Stream
+from transpose.utils.exceptions import StreamError
+
+
+POLICIES = ['block', 'drop_oldest', 'drop_newest']
+
+
+class Subscription:
+    """
+    The Subscription class is an iterator over the items a StreamHub broadcasts
+    to a single subscriber. Items that pass the subscriber's filter are held in
+    a bounded buffer until consumed. When the buffer is full, the subscriber's
+    policy decides whether the hub waits for it to catch up ("block"), or whether
+    the oldest ("drop_oldest") or newest ("drop_newest") items are dropped.
+    """
+
+    def __init__(self, hub: 'StreamHub',
+                 names: Set[str]=None,
+                 predicate: Callable[[dict], bool]=None,
+                 buffer_size: int=10000,
+                 policy: str='block') -> None:
+
+        """
+        Initialize the subscription.
+
+        :param hub: The hub the subscription belongs to.
+        :param names: The event or function names to receive, or None for all.
+        :param predicate: A function that returns whether to receive an item.
+        :param buffer_size: The maximum number of items to buffer.
+        :param policy: The policy when the buffer is full.
+        """
+
+        if names is not None and (not isinstance(names, (set, list, tuple)) or not all(isinstance(n, str) for n in names)):
+            raise StreamError('Invalid subscription names')
+        elif predicate is not None and not callable(predicate): raise StreamError('Predicate must be callable')
+        elif not isinstance(buffer_size, int) or buffer_size < 1: raise StreamError('Invalid buffer size')
+        elif policy not in POLICIES: raise StreamError('Invalid policy (must be "block", "drop_oldest", or "drop_newest")')
+
+        self.names = set(names) if names is not None else None
+        self.predicate = predicate
+        self.buffer_size = buffer_size
+        self.policy = policy
+        self.dropped = 0
+        self.__hub = hub
+        self.__cond = threading.Condition()
+        self.__buffer = deque()
+        self.__closed = False
+        self.__finished = False
+        self.__error = None
+
+
+    def __iter__(self) -> 'Subscription':
+        """
+        Return the subscription as an iterator.
+
+        :return: The subscription.
+        """
+
+        return self
+
+
+    def __next__(self) -> dict:
+        """
+        Return the next item, blocking until one is available. Raises
+        StopIteration once the hub has finished and the buffer is empty.
+
+        :return: The next item.
+        """
+
+        with self.__cond:
+            while len(self.__buffer) == 0:
+                if self.__finished or self.__closed:
+                    if self.__error is not None: raise self.__error
+                    raise StopIteration
+                self.__cond.wait()
+
+            item = self.__buffer.popleft()
+            self.__cond.notify_all()
+            return item
+
+
+    def next(self, limit: int=100,
+             timeout: float=None) -> List[dict]:
+
+        """
+        Return the buffered items, up to a limit, waiting up to a timeout for at
+        least one item to arrive. Returns an empty list if no items arrive in
+        time or the hub has finished.
+
+        :param limit: The maximum number of items to return.
+        :param timeout: The maximum time in seconds to wait, or None to wait indefinitely.
+        :return: The items.
+        """
+
+        with self.__cond:
+            self.__cond.wait_for(lambda: len(self.__buffer) > 0 or self.__finished or self.__closed, timeout=timeout)
+            if len(self.__buffer) == 0 and self.__error is not None: raise self.__error
+
+            items = [self.__buffer.popleft() for _ in range(min(limit, len(self.__buffer)))]
+            self.__cond.notify_all()
+            return items
+
+
+    def close(self) -> None:
+        """
+        Unsubscribe from the hub and discard any buffered items.
+        """
+
+        with self.__cond:
+            self.__closed = True
+            self.__buffer.clear()
+            self.__cond.notify_all()
+        self.__hub.unsubscribe(self)
+
+
+    def matches(self, item: dict) -> bool:
+        """
+        Return whether an item passes the subscription's filter.
+
+        :param item: The decoded item.
+        :return: Whether the subscriber receives the item.
+        """
+
+        if self.names is not None:
+            target = item['item']
+            if target.get('event_name', target.get('function_name')) not in self.names: return False
+        return self.predicate is None or self.predicate(item)
+
+
+    def put(self, items: List[dict], stop: threading.Event) -> None:
+        """
+        Add a page of items to the buffer, applying the subscription's policy when
+        it is full. Called by the hub.
+
+        :param items: The items that passed the filter.
+        :param stop: The hub's stop event, which ends any wait for space.
+        """
+
+        with self.__cond:
+            for item in items:
+                if self.__closed: return
+                elif len(self.__buffer) >= self.buffer_size:
+
+                    # wait for subscriber to catch up
+                    if self.policy == 'block':
+                        self.__cond.notify_all()
+                        while len(self.__buffer) >= self.buffer_size and not self.__closed and not stop.is_set():
+                            self.__cond.wait(timeout=0.1)
+                        if self.__closed or stop.is_set(): return
+
+                    # drop oldest or newest item
+                    elif self.policy == 'drop_oldest':
+                        self.__buffer.popleft()
+                        self.dropped += 1
+                    else:
+                        self.dropped += 1
+                        continue
+
+                self.__buffer.append(item)
+            self.__cond.notify_all()
+
+
+    def finish(self, error: Optional[BaseException]=None) -> None:
+        """
+        Mark the subscription as finished, so that iteration stops once the
+        buffer is drained. Called by the hub.
+
+        :param error: The error that stopped the hub, if any, to raise to the subscriber.
+        """
+
+        with self.__cond:
+            self.__finished = True
+            self.__error = error
+            self.__cond.notify_all()
+
+
+class StreamHub:
+    """
+    The StreamHub class runs a single stream and broadcasts its decoded items to
+    any number of subscribers, so that several consumers of the same contract
+    activity share one fetch and decode. Each subscriber receives the items that
+    pass its own filter through its own bounded buffer. Subscribers added after
+    the hub has started receive items from that point on.
+    """
+
+    def __init__(self, stream: Stream,
+                 page_size: int=1000) -> None:
+
+        """
+        Initialize the hub.
+
+        :param stream: The stream to broadcast.
+        :param page_size: The maximum number of items to fetch per page.
+        """
+
+        if not isinstance(stream, Stream): raise StreamError('Invalid stream')
+        elif not isinstance(page_size, int) or page_size < 1: raise StreamError('Invalid page size')
+
+        self.stream = stream
+        self.page_size = page_size
+        self.__lock = threading.Lock()
+        self.__subscriptions: List[Subscription] = []
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__finished = False
+        self.__error = None
+
+
+    def subscribe(self, names: Set[str]=None,
+                  predicate: Callable[[dict], bool]=None,
+                  buffer_size: int=10000,
+                  policy: str='block') -> Subscription:
+
+        """
+        Add a subscriber to the hub.
+
+        :param names: The event or function names to receive, or None for all.
+        :param predicate: A function that returns whether to receive an item.
+        :param buffer_size: The maximum number of items to buffer.
+        :param policy: The policy when the buffer is full (one of "block", "drop_oldest", or "drop_newest").
+        :return: The subscription.
+        """
+
+        subscription = Subscription(self, names=names, predicate=predicate, buffer_size=buffer_size, policy=policy)
+        with self.__lock:
+            if self.__finished: subscription.finish(self.__error)
+            else: self.__subscriptions.append(subscription)
+        return subscription
+
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Remove a subscriber from the hub.
+
+        :param subscription: The subscription.
+        """
+
+        with self.__lock:
+            if subscription in self.__subscriptions: self.__subscriptions.remove(subscription)
+
+
+    def start(self) -> 'StreamHub':
+        """
+        Start broadcasting the stream on a background thread.
+
+        :return: The hub.
+        """
+
+        with self.__lock:
+            if self.__thread is not None: raise StreamError('Hub already started')
+            self.__thread = threading.Thread(target=self.__run, daemon=True)
+            self.__thread.start()
+        return self
+
+
+    def stop(self) -> None:
+        """
+        Stop broadcasting and wait for the background thread to exit. Subscribers
+        can still drain their buffered items.
+        """
+
+        self.__stop.set()
+        if self.__thread is not None: self.__thread.join()
+
+
+    def __run(self) -> None:
+        """
+        Fetch and decode pages from the stream and broadcast them until the
+        stream is exhausted or the hub is stopped.
+        """
+
+        error = None
+        try:
+            while not self.__stop.is_set():
+                data, _ = self.stream.fetch_next(self.page_size)
+
+                # wait for new data when live, otherwise finish
+                if len(data) == 0:
+                    if not self.stream.live_stream: break
+                    self.__stop.wait(self.stream.live_refresh_interval)
+                    continue
+
+                # pages may decode to nothing, e.g. if no item is in the ABI
+                items = self.stream.decode_batch(data)
+                if len(items) == 0: continue
+
+                # a failing filter only ends its own subscription
+                with self.__lock: subscriptions = list(self.__subscriptions)
+                for subscription in subscriptions:
+                    try: matched = [item for item in items if subscription.matches(item)]
+                    except Exception as e:
+                        self.unsubscribe(subscription)
+                        subscription.finish(e)
+                        continue
+                    subscription.put(matched, self.__stop)
+
+        except BaseException as e:
+            error = e
+
+        # finish subscriptions
+        with self.__lock:
+            self.__finished = True
+            self.__error = error
+            subscriptions = list(self.__subscriptions)
+        for subscription in subscriptions: subscription.finish(error)
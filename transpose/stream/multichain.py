@@ -0,0 +1,211 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Dict, Hashable, List, Tuple
+
+from transpose.stream.base import Stream
+from transpose.utils.exceptions import StreamError
+from transpose.utils.time import to_iso_timestamp
+
+
+class MultiChainStream(Stream):
+    """
+    The MultiChainStream class merges streams from several chains (e.g. the same
+    protocol deployed on ethereum, polygon, and arbitrum) into a single stream
+    ordered by timestamp. Each chain's stream is fetched a page at a time, with
+    pages fetched concurrently, into a bounded per-chain reorder buffer, and an
+    item is only returned once every other chain has buffered an item at or past
+    its timestamp (ties are broken by the order the chains were given in). The
+    stream state holds the cursor of each chain after its last returned item, so
+    it can be checkpointed and restored like that of any other stream. Decoded
+    items have an extra "chain" field with the chain they came from.
+
+    When live, chains that have caught up with the latest block do not hold back
+    the others, so items from different chains can arrive slightly out of order
+    near the tip.
+    """
+
+    def __init__(self, streams: Dict[str, Stream],
+                 page_size: int=1000) -> None:
+
+        """
+        Initialize the stream.
+
+        :param streams: The streams to merge, by chain name. The streams must have the same order and either all or none must be live.
+        :param page_size: The maximum number of items to fetch per chain per request, which also bounds each chain's reorder buffer.
+        """
+
+        if not isinstance(streams, dict) or len(streams) == 0 or not all(isinstance(s, Stream) for s in streams.values()):
+            raise StreamError('Invalid streams')
+        elif len({s.order for s in streams.values()}) > 1: raise StreamError('Streams must have the same order')
+        elif len({s.live_stream for s in streams.values()}) > 1: raise StreamError('Streams must all be live or not live')
+        elif not isinstance(page_size, int) or page_size < 1: raise StreamError('Invalid page size')
+
+        first = next(iter(streams.values()))
+        super().__init__(
+            api_key=first.api_key,
+            order=first.order,
+            live_stream=first.live_stream,
+            live_refresh_interval=min(s.live_refresh_interval for s in streams.values())
+        )
+
+        self.streams = dict(streams)
+        self.page_size = page_size
+        self.__chains = list(self.streams)
+        self.__buffers: Dict[str, deque] = {}
+        self.__exhausted = set()
+        self.__cursors = None
+
+
+    def reset(self, start_block: int) -> dict:
+        """
+        Reset the stream state to the current state of each chain's stream,
+        discarding any buffered items.
+
+        :param start_block: Unused, as each chain's stream has its own start block.
+        :return: The default stream state.
+        """
+
+        self.__buffers = {chain: deque() for chain in self.__chains}
+        self.__exhausted = set()
+        self.__cursors = None
+        return {'streams': {chain: dict(stream.state) for chain, stream in self.streams.items()}}
+
+
+    def fetch(self, state: dict,
+              stop_block: int=None,
+              order: str='asc',
+              limit: int=None) -> Tuple[List[dict], dict]:
+
+        """
+        Fetch the next set of raw items across chains in timestamp order and
+        update the stream state. Chains with an empty reorder buffer are fetched
+        concurrently whenever the merge needs their next item.
+
+        :param state: The current stream state.
+        :param stop_block: Unused, as each chain's stream has its own end block.
+        :param order: The order to fetch the items in.
+        :param limit: The maximum number of items to fetch.
+        """
+
+        # restore chain cursors if the state is not the one last returned
+        if state['streams'] is not self.__cursors:
+            for chain in self.__chains: self.streams[chain].state = dict(state['streams'][chain])
+            self.__buffers = {chain: deque() for chain in self.__chains}
+            self.__exhausted = set()
+
+        cursors = dict(state['streams'])
+        idle = set()
+        data = []
+        while limit is None or len(data) < limit:
+
+            # fetch chains whose next item is unknown
+            pending = [c for c in self.__chains if len(self.__buffers[c]) == 0 and c not in self.__exhausted and c not in idle]
+            if len(pending) > 0:
+                if limit is None and len(data) > 0: break
+                for chain, (page, page_state) in zip(pending, self.__fetch_chains(pending)):
+                    if len(page) == 0:
+                        cursors[chain] = page_state
+                        if self.streams[chain].live_stream: idle.add(chain)
+                        else: self.__exhausted.add(chain)
+                    else: self.__buffer(chain, page, page_state)
+
+            # take the earliest buffered item across chains
+            heads = [(self.__buffers[c][0][0], i, c) for i, c in enumerate(self.__chains) if len(self.__buffers[c]) > 0]
+            if len(heads) == 0: break
+            _, _, chain = min(heads)
+            _, item, item_state = self.__buffers[chain].popleft()
+            cursors[chain] = item_state
+            data.append(item)
+
+        self.__cursors = cursors
+        return data, {'streams': cursors}
+
+
+    def __fetch_chains(self, chains: List[str]) -> List[Tuple[List[dict], dict]]:
+        """
+        Fetch the next page of several chains' streams concurrently.
+
+        :param chains: The chain names.
+        :return: The raw page and resulting state of each chain, in order.
+        """
+
+        fetch = lambda chain: self.streams[chain].fetch_next(self.page_size)
+        if len(chains) == 1: return [fetch(chains[0])]
+        with ThreadPoolExecutor(max_workers=len(chains)) as executor:
+            return list(executor.map(fetch, chains))
+
+
+    def __buffer(self, chain: str, page: List[dict], page_state: dict) -> None:
+        """
+        Add a page of a chain's raw items to its reorder buffer, with the sort
+        key of each item and the chain's state after it.
+
+        :param chain: The chain name.
+        :param page: The raw items.
+        :param page_state: The chain's state after the page.
+        """
+
+        stream = self.streams[chain]
+        for i, item in enumerate(page):
+            timestamp = to_iso_timestamp(item['timestamp']).timestamp()
+            item['__chain'] = chain
+            item_state = page_state if i == len(page) - 1 else stream.state_after(item)
+            self.__buffers[chain].append((timestamp if self.order == 'asc' else -timestamp, item, item_state))
+
+
+    def deduplicate(self, window_blocks: int=128) -> 'Stream':
+        """
+        Drop items that have already been returned. Each chain's stream keeps
+        its own window of recent blocks, since block numbers of different
+        chains cannot be compared.
+
+        :param window_blocks: The number of recent blocks to keep item keys for, per chain.
+        :return: The stream.
+        """
+
+        for stream in self.streams.values(): stream.deduplicate(window_blocks)
+        return self
+
+
+    def item_key(self, data: dict) -> Hashable:
+        """
+        Return the unique key of a raw item, i.e. its chain and its key on that
+        chain's stream.
+
+        :param data: The raw item.
+        :return: The item key.
+        """
+
+        return data['__chain'], self.streams[data['__chain']].item_key(data)
+
+
+    def decode(self, data: dict) -> dict:
+        """
+        Decode a raw item with its chain's stream and add the chain name.
+
+        :param data: The raw item.
+        :return: The decoded item.
+        """
+
+        decoded = self.streams[data['__chain']].decode(data)
+        return {'chain': data['__chain'], **decoded} if decoded is not None else None
+
+
+    def decode_batch(self, data: List[dict]) -> List[dict]:
+        """
+        Decode a batch of raw items with their chains' streams, decoding each run
+        of consecutive items from the same chain together.
+
+        :param data: The raw items.
+        :return: The decoded items.
+        """
+
+        decoded = []
+        start = 0
+        for i in range(1, len(data) + 1):
+            if i < len(data) and data[i]['__chain'] == data[start]['__chain']: continue
+            chain = data[start]['__chain']
+            decoded += [{'chain': chain, **item} for item in self.streams[chain].decode_batch(data[start:i])]
+            start = i
+
+        return decoded
@@ -0,0 +1,242 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import threading
+import queue
+
+from transpose.stream.base import Stream
+from transpose.utils.exceptions import StreamError
+
+
+class StreamPipeline:
+    """
+    The StreamPipeline class runs a stream through separate fetch, decode, and sink
+    stages that overlap with each other. Pages are fetched by a single thread, since
+    each page's cursor depends on the previous page, and are decoded and written to
+    the sink by pools of worker threads. The stages are connected by bounded queues,
+    and the number of pages in flight is capped, so that fetching pauses whenever
+    the sink falls behind and memory stays bounded.
+
+    Pages are handed to the sink in stream order, so a single sink worker receives
+    them in order. A page's cursor is committed only after the sink has accepted
+    that page and every page before it, so the committed state is always a safe
+    point to resume the stream from.
+    """
+
+    def __init__(self, stream: Stream, sink: Callable[[List[dict]], Any],
+                 page_size: int=1000,
+                 decode_workers: int=1,
+                 sink_workers: int=1,
+                 max_pending_pages: int=8,
+                 on_commit: Callable[[dict], None]=None) -> None:
+
+        """
+        Initialize the pipeline.
+
+        :param stream: The stream to read from.
+        :param sink: A function that writes a page of decoded items, returning once they are persisted.
+        :param page_size: The maximum number of items to fetch per page.
+        :param decode_workers: The number of threads decoding pages.
+        :param sink_workers: The number of threads writing pages to the sink.
+        :param max_pending_pages: The maximum number of pages fetched but not yet committed.
+        :param on_commit: A function called in order with the stream state after each committed page.
+        """
+
+        if not isinstance(stream, Stream): raise StreamError('Invalid stream')
+        elif not callable(sink): raise StreamError('Sink must be callable')
+        elif not isinstance(page_size, int) or page_size < 1: raise StreamError('Invalid page size')
+        elif not isinstance(decode_workers, int) or decode_workers < 1: raise StreamError('Invalid number of decode workers')
+        elif not isinstance(sink_workers, int) or sink_workers < 1: raise StreamError('Invalid number of sink workers')
+        elif not isinstance(max_pending_pages, int) or max_pending_pages < 1: raise StreamError('Invalid max pending pages')
+
+        self.stream = stream
+        self.sink = sink
+        self.page_size = page_size
+        self.decode_workers = decode_workers
+        self.sink_workers = sink_workers
+        self.max_pending_pages = max_pending_pages
+        self.on_commit = on_commit
+        self.committed_state = None
+        self.committed_items = 0
+
+        self.__lock = threading.Condition()
+        self.__stop = threading.Event()
+        self.__slots = threading.Semaphore(max_pending_pages)
+        self.__decode_queue: 'queue.Queue[Optional[Tuple[int, List[dict], dict]]]' = queue.Queue(maxsize=max_pending_pages)
+        self.__decoded: Dict[int, Tuple[List[dict], dict]] = {}
+        self.__acked: Dict[int, Tuple[int, dict]] = {}
+        self.__next_sink = 0
+        self.__next_commit = 0
+        self.__num_pages = None
+        self.__error = None
+
+
+    def run(self) -> dict:
+        """
+        Run the pipeline until the stream is exhausted or stop() is called, and
+        return the committed stream state. If any stage raises an error, the
+        pipeline stops, the stream is rewound to the committed state, and the
+        error is re-raised.
+
+        :return: The committed stream state.
+        """
+
+        self.committed_state = self.stream.state
+        threads = [threading.Thread(target=self.__fetch_stage, daemon=True)]
+        threads += [threading.Thread(target=self.__decode_stage, daemon=True) for _ in range(self.decode_workers)]
+        threads += [threading.Thread(target=self.__sink_stage, daemon=True) for _ in range(self.sink_workers)]
+        for thread in threads: thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive(): thread.join(timeout=0.1)
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads: thread.join()
+
+        # rewind stream to last committed page on error
+        if self.__error is not None:
+            self.stream.state = self.committed_state
+            raise self.__error
+
+        return self.committed_state
+
+
+    def stop(self) -> None:
+        """
+        Stop fetching new pages. Pages already fetched are still decoded, written,
+        and committed before run() returns.
+        """
+
+        self.__stop.set()
+
+
+    def __fetch_stage(self) -> None:
+        """
+        Fetch pages from the stream in order and queue them for decoding.
+        """
+
+        seq = 0
+        try:
+            while not self.__stop.is_set():
+
+                # wait for a free slot, pausing while the sink lags
+                if not self.__slots.acquire(timeout=0.1): continue
+                data, state = self.stream.fetch_next(self.page_size)
+
+                # wait for new data when live, otherwise finish
+                if len(data) == 0:
+                    self.__slots.release()
+                    if not self.stream.live_stream: break
+                    self.__stop.wait(self.stream.live_refresh_interval)
+                    continue
+
+                if not self.__put(self.__decode_queue, (seq, data, state)):
+                    self.__slots.release()
+                    break
+                seq += 1
+
+        except BaseException as e:
+            self.__fail(e)
+
+        # signal end of stream
+        with self.__lock:
+            self.__num_pages = seq
+            self.__lock.notify_all()
+        for _ in range(self.decode_workers): self.__put(self.__decode_queue, None, force=True)
+
+
+    def __decode_stage(self) -> None:
+        """
+        Decode pages and hand them to the sink stage.
+        """
+
+        while True:
+            page = self.__decode_queue.get()
+            if page is None: return
+            seq, data, state = page
+
+            try: decoded = self.stream.decode_batch(data) if self.__error is None else []
+            except BaseException as e:
+                self.__fail(e)
+                decoded = []
+
+            with self.__lock:
+                self.__decoded[seq] = (decoded, state)
+                self.__lock.notify_all()
+
+
+    def __sink_stage(self) -> None:
+        """
+        Take decoded pages in stream order, write them to the sink, and commit
+        their cursors once every earlier page has been written.
+        """
+
+        while True:
+            with self.__lock:
+                while self.__next_sink not in self.__decoded and self.__next_sink != self.__num_pages:
+                    self.__lock.wait()
+                if self.__next_sink == self.__num_pages: return
+                seq = self.__next_sink
+                decoded, state = self.__decoded.pop(seq)
+                self.__next_sink += 1
+
+            # write page, skipping writes after a failure
+            if self.__error is None and len(decoded) > 0:
+                try: self.sink(decoded)
+                except BaseException as e: self.__fail(e)
+
+            with self.__lock:
+                self.__acked[seq] = (len(decoded), state)
+                self.__commit()
+
+
+    def __commit(self) -> None:
+        """
+        Commit the cursors of the contiguous run of acknowledged pages, in order.
+        Must be called while holding the lock.
+        """
+
+        while self.__next_commit in self.__acked:
+            num_items, state = self.__acked.pop(self.__next_commit)
+            self.__next_commit += 1
+            self.__slots.release()
+            if self.__error is not None: continue
+
+            self.committed_state = state
+            self.committed_items += num_items
+            if self.on_commit is not None:
+                try: self.on_commit(state)
+                except BaseException as e: self.__fail(e)
+
+
+    def __put(self, q: queue.Queue, item: Any,
+              force: bool=False) -> bool:
+
+        """
+        Put an item on a bounded queue, giving up once the pipeline has failed
+        unless forced.
+
+        :param q: The queue.
+        :param item: The item.
+        :param force: Whether to keep waiting after a failure.
+        :return: Whether the item was put on the queue.
+        """
+
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if self.__error is not None and not force: return False
+
+
+    def __fail(self, error: BaseException) -> None:
+        """
+        Record the first error raised by any stage and stop the pipeline.
+
+        :param error: The error.
+        """
+
+        with self.__lock:
+            if self.__error is None: self.__error = error
+            self.__lock.notify_all()
+        self.__stop.set()
@@ -0,0 +1,270 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from bisect import bisect_right
+import threading
+import hashlib
+import json
+import os
+
+from transpose.utils.decode import build_function_map, build_topic_map
+from transpose.utils.cache import get_cache_dir, read_json, write_json
+
+
+_lock = threading.Lock()
+_abi_files: Dict[Tuple[str, int, int], list] = {}
+_decoder_maps: Dict[str, dict] = {}
+_abi_keys: 'OrderedDict[int, Tuple[list, str]]' = OrderedDict()
+MAX_ABI_KEYS = 1024
+
+
+def load_abi(abi_path: str) -> list:
+    """
+    Load and parse an ABI from a JSON file. Parsed ABIs are cached per file
+    path and modification time, so the same file is only read once per process
+    unless it changes.
+
+    :param abi_path: The path to the ABI JSON file.
+    :return: The ABI.
+    """
+
+    stat = os.stat(abi_path)
+    key = (os.path.realpath(abi_path), stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        if key in _abi_files: return _abi_files[key]
+
+    with open(abi_path, 'r') as f: abi = json.load(f)
+    with _lock: _abi_files[key] = abi
+    return abi
+
+
+def abi_hash(abi: List[dict]) -> str:
+    """
+    Returns a content hash of an ABI that is independent of key order.
+
+    :param abi: The ABI.
+    :return: The hex digest of the ABI.
+    """
+
+    return hashlib.sha256(json.dumps(abi, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def get_topic_map(abi: List[dict]) -> Dict[str, dict]:
+    """
+    Returns the topic map for an ABI from the process-wide registry, building
+    it on first use. The returned map is shared and must not be modified.
+
+    :param abi: The ABI.
+    :return: The topic map.
+    """
+
+    return get_decoder_maps(abi)['topic_map']
+
+
+def get_function_map(abi: List[dict]) -> Dict[str, dict]:
+    """
+    Returns the function map for an ABI from the process-wide registry, building
+    it on first use. The returned map is shared and must not be modified.
+
+    :param abi: The ABI.
+    :return: The function map.
+    """
+
+    return get_decoder_maps(abi)['function_map']
+
+
+def get_decoder_maps(abi: List[dict]) -> dict:
+    """
+    Returns the topic and function maps for an ABI, keyed by the ABI's content
+    hash in a process-wide registry. The hash is remembered per ABI object, so
+    streams sharing an ABI do not rehash it (ABIs must not be modified after
+    use). If a cache directory is set, the maps are also persisted to disk, so
+    that later processes can skip hashing the signatures of every ABI item.
+
+    :param abi: The ABI.
+    :return: A dict with the topic_map and function_map for the ABI.
+    """
+
+    # look up the hash of a previously seen ABI object
+    with _lock:
+        seen = _abi_keys.get(id(abi))
+        if seen is not None and seen[0] is abi:
+            _abi_keys.move_to_end(id(abi))
+            key = seen[1]
+        else: key = None
+
+    # hash new ABI objects
+    if key is None:
+        key = abi_hash(abi)
+        with _lock:
+            _abi_keys[id(abi)] = (abi, key)
+            if len(_abi_keys) > MAX_ABI_KEYS: _abi_keys.popitem(last=False)
+
+    with _lock:
+        if key in _decoder_maps: return _decoder_maps[key]
+
+    # load from disk cache
+    cache_dir = get_cache_dir('abi')
+    cache_path = os.path.join(cache_dir, f'{key}.json') if cache_dir is not None else None
+    maps = read_json(cache_path) if cache_path is not None else None
+
+    # build and persist maps
+    if not isinstance(maps, dict) or 'topic_map' not in maps or 'function_map' not in maps:
+        maps = {'topic_map': build_topic_map(abi), 'function_map': build_function_map(abi)}
+        if cache_path is not None:
+            try: write_json(cache_path, maps)
+            except OSError: pass
+
+    with _lock: return _decoder_maps.setdefault(key, maps)
+
+
+def find_by_name(maps: List[Dict[str, dict]], name: str) -> List[str]:
+    """
+    Returns the keys of the entries with a name across several topic or
+    function maps (e.g. of the versions of an ABI), in order of first
+    appearance. Will raise a ValueError if no map has the name, or if a map
+    has several entries with it.
+
+    :param maps: The topic or function maps.
+    :param name: The event or function name.
+    :return: The topics or selectors.
+    """
+
+    keys = []
+    for m in maps:
+        matching = [k for k, v in m.items() if v['name'] == name]
+        if len(matching) > 1: raise ValueError('Ambiguous name "{}"'.format(name))
+        keys += [k for k in matching if k not in keys]
+
+    if len(keys) == 0: raise ValueError('Unknown name "{}"'.format(name))
+    return keys
+
+
+class VersionedAbi:
+    """
+    The VersionedAbi class holds several versions of a contract's ABI, each
+    valid for a range of blocks (e.g. the implementations of a proxy contract
+    between upgrades), so that each log or call can be decoded with the ABI
+    in effect at its block. The topic and function maps of each version come
+    from the process-wide registry. A topic or selector that is missing from
+    the version in effect falls back to the latest version that has it, and
+    blocks outside every version's range fall back to all versions likewise.
+    """
+
+    def __init__(self, versions: List[dict]) -> None:
+        """
+        Initialize the versions.
+
+        :param versions: The versions, each a dict with the "abi", and the "start_block" (inclusive, defaults to 0) and "end_block" (exclusive, defaults to None) it is valid for.
+        """
+
+        if not isinstance(versions, list) or len(versions) == 0: raise ValueError('ABI versions must be a non-empty list')
+
+        parsed = []
+        for version in versions:
+            start_block, end_block = version.get('start_block', 0), version.get('end_block')
+            if not isinstance(version.get('abi'), list): raise ValueError('Invalid ABI version')
+            elif not isinstance(start_block, int) or start_block < 0: raise ValueError('Invalid ABI version start block')
+            elif end_block is not None and (not isinstance(end_block, int) or end_block <= start_block): raise ValueError('Invalid ABI version end block')
+            parsed.append((start_block, end_block, version['abi']))
+
+        # check that versions do not overlap
+        parsed.sort(key=lambda v: v[0])
+        for (_, end_block, _), (start_block, _, _) in zip(parsed, parsed[1:]):
+            if end_block is None or end_block > start_block: raise ValueError('ABI versions must not overlap')
+
+        self.versions = parsed
+        self.__starts = [v[0] for v in parsed]
+        self.__topic_maps = [get_topic_map(v[2]) for v in parsed]
+        self.__function_maps = [get_function_map(v[2]) for v in parsed]
+
+        # merge ABIs, with later versions taking precedence
+        merged, seen = [], set()
+        for _, _, abi in reversed(parsed):
+            for item in abi:
+                key = json.dumps(item, sort_keys=True)
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(item)
+        self.abi = merged
+        self.topic_map = {k: v for m in self.__topic_maps for k, v in m.items()}
+        self.function_map = {k: v for m in self.__function_maps for k, v in m.items()}
+
+
+    def get_version(self, block_number: int) -> Optional[int]:
+        """
+        Return the index of the version in effect at a block.
+
+        :param block_number: The block number.
+        :return: The version index, or None if no version is in effect.
+        """
+
+        i = bisect_right(self.__starts, block_number) - 1
+        if i < 0: return None
+        end_block = self.versions[i][1]
+        return i if end_block is None or block_number < end_block else None
+
+
+    def find_topics(self, event_name: str) -> List[str]:
+        """
+        Return the signatures of an event in every version, of which there are
+        several if the event changed between versions.
+
+        :param event_name: The event name.
+        :return: The event signatures.
+        """
+
+        return find_by_name(self.__topic_maps, event_name)
+
+
+    def find_functions(self, function_name: str) -> List[str]:
+        """
+        Return the selectors of a function in every version, of which there are
+        several if the function changed between versions.
+
+        :param function_name: The function name.
+        :return: The function selectors.
+        """
+
+        return find_by_name(self.__function_maps, function_name)
+
+
+    def get_topic(self, topic_0: str, block_number: int) -> Tuple[Optional[int], Optional[dict]]:
+        """
+        Return the topic map entry of an event at a block.
+
+        :param topic_0: The event signature.
+        :param block_number: The block number.
+        :return: The index of the version the entry is from and the entry, or None for both if unknown.
+        """
+
+        return self.__get(self.__topic_maps, topic_0, block_number)
+
+
+    def get_function(self, function_selector: str, block_number: int) -> Tuple[Optional[int], Optional[dict]]:
+        """
+        Return the function map entry of a function at a block.
+
+        :param function_selector: The function selector.
+        :param block_number: The block number.
+        :return: The index of the version the entry is from and the entry, or None for both if unknown.
+        """
+
+        return self.__get(self.__function_maps, function_selector, block_number)
+
+
+    def __get(self, maps: List[Dict[str, dict]], key: str, block_number: int) -> Tuple[Optional[int], Optional[dict]]:
+        """
+        Return a map entry from the version in effect at a block, falling back
+        to the latest version that has it.
+
+        :param maps: The maps of each version.
+        :param key: The topic or selector.
+        :param block_number: The block number.
+        :return: The version index and the entry, or None for both.
+        """
+
+        version = self.get_version(block_number)
+        if version is not None and key in maps[version]: return version, maps[version][key]
+        for i in range(len(maps) - 1, -1, -1):
+            if key in maps[i]: return i, maps[i][key]
+        return None, None
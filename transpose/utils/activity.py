@@ -0,0 +1,209 @@
+from typing import Callable, Dict, List, Optional, Tuple
+from bisect import bisect_right
+import threading
+import time
+import os
+
+from transpose.sql.general import latest_block_query
+from transpose.utils.cache import get_cache_dir, read_json, write_json
+
+
+BUCKET_SIZE = 10000
+REORG_MARGIN = 128
+TIP_REFRESH_INTERVAL = 60.0
+
+_indexes: Dict[Tuple[str, str, str], 'ActivityIndex'] = {}
+_indexes_lock = threading.Lock()
+_tips: Dict[str, Tuple[float, int]] = {}
+_tips_lock = threading.Lock()
+
+
+class ActivityIndex:
+    """
+    The ActivityIndex class is a sparse index of a contract's activity on a chain,
+    kept per filter (e.g. per event signature or function selector). For each
+    filter, it records the block ranges that have been fully scanned and the
+    fixed-size block buckets in which activity was seen. Streams maintain the
+    index as a side effect of fetching, and consult it to jump over scanned
+    ranges with no activity instead of querying them again. Ranges are only
+    recorded as scanned up to a margin behind the latest block, so that reorgs
+    near the tip are never mistaken for empty ranges. The index is persisted to
+    the local cache directory if one is set.
+    """
+
+    def __init__(self, chain: str, contract_address: str, kind: str) -> None:
+        """
+        Initialize the index, loading it from the cache directory.
+
+        :param chain: The chain name.
+        :param contract_address: The contract address.
+        :param kind: The kind of activity (e.g. "events" or "calls").
+        """
+
+        self.chain = chain
+        self.contract_address = contract_address
+        self.kind = kind
+        self.__lock = threading.Lock()
+        self.__covered: Dict[str, List[List[int]]] = {}
+        self.__active: Dict[str, set] = {}
+
+        cache_dir = get_cache_dir('activity', chain)
+        self.__cache_path = os.path.join(cache_dir, f'{contract_address.lower()}-{kind}.json') if cache_dir is not None else None
+        data = read_json(self.__cache_path) if self.__cache_path is not None else None
+        if isinstance(data, dict) and data.get('bucket_size') == BUCKET_SIZE and isinstance(data.get('filters'), dict):
+            for key, entry in data['filters'].items():
+                self.__covered[key] = [list(r) for r in entry['covered']]
+                self.__active[key] = set(entry['active'])
+
+
+    def skip(self, keys: List[str], block_number: int,
+             stop_block: int=None,
+             order: str='asc') -> Optional[int]:
+
+        """
+        Return the first block at or after a block (or at or before it, when
+        descending) that is not known to be empty under any of the given
+        filters, or None if every block up to the stop block is known to be
+        empty. Any filter whose activity includes the stream's activity can be
+        given, e.g. the stream's own filter and the unfiltered activity.
+
+        :param keys: The filter keys to consult.
+        :param block_number: The block to start from, inclusive.
+        :param stop_block: The block to stop at, exclusive.
+        :param order: The direction to skip in.
+        :return: The block number, or None.
+        """
+
+        with self.__lock:
+            while True:
+                if order == 'asc' and stop_block is not None and block_number >= stop_block: return None
+                elif order == 'desc' and (block_number < 0 or (stop_block is not None and block_number <= stop_block)): return None
+
+                # jump to the edge of the empty bucket or scanned range
+                target = None
+                for key in keys:
+                    scanned = self.__find_range(key, block_number)
+                    bucket = block_number - block_number % BUCKET_SIZE
+                    if scanned is None or bucket in self.__active.get(key, ()): continue
+                    if order == 'asc': target = min(scanned[1], bucket + BUCKET_SIZE)
+                    else: target = max(scanned[0], bucket) - 1
+                    break
+
+                if target is None: return block_number
+                block_number = target
+
+
+    def record(self, key: str, start_block: int, end_block: Optional[int], block_numbers: List[int],
+               request: Callable[[str], List[dict]]) -> None:
+
+        """
+        Record a scanned block range and the blocks with activity in it. The
+        range is clipped to the reorg margin behind the latest block, which is
+        refreshed with a query when needed.
+
+        :param key: The filter key.
+        :param start_block: The start of the scanned range, inclusive.
+        :param end_block: The end of the scanned range, exclusive, or None if scanned up to the latest block.
+        :param block_numbers: The block numbers of the activity seen.
+        :param request: A function that sends a SQL query and returns its results.
+        """
+
+        # clip range to the reorg margin, refreshing the latest block if needed
+        safe_block = get_safe_block(self.chain)
+        if end_block is None or end_block > safe_block: safe_block = get_safe_block(self.chain, request)
+        end_block = safe_block if end_block is None else min(end_block, safe_block)
+
+        changed = False
+        with self.__lock:
+            active = self.__active.setdefault(key, set())
+            for block_number in block_numbers:
+                bucket = block_number - block_number % BUCKET_SIZE
+                if bucket not in active:
+                    active.add(bucket)
+                    changed = True
+
+            if start_block < end_block: changed = self.__add_range(key, start_block, end_block) or changed
+            data = {
+                'bucket_size': BUCKET_SIZE,
+                'filters': {k: {'covered': self.__covered.get(k, []), 'active': sorted(self.__active.get(k, ()))} for k in set(self.__covered) | set(self.__active)}
+            } if changed else None
+
+        if data is not None and self.__cache_path is not None:
+            try: write_json(self.__cache_path, data)
+            except OSError: pass
+
+
+    def __find_range(self, key: str, block_number: int) -> Optional[List[int]]:
+        """
+        Return the scanned range containing a block, if any.
+
+        :param key: The filter key.
+        :param block_number: The block number.
+        :return: The [start, end) range, or None.
+        """
+
+        ranges = self.__covered.get(key, [])
+        i = bisect_right(ranges, [block_number, float('inf')]) - 1
+        if i >= 0 and ranges[i][0] <= block_number < ranges[i][1]: return ranges[i]
+        return None
+
+
+    def __add_range(self, key: str, start_block: int, end_block: int) -> bool:
+        """
+        Merge a scanned range into the sorted, disjoint ranges of a filter.
+
+        :param key: The filter key.
+        :param start_block: The start of the range, inclusive.
+        :param end_block: The end of the range, exclusive.
+        :return: Whether the scanned ranges changed.
+        """
+
+        ranges = self.__covered.setdefault(key, [])
+        merged, kept = [start_block, end_block], []
+        for r in ranges:
+            if r[1] < merged[0] or r[0] > merged[1]: kept.append(r)
+            else: merged = [min(r[0], merged[0]), max(r[1], merged[1])]
+
+        if merged in ranges: return False
+        kept.append(merged)
+        kept.sort()
+        self.__covered[key] = kept
+        return True
+
+
+def get_activity_index(chain: str, contract_address: str, kind: str) -> ActivityIndex:
+    """
+    Returns the process-wide activity index for a contract, creating it on
+    first use. The index is shared by all streams of the same kind of activity
+    for the contract.
+
+    :param chain: The chain name.
+    :param contract_address: The contract address.
+    :param kind: The kind of activity (e.g. "events" or "calls").
+    :return: The activity index.
+    """
+
+    key = (chain, contract_address.lower(), kind)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None: index = _indexes[key] = ActivityIndex(chain, contract_address, kind)
+        return index
+
+
+def get_safe_block(chain: str, request: Callable[[str], List[dict]]=None) -> int:
+    """
+    Returns the first block of a chain past the reorg margin behind its latest
+    known block, i.e. the exclusive end of the blocks that are safe to record as
+    scanned. If a request function is given, the latest block is refreshed with
+    a query when it is older than the refresh interval.
+
+    :param chain: The chain name.
+    :param request: A function that sends a SQL query and returns its results.
+    :return: The block number.
+    """
+
+    with _tips_lock: tip = _tips.get(chain)
+    if request is not None and (tip is None or time.monotonic() - tip[0] > TIP_REFRESH_INTERVAL):
+        tip = (time.monotonic(), request(latest_block_query(chain))[0]['block_number'])
+        with _tips_lock: _tips[chain] = tip
+    return max(tip[1] + 1 - REORG_MARGIN, 0) if tip is not None else 0
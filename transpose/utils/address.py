@@ -1,15 +1,23 @@
 from typing import Optional
-from web3 import Web3
+import re
+
+
+ADDRESS_PATTERN = re.compile(r'^(0x)?[0-9a-fA-F]{40}$')
 
 
 def to_checksum_address(address: str) -> Optional[str]:
     """
-    Convert an address to a checksum address. Will return None
+    Convert an address to a checksum address (EIP-55). Will return None
     if the address is invalid.
 
     :param address: The address to convert.
     :return: The checksum address.
     """
 
-    try: return Web3.to_checksum_address(address)
-    except: return None
\ No newline at end of file
+    if not isinstance(address, str) or not ADDRESS_PATTERN.match(address): return None
+    from eth_hash.auto import keccak
+
+    # uppercase each letter whose hash nibble is at least 8
+    address = address[-40:].lower()
+    address_hash = keccak(address.encode()).hex()
+    return '0x' + ''.join(c.upper() if int(h, 16) >= 8 else c for c, h in zip(address, address_hash))
\ No newline at end of file
@@ -0,0 +1,163 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import re
+
+from transpose.utils.decode import is_dynamic
+
+
+METRIC_PATTERN = re.compile(r'^(sum|min|max|avg)\((\w+)\)$')
+TIME_UNITS = ['hour', 'day', 'week', 'month']
+INTEGER_TYPE_PATTERN = re.compile(r'^(u?)int(8|16|24|32|40|48|56|64|72|80|88|96|104|112|120|128|136|144|152|160|168|176|184|192|200|208|216|224|232|240|248|256)?$')
+
+
+def parse_metric(metric: str) -> Tuple[str, Optional[str]]:
+    """
+    Parses a metric string (e.g. "count" or "sum(wad)") into its function
+    and parameter name.
+
+    :param metric: The metric string.
+    :return: The metric function and parameter name, or None for counts.
+    """
+
+    if metric == 'count': return 'count', None
+    match = METRIC_PATTERN.match(metric)
+    if not match: raise ValueError('Invalid metric "{}"'.format(metric))
+    return match.group(1), match.group(2)
+
+
+def head_slots(abi_param: dict) -> int:
+    """
+    Returns the number of 32-byte slots an ABI parameter occupies in the head
+    of its encoding.
+
+    :param abi_param: The ABI parameter.
+    :return: The number of slots.
+    """
+
+    abi_type = abi_param['type']
+    if is_dynamic(abi_param): return 1
+    elif abi_type.endswith(']'):
+        size = int(abi_type[abi_type.rindex('[') + 1:-1])
+        return size * head_slots({**abi_param, 'type': abi_type[:abi_type.rindex('[')]})
+    elif abi_type == 'tuple': return sum(head_slots(c) for c in abi_param['components'])
+    return 1
+
+
+def word_decoder(abi_type: str) -> Callable[[List[str]], List[int]]:
+    """
+    Returns a function that decodes a column of 32-byte hex words of a numeric
+    ABI type into Python ints in a single pass. Only scalar types are numeric,
+    since the word of an array parameter is an offset or its first element.
+    Missing words (e.g. of logs with short data) decode to None.
+
+    :param abi_type: The ABI type (one of uint<N>, int<N>, or bool).
+    :return: The decoder function.
+    """
+
+    match = INTEGER_TYPE_PATTERN.match(abi_type)
+    if (match is not None and match.group(1) == 'u') or abi_type == 'bool':
+        return lambda words: [int(w, 16) if w else None for w in words]
+    elif match is not None:
+        return lambda words: [None if v is None else v - (1 << 256) if v >> 255 else v for v in (int(w, 16) if w else None for w in words)]
+    raise ValueError('Type "{}" is not numeric'.format(abi_type))
+
+
+class Aggregator:
+    """
+    The Aggregator class accumulates metrics per bucket from pushed-down counts
+    or from pages of decoded parameter columns, and returns the result as a
+    compact column-oriented table.
+    """
+
+    def __init__(self, metrics: List[str]) -> None:
+        """
+        Initialize the aggregator.
+
+        :param metrics: The metric strings.
+        """
+
+        self.metrics = [(metric, *parse_metric(metric)) for metric in metrics]
+        self.__buckets: Dict[Any, dict] = {}
+
+
+    def add_count(self, bucket: Any, count: int,
+                  key: Any=None) -> None:
+
+        """
+        Add a pushed-down count to a bucket.
+
+        :param bucket: The bucket.
+        :param count: The number of rows.
+        :param key: An additional grouping key for the bucket, if any.
+        """
+
+        self.__get((bucket, key))['count'] += count
+
+
+    def add_page(self, buckets: List[Any], columns: Dict[str, List[int]]) -> None:
+        """
+        Add a page of decoded parameter columns. Rows must be ordered so that
+        each bucket forms a contiguous run. Missing values (None) are ignored by
+        the parameter metrics, as NULLs are in SQL.
+
+        :param buckets: The bucket of each row.
+        :param columns: The decoded values of each parameter.
+        """
+
+        start = 0
+        for end in range(1, len(buckets) + 1):
+            if end < len(buckets) and buckets[end] == buckets[start]: continue
+            acc = self.__get((buckets[start], None))
+            acc['count'] += end - start
+
+            # reduce each parameter over the bucket run
+            for param, values in columns.items():
+                run = [v for v in values[start:end] if v is not None]
+                if len(run) == 0: continue
+                acc['values'][param] = acc['values'].get(param, 0) + len(run)
+                acc['sum'][param] = acc['sum'].get(param, 0) + sum(run)
+                acc['min'][param] = min(run) if param not in acc['min'] else min(acc['min'][param], min(run))
+                acc['max'][param] = max(run) if param not in acc['max'] else max(acc['max'][param], max(run))
+            start = end
+
+
+    def table(self, parse_bucket: Callable[[Any], Any],
+              key_name: str=None,
+              resolve_key: Callable[[Any], Any]=None) -> Dict[str, list]:
+
+        """
+        Return the accumulated metrics as a column-oriented table, ordered by
+        bucket.
+
+        :param parse_bucket: A function to convert raw bucket values.
+        :param key_name: The column name of the additional grouping key, if any.
+        :param resolve_key: A function to convert raw grouping keys.
+        :return: The table, as a dict of column names to lists of values.
+        """
+
+        table = {'bucket': []}
+        if key_name is not None: table[key_name] = []
+        for metric, _, _ in self.metrics: table[metric] = []
+
+        for (bucket, key), acc in sorted(self.__buckets.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            table['bucket'].append(parse_bucket(bucket))
+            if key_name is not None: table[key_name].append(resolve_key(key))
+            for metric, function, param in self.metrics:
+                if function == 'count': table[metric].append(acc['count'])
+                elif function == 'avg': table[metric].append(acc['sum'][param] / acc['values'][param] if param in acc['values'] else None)
+                else: table[metric].append(acc[function].get(param))
+
+        return table
+
+
+    def __get(self, bucket: Any) -> dict:
+        """
+        Return the accumulator for a bucket, creating it if needed.
+
+        :param bucket: The bucket.
+        :return: The accumulator.
+        """
+
+        acc = self.__buckets.get(bucket)
+        if acc is None:
+            acc = self.__buckets[bucket] = {'count': 0, 'values': {}, 'sum': {}, 'min': {}, 'max': {}}
+        return acc
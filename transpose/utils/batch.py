@@ -0,0 +1,213 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List
+import threading
+import json
+import time
+import re
+
+from transpose.sql.general import batch_query
+from transpose.utils.exceptions import TransposeAPIError
+from transpose.utils.request import send_transpose_sql_request, CONNECTION_POOL_SIZE, RETRY_STATUS_CODES
+from transpose.utils.time import to_iso_timestamp
+
+
+# timestamps as serialized by json_agg, e.g. "2023-01-01T00:00:00+00:00"
+JSON_TIMESTAMP_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?([+-]\d{2}(:\d{2})?)?$')
+
+
+class QueryBatcher:
+    """
+    The QueryBatcher class coalesces independent SQL queries sent from many
+    streams (typically one per thread) into a small number of round trips. The
+    first query to arrive opens a batch window; all queries that arrive for the
+    same API key during the window are sent together and their results are
+    demultiplexed back to the waiting callers. Identical queries in the same
+    window (e.g. latest block lookups) are sent only once.
+
+    Batches are combined into a single SQL request where the API permits. If the
+    combined request fails, the batch is instead pipelined concurrently over the
+    pooled connection. Combined requests are only disabled for the rest of the
+    batcher's lifetime if the API rejects the combined request outright (i.e. a
+    client error) while the individual queries succeed, so transient failures
+    do not turn batching off. Combined results are normalized to the types the
+    API returns for individual queries.
+    """
+
+    def __init__(self, window: float=0.05,
+                 max_batch_size: int=20,
+                 combine: bool=True) -> None:
+
+        """
+        Initialize the batcher.
+
+        :param window: The time in seconds to wait for queries to join a batch.
+        :param max_batch_size: The maximum number of distinct queries per batch.
+        :param combine: Whether to combine batches into a single SQL request.
+        """
+
+        if not isinstance(window, (int, float)) or window < 0:
+            raise ValueError('Invalid batch window')
+        elif not isinstance(max_batch_size, int) or max_batch_size < 1:
+            raise ValueError('Invalid max batch size')
+
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.combine = combine
+        self.__lock = threading.Lock()
+        self.__pending: Dict[str, Dict[str, Future]] = {}
+        self.__executor = ThreadPoolExecutor(max_workers=CONNECTION_POOL_SIZE)
+
+
+    def send(self, api_key: str, query: str) -> List[dict]:
+        """
+        Send a SQL query as part of the next batch and block until its results
+        are available. Has the same interface as send_transpose_sql_request.
+
+        :param api_key: A valid API key for Transpose.
+        :param query: A valid SQL query.
+        :return: The response results for the query.
+        """
+
+        leader, full = False, None
+        with self.__lock:
+            batch = self.__pending.get(api_key)
+            if batch is None:
+                batch = self.__pending[api_key] = {}
+                leader = True
+
+            # join batch
+            future = batch.get(query)
+            if future is None:
+                future = batch[query] = Future()
+                if len(batch) >= self.max_batch_size:
+                    full = self.__pending.pop(api_key)
+
+        # flush batch when full or once window has elapsed
+        if full is not None: self.__flush(api_key, full)
+        elif leader:
+            time.sleep(self.window)
+            with self.__lock:
+                if self.__pending.get(api_key) is batch: self.__pending.pop(api_key)
+                else: batch = None
+            if batch is not None: self.__flush(api_key, batch)
+
+        return future.result()
+
+
+    def send_many(self, api_key: str, queries: List[str]) -> List[List[dict]]:
+        """
+        Send several SQL queries in as few round trips as possible, without
+        waiting for a batch window.
+
+        :param api_key: A valid API key for Transpose.
+        :param queries: The SQL queries.
+        :return: The response results for each query, in order.
+        """
+
+        futures = {}
+        for query in queries:
+            if query not in futures: futures[query] = Future()
+
+        # flush in chunks of the max batch size
+        items = list(futures.items())
+        for i in range(0, len(items), self.max_batch_size):
+            self.__flush(api_key, dict(items[i:i + self.max_batch_size]))
+
+        return [futures[query].result() for query in queries]
+
+
+    def __flush(self, api_key: str, batch: Dict[str, Future]) -> None:
+        """
+        Send a batch of queries and resolve the waiting futures.
+
+        :param api_key: A valid API key for Transpose.
+        :param batch: The queries in the batch and their futures.
+        """
+
+        queries = list(batch.keys())
+        if len(queries) == 1:
+            self.__resolve(batch[queries[0]], api_key, queries[0])
+            return
+
+        # send combined request
+        rejected = False
+        if self.combine:
+            try: rows = send_transpose_sql_request(api_key=api_key, query=batch_query(queries))
+            except TransposeAPIError as e: rows, rejected = None, is_rejection(e)
+
+            if rows is not None:
+                for row in rows:
+                    results = row['__batch_rows']
+                    if isinstance(results, str): results = json.loads(results)
+                    results = [normalize_batch_row(r) for r in results] if results is not None else []
+                    batch[queries[row['__batch_index']]].set_result(results)
+                for query in queries:
+                    if not batch[query].done():
+                        batch[query].set_exception(TransposeAPIError(status_code=None, message='Missing batch result'))
+                return
+
+        # otherwise, pipeline over pooled connection
+        pending = [self.__executor.submit(self.__resolve, batch[query], api_key, query) for query in queries]
+        for p in pending: p.result()
+        if rejected and all(batch[query].exception() is None for query in queries):
+            self.combine = False
+
+
+    def __resolve(self, future: Future, api_key: str, query: str) -> None:
+        """
+        Send a single query and resolve its future with the results or error.
+
+        :param future: The future to resolve.
+        :param api_key: A valid API key for Transpose.
+        :param query: The SQL query.
+        """
+
+        try: future.set_result(send_transpose_sql_request(api_key=api_key, query=query))
+        except Exception as e: future.set_exception(e)
+
+
+def is_rejection(error: TransposeAPIError) -> bool:
+    """
+    Check whether an API error is a deterministic rejection of the request
+    (e.g. a combined query the API does not permit), rather than a transient
+    failure such as a timeout, rate limit, or server error.
+
+    :param error: The API error.
+    :return: Whether the request was rejected.
+    """
+
+    return error.status_code is not None and 400 <= error.status_code < 500 \
+        and error.status_code != 408 and error.status_code not in RETRY_STATUS_CODES
+
+
+def normalize_batch_value(value: Any) -> Any:
+    """
+    Normalize a value from a combined request to the type the API returns for
+    an individual query. json_agg serializes timestamps with a UTC offset
+    rather than a "Z" suffix, and numerics with their scale, so whole numbers
+    may arrive as floats (e.g. 5.0).
+
+    :param value: The value.
+    :return: The normalized value.
+    """
+
+    match = JSON_TIMESTAMP_PATTERN.match(value) if isinstance(value, str) else None
+    if match is not None:
+        offset = match.group(2)
+        if offset is None: return value + 'Z'
+        elif offset.strip('+-:0') == '': return value[:match.start(2)] + 'Z'
+        return to_iso_timestamp(value).isoformat().replace('+00:00', 'Z')
+    elif isinstance(value, float) and value.is_integer(): return int(value)
+    return value
+
+
+def normalize_batch_row(row: Any) -> Any:
+    """
+    Normalize the values of a row from a combined request.
+
+    :param row: The row.
+    :return: The normalized row.
+    """
+
+    if not isinstance(row, dict): return row
+    return {k: normalize_batch_value(v) for k, v in row.items()}
@@ -0,0 +1,199 @@
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from bisect import bisect_left
+import threading
+import math
+import os
+
+from transpose.sql.general import block_times_query, block_at_time_query
+from transpose.utils.cache import get_cache_dir, read_json, write_json
+from transpose.utils.time import to_iso_timestamp
+
+
+INTERPOLATION_WINDOW = 256
+MAX_INTERPOLATIONS = 2
+
+_indexes: Dict[str, 'BlockTimeIndex'] = {}
+_indexes_lock = threading.Lock()
+
+
+class BlockTimeIndex:
+    """
+    The BlockTimeIndex class resolves timestamps to block numbers for a chain. It
+    keeps a sorted set of known (block number, timestamp) samples, which grows as
+    timestamps are resolved and is persisted to the local cache directory if one
+    is set. A timestamp between two adjacent known blocks resolves without any
+    query. Otherwise, the block is estimated by interpolating between the nearest
+    known samples, and a single query for the blocks straddling the timestamp in
+    a small window around the estimate usually resolves it exactly.
+    """
+
+    def __init__(self, chain: str) -> None:
+        """
+        Initialize the index, loading samples from the cache directory.
+
+        :param chain: The chain name.
+        """
+
+        self.chain = chain
+        self.__lock = threading.Lock()
+        self.__blocks: List[int] = []
+        self.__times: List[int] = []
+
+        cache_dir = get_cache_dir('blocktime')
+        self.__cache_path = os.path.join(cache_dir, f'{chain}.json') if cache_dir is not None else None
+        samples = read_json(self.__cache_path) if self.__cache_path is not None else None
+        if isinstance(samples, dict) and isinstance(samples.get('blocks'), list) and isinstance(samples.get('times'), list):
+            self.__add(list(zip(samples['blocks'], samples['times'])))
+
+
+    def resolve(self, timestamp: Union[datetime, str, int, float], request: Callable[[str], List[dict]],
+                after: bool=False) -> int:
+
+        """
+        Return the first block with a timestamp at or after the given timestamp,
+        or strictly after it. If no such block exists yet, returns the block
+        after the latest block.
+
+        :param timestamp: The timestamp, as a datetime, ISO-8601 string, or Unix time in seconds.
+        :param request: A function that sends a SQL query and returns its results.
+        :param after: Whether to find the first block strictly after the timestamp.
+        :return: The block number.
+        """
+
+        # block timestamps are whole seconds
+        target = to_unix_time(timestamp)
+        target = math.floor(target) + 1 if after else math.ceil(target)
+
+        # seed index with the genesis and latest blocks
+        if len(self.__blocks) == 0: self.__update(request(block_times_query(self.chain, [0])))
+
+        interpolations = 0
+        while True:
+            lower, upper = self.__bracket(target)
+            if upper is not None and (upper[0] == 0 or (lower is not None and upper[0] == lower[0] + 1)): return upper[0]
+            from_block = lower[0] + 1 if lower is not None else 0
+            to_block = upper[0] - 1 if upper is not None else None
+
+            # query a window around the interpolated block, falling back to the full bracket
+            window = None
+            if interpolations < MAX_INTERPOLATIONS and lower is not None:
+                guess = self.__interpolate(target, lower, upper)
+                window = (max(from_block, guess - INTERPOLATION_WINDOW), guess + INTERPOLATION_WINDOW)
+                if to_block is not None: window = (window[0], min(to_block, window[1]))
+                if window[0] <= from_block and to_block is not None and window[1] >= to_block: window = None
+                interpolations += 1
+
+            rows = self.__update(request(block_at_time_query(
+                chain=self.chain,
+                timestamp=datetime.fromtimestamp(target, timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+                from_block=window[0] if window is not None else from_block,
+                to_block=window[1] if window is not None else to_block
+            )))
+
+            # an exact query without a later block means the timestamp is past the latest block
+            if window is None and all(t < target for _, t in rows):
+                return max([b for b, _ in rows] + [from_block - 1]) + 1
+
+
+    def __bracket(self, target: int) -> Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]:
+        """
+        Return the known samples immediately before and at or after a timestamp.
+
+        :param target: The Unix time in seconds.
+        :return: The lower and upper (block number, timestamp) samples, or None if missing.
+        """
+
+        with self.__lock:
+            i = bisect_left(self.__times, target)
+            lower = (self.__blocks[i - 1], self.__times[i - 1]) if i > 0 else None
+            upper = (self.__blocks[i], self.__times[i]) if i < len(self.__times) else None
+            return lower, upper
+
+
+    def __interpolate(self, target: int, lower: Tuple[int, int], upper: Optional[Tuple[int, int]]) -> int:
+        """
+        Estimate the block at a timestamp by linear interpolation between the
+        known samples around it, or by extrapolating the average block time of
+        the latest samples if the timestamp is past the latest known block.
+
+        :param target: The Unix time in seconds.
+        :param lower: The known sample before the timestamp.
+        :param upper: The known sample at or after the timestamp, if any.
+        :return: The estimated block number.
+        """
+
+        if upper is None:
+            with self.__lock:
+                first = (self.__blocks[-2], self.__times[-2]) if len(self.__blocks) > 1 else (0, lower[1] - 12 * lower[0])
+            upper = (lower[0] + (lower[0] - first[0]), lower[1] + (lower[1] - first[1]))
+        if upper[1] <= lower[1]: return lower[0] + 1
+        return lower[0] + 1 + int((target - lower[1]) * (upper[0] - lower[0]) / (upper[1] - lower[1]))
+
+
+    def __update(self, rows: List[dict]) -> List[Tuple[int, int]]:
+        """
+        Add the blocks returned by a query to the index and persist it.
+
+        :param rows: The rows with block numbers and timestamps.
+        :return: The (block number, timestamp) samples.
+        """
+
+        samples = [(row['block_number'], int(to_iso_timestamp(row['timestamp']).timestamp())) for row in rows]
+        if self.__add(samples) and self.__cache_path is not None:
+            with self.__lock: data = {'blocks': list(self.__blocks), 'times': list(self.__times)}
+            try: write_json(self.__cache_path, data)
+            except OSError: pass
+        return samples
+
+
+    def __add(self, samples: List[Tuple[int, int]]) -> bool:
+        """
+        Insert samples into the sorted index.
+
+        :param samples: The (block number, timestamp) samples.
+        :return: Whether any new samples were added.
+        """
+
+        added = False
+        with self.__lock:
+            for block, time in samples:
+                i = bisect_left(self.__blocks, block)
+                if i < len(self.__blocks) and self.__blocks[i] == block: continue
+                self.__blocks.insert(i, block)
+                self.__times.insert(i, time)
+                added = True
+        return added
+
+
+def get_block_time_index(chain: str) -> BlockTimeIndex:
+    """
+    Returns the process-wide block time index for a chain, creating it on first
+    use. The index is shared by all contracts and streams on the chain.
+
+    :param chain: The chain name.
+    :return: The block time index.
+    """
+
+    with _indexes_lock:
+        index = _indexes.get(chain)
+        if index is None: index = _indexes[chain] = BlockTimeIndex(chain)
+        return index
+
+
+def to_unix_time(timestamp: Union[datetime, str, int, float]) -> float:
+    """
+    Converts a datetime, ISO-8601 string, or Unix time to a Unix time in seconds.
+    Timestamps without a timezone are assumed to be in UTC.
+
+    :param timestamp: The timestamp.
+    :return: The Unix time in seconds.
+    """
+
+    if isinstance(timestamp, bool): raise ValueError('Invalid timestamp')
+    elif isinstance(timestamp, (int, float)): return float(timestamp)
+    elif isinstance(timestamp, str): return to_iso_timestamp(timestamp).timestamp()
+    elif isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None: timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.timestamp()
+    raise ValueError('Invalid timestamp')
@@ -0,0 +1,69 @@
+from typing import Any, Optional
+import tempfile
+import json
+import os
+
+
+_cache_dir = os.environ.get('TRANSPOSE_CACHE_DIR')
+
+
+def get_cache_dir(*parts: str) -> Optional[str]:
+    """
+    Returns the local cache directory used to persist data between runs, or a
+    subdirectory of it, creating it if needed. Returns None if no cache directory
+    has been set, in which case data is only cached in memory. Defaults to the
+    TRANSPOSE_CACHE_DIR environment variable.
+
+    :param parts: The path components of the subdirectory.
+    :return: The cache directory, or None.
+    """
+
+    if _cache_dir is None: return None
+    path = os.path.join(_cache_dir, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def set_cache_dir(path: Optional[str]) -> None:
+    """
+    Set the local cache directory used to persist data between runs, or None
+    to disable persistence.
+
+    :param path: The cache directory.
+    """
+
+    global _cache_dir
+    _cache_dir = path
+
+
+def read_json(path: str) -> Any:
+    """
+    Read a JSON file, returning None if it does not exist or is invalid.
+
+    :param path: The file path.
+    :return: The parsed JSON, or None.
+    """
+
+    try:
+        with open(path, 'r') as f: return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path: str, data: Any) -> None:
+    """
+    Atomically write a JSON file by writing to a temporary file in the same
+    directory and renaming it into place, so that concurrent readers never
+    see a partially written file.
+
+    :param path: The file path.
+    :param data: The data to write.
+    """
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f: json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
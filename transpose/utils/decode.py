@@ -1,9 +1,13 @@
-from eth_event import get_log_topic
-from eth_utils import decode_hex
-from eth_abi import decode
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
+from functools import lru_cache
 import re
 
+if TYPE_CHECKING: from eth_abi.decoding import TupleDecoder
+
+
+STATIC_TYPE_PATTERN = re.compile(r'^(uint|int)\d*$|^(bool|address)$|^bytes(\d+)$')
+ZERO_WORD = bytes(32)
+
 
 def extract_params(abi_params: List[dict]) -> List[str]:
     """
@@ -30,6 +34,20 @@ def extract_params(abi_params: List[dict]) -> List[str]:
     return types
 
 
+def get_signature_hash(abi_item: dict) -> str:
+    """
+    Returns the keccak hash of the canonical signature of an ABI item,
+    i.e. the topic of an event or the padded selector of a function.
+
+    :param abi_item: The ABI item.
+    :return: The signature hash hex string.
+    """
+
+    from eth_hash.auto import keccak
+    signature = '{}({})'.format(abi_item['name'], ','.join(extract_params(abi_item['inputs'])))
+    return '0x' + keccak(signature.encode()).hex()
+
+
 def build_function_map(abi: List[dict]) -> Dict[str, dict]:
     """
     Builds a dictionary that maps function selectors to the 
@@ -43,7 +61,7 @@ def build_function_map(abi: List[dict]) -> Dict[str, dict]:
     for item in abi:
         if 'type' not in item or item['type'] != 'function': continue
         elif 'name' not in item: continue
-        function_map[get_log_topic(item)[:10]] = {
+        function_map[get_signature_hash(item)[:10]] = {
             'name': item['name'],
             'input_order': [i['name'] for i in item['inputs']],
             'output_order': [i['name'] for i in item['outputs']],
@@ -73,7 +91,7 @@ def build_topic_map(abi: List[dict]) -> Dict[str, dict]:
     for item in abi:
         if 'type' not in item or item['type'] != 'event': continue
         elif 'name' not in item: continue
-        topic_map[get_log_topic(item)] = {
+        topic_map[get_signature_hash(item)] = {
             'name': item['name'],
             'order': [i['name'] for i in item['inputs']],
             'topics': {
@@ -99,9 +117,90 @@ def decode_hex_data(types: List[str], hex_data: str) -> tuple:
     """
 
     if hex_data is None: return tuple()
-    data = decode_hex(hex_data)
-    decoded_data = decode(types, data)
-    return decoded_data
+    return decode_buffer(types, hex_to_bytes(hex_data))
+
+
+def hex_to_bytes(hex_data: str) -> bytes:
+    """
+    Converts a 0x-prefixed hex string into bytes.
+
+    :param hex_data: The hex string.
+    :return: The bytes.
+    """
+
+    return bytes.fromhex(hex_data[2:] if hex_data[:2] in ('0x', '0X') else hex_data)
+
+
+@lru_cache(maxsize=None)
+def get_tuple_decoder(types: Tuple[str, ...]) -> 'TupleDecoder':
+    """
+    Returns a decoder for a tuple of ABI types. Decoders are cached, so each
+    distinct list of types is only compiled once per process.
+
+    :param types: The tuple of parameter types.
+    :return: The decoder.
+    """
+
+    from eth_abi.decoding import TupleDecoder
+    from eth_abi.registry import registry
+    return TupleDecoder(decoders=tuple(registry.get_decoder(t) for t in types))
+
+
+def decode_buffer(types: List[str], buffer: bytes,
+                  offset: int=0) -> tuple:
+
+    """
+    Decodes ABI-encoded parameters from a bytes buffer, starting at a byte
+    offset. The buffer is read in place, so a payload that follows a prefix
+    (e.g. calldata after its function selector) does not need to be sliced
+    or copied before decoding.
+
+    :param types: The list of parameter types.
+    :param buffer: The buffer holding the encoded parameters.
+    :param offset: The byte offset of the encoded parameters in the buffer.
+    :return: The decoded tuple.
+    """
+
+    from eth_abi.decoding import ContextFramesBytesIO
+    stream = ContextFramesBytesIO(buffer)
+    if offset > 0: stream.push_frame(offset)
+    return get_tuple_decoder(tuple(types))(stream)
+
+
+def decode_topics(abi_params: List[dict], topics: List[str]) -> tuple:
+    """
+    Decodes the indexed parameters of a log from its topic hex strings, one
+    32-byte topic per parameter. Indexed parameters of dynamic types are
+    stored as a hash of their value, and are returned as the raw 32-byte hash.
+
+    :param abi_params: The ABI parameters of the indexed inputs.
+    :param topics: The topic hex strings, excluding the event signature.
+    :return: The decoded tuple.
+    """
+
+    if len(topics) < len(abi_params): raise ValueError('Missing topics for indexed parameters')
+    decoded = []
+    for param, param_type, topic in zip(abi_params, extract_params(abi_params), topics):
+        topic_bytes = hex_to_bytes(topic)
+        if is_dynamic(param): decoded.append(topic_bytes)
+        else: decoded.append(decode_buffer([param_type], topic_bytes)[0])
+
+    return tuple(decoded)
+
+
+def is_dynamic(abi_param: dict) -> bool:
+    """
+    Returns whether an ABI parameter has a dynamic type.
+
+    :param abi_param: The ABI parameter.
+    :return: Whether the type is dynamic.
+    """
+
+    abi_type = abi_param['type']
+    if abi_type in ['string', 'bytes'] or abi_type.endswith('[]'): return True
+    elif abi_type.endswith(']'): return is_dynamic({**abi_param, 'type': abi_type[:abi_type.rindex('[')]})
+    elif abi_type == 'tuple': return any(is_dynamic(c) for c in abi_param['components'])
+    return False
 
 
 def resolve_decoded_data(abi_params: List[dict], decoded_data: tuple) -> dict:
@@ -135,4 +234,72 @@ def resolve_decoded_data(abi_params: List[dict], decoded_data: tuple) -> dict:
         else:
             decoded_params[abi_item['name']] = decoded_item
 
-    return decoded_params
\ No newline at end of file
+    return decoded_params
+
+
+def build_static_layout(abi_params: List[dict]) -> Optional[List[Tuple[str, int]]]:
+    """
+    Returns the fixed-width layout of a list of ABI parameters, as the kind and
+    byte size of the value in each parameter's 32-byte word, if every parameter
+    is a static elementary type (uint, int, bool, address, or fixed-size bytes).
+    Returns None if any parameter is dynamic or composite.
+
+    :param abi_params: The ABI parameters.
+    :return: The layout, or None.
+    """
+
+    layout = []
+    for param in abi_params:
+        match = STATIC_TYPE_PATTERN.match(param['type'])
+        if not match: return None
+        elif match.group(1) is not None: layout.append((match.group(1), int(param['type'][len(match.group(1)):] or 256) // 8))
+        elif match.group(2) == 'bool': layout.append(('bool', 1))
+        elif match.group(2) == 'address': layout.append(('address', 20))
+        else: layout.append(('bytes', int(match.group(3))))
+
+    return layout
+
+
+def decode_static_words(hex_strings: List[str], offset: int, layout: List[Tuple[str, int]]) -> List[list]:
+    """
+    Decodes a page of hex strings that share the same fixed-width layout into one
+    column of values per parameter. The hex strings are decoded together into a
+    single contiguous buffer, and each column is sliced from it in bulk. Like the
+    per-item decoder, words with non-zero padding (or a bool other than 0 or 1)
+    are rejected, so callers can fall back to decoding the page item by item.
+
+    :param hex_strings: The hex strings, each holding one 32-byte word per parameter.
+    :param offset: The number of leading characters to skip in each hex string.
+    :param layout: The static layout of the parameters.
+    :return: The decoded columns.
+    """
+
+    buffer = memoryview(bytes.fromhex(''.join([h[offset:] for h in hex_strings])))
+    stride = 32 * len(layout)
+    end = stride * len(hex_strings)
+    from_bytes = int.from_bytes
+
+    # slice each column from the buffer, validating its padding
+    columns = []
+    for slot, (kind, size) in enumerate(layout):
+        starts = range(32 * slot, end, stride)
+        if kind == 'uint':
+            column = [from_bytes(buffer[i:i + 32], 'big') for i in starts]
+            if size < 32 and any(v >> (8 * size) for v in column): raise ValueError('Invalid padding for uint')
+        elif kind == 'int':
+            column = [from_bytes(buffer[i:i + 32], 'big', signed=True) for i in starts]
+            bound = 1 << (8 * size - 1)
+            if size < 32 and any(v < -bound or v >= bound for v in column): raise ValueError('Invalid padding for int')
+        elif kind == 'bool':
+            column = [from_bytes(buffer[i:i + 32], 'big') for i in starts]
+            if any(v > 1 for v in column): raise ValueError('Invalid bool value')
+            column = [v == 1 for v in column]
+        elif kind == 'address':
+            if any(buffer[i:i + 12] != ZERO_WORD[:12] for i in starts): raise ValueError('Invalid padding for address')
+            column = ['0x' + buffer[i + 12:i + 32].hex() for i in starts]
+        else:
+            if size < 32 and any(buffer[i + size:i + 32] != ZERO_WORD[size:] for i in starts): raise ValueError('Invalid padding for bytes')
+            column = [buffer[i:i + size].tobytes() for i in starts]
+        columns.append(column)
+
+    return columns
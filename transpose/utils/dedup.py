@@ -0,0 +1,91 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List
+
+
+class Deduplicator:
+    """
+    The Deduplicator class drops items that have already been seen from the
+    pages of a stream, using a bounded window of recent blocks rather than an
+    ever-growing set of every key. The keys of items in the most recent blocks
+    (in the stream order) are kept exactly, and blocks that fall out of the
+    window advance a watermark, behind which any item is dropped, since the
+    stream's cursor has already passed it.
+    """
+
+    def __init__(self, key: Callable[[dict], Hashable],
+                 window_blocks: int=128,
+                 order: str='asc') -> None:
+
+        """
+        Initialize the deduplicator.
+
+        :param key: A function that returns the unique key of a raw item.
+        :param window_blocks: The number of recent blocks to keep exact keys for.
+        :param order: The order of the stream.
+        """
+
+        if not isinstance(window_blocks, int) or window_blocks < 1: raise ValueError('Invalid window blocks')
+
+        self.key = key
+        self.window_blocks = window_blocks
+        self.direction = 1 if order == 'asc' else -1
+        self.duplicates = 0
+        self.__keys: Dict[Hashable, int] = {}
+        self.__blocks: 'OrderedDict[int, List[Hashable]]' = OrderedDict()
+        self.__watermark = None
+        self.__head = None
+
+
+    def filter(self, data: List[dict]) -> List[dict]:
+        """
+        Return the items of a page that have not been seen before, and remember
+        their keys.
+
+        :param data: The raw items, in the stream order.
+        :return: The unseen items.
+        """
+
+        unseen = []
+        for item in data:
+            position = item['block_number'] * self.direction
+
+            # drop items behind the watermark or already in the window
+            if self.__watermark is not None and position <= self.__watermark:
+                self.duplicates += 1
+                continue
+
+            key = self.key(item)
+            if key in self.__keys:
+                self.duplicates += 1
+                continue
+
+            self.__keys[key] = position
+            self.__blocks.setdefault(position, []).append(key)
+            if self.__head is None or position > self.__head: self.__head = position
+            unseen.append(item)
+
+        self.__evict()
+        return unseen
+
+
+    def clear(self) -> None:
+        """
+        Forget all keys and the watermark, e.g. when the stream is rewound.
+        """
+
+        self.__keys = {}
+        self.__blocks = OrderedDict()
+        self.__watermark = None
+        self.__head = None
+
+
+    def __evict(self) -> None:
+        """
+        Drop the keys of blocks that have fallen out of the window, advancing the
+        watermark past them.
+        """
+
+        if self.__head is None: return
+        for position in [p for p in self.__blocks if p <= self.__head - self.window_blocks]:
+            for key in self.__blocks.pop(position): self.__keys.pop(key, None)
+            if self.__watermark is None or position > self.__watermark: self.__watermark = position
@@ -76,4 +76,29 @@ class TransposeAPIError(Exception):
         :return: The error message.
         """
         
-        return 'TransposeAPIError ({}, {})'.format(self.status_code, self.message)
\ No newline at end of file
+        return 'TransposeAPIError ({}, {})'.format(self.status_code, self.message)
+
+class SinkError(Exception):
+    """
+    The SinkError exception class is raised for errors that 
+    occur when writing a stream to a sink.
+    """
+
+    def __init__(self, message: str) -> None:
+        """
+        Initialize the exception class.
+
+        :param message: The error message.
+        """
+        
+        self.message = message
+
+    
+    def __str__(self) -> str:
+        """
+        Return the string-formated error message.
+
+        :return: The error message.
+        """
+        
+        return 'SinkError ({})'.format(self.message)
\ No newline at end of file
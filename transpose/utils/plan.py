@@ -0,0 +1,151 @@
+from typing import Dict, List, Tuple
+import math
+
+
+class BackfillPlan:
+    """
+    The BackfillPlan class holds a density histogram of a contract's activity over
+    a block range, as the number of items in each fixed-size block bucket, and
+    uses it to plan a backfill. Ranges can be split into shards of roughly equal
+    size, with busy buckets split finely and empty ranges skipped, page sizes can
+    be chosen per range, and the progress and ETA of a stream can be estimated
+    from its current block.
+    """
+
+    def __init__(self, start_block: int, end_block: int, bucket_size: int,
+                 buckets: Dict[int, int],
+                 counts: Dict[str, int]=None) -> None:
+
+        """
+        Initialize the plan.
+
+        :param start_block: The block the plan starts at, inclusive.
+        :param end_block: The block the plan ends at, exclusive.
+        :param bucket_size: The number of blocks per bucket.
+        :param buckets: The number of items in each non-empty bucket, by the bucket's first block.
+        :param counts: The number of items per event or function name.
+        """
+
+        self.start_block = start_block
+        self.end_block = end_block
+        self.bucket_size = bucket_size
+        self.buckets = dict(sorted(buckets.items()))
+        self.counts = counts if counts is not None else {}
+        self.total = sum(self.buckets.values())
+
+
+    @property
+    def histogram(self) -> List[dict]:
+        """
+        The non-empty buckets of the plan, in block order, clipped to the plan's
+        block range.
+
+        :return: The buckets, with their start block (inclusive), end block (exclusive), and count.
+        """
+
+        return [{'start_block': start, 'end_block': end, 'count': count} for start, end, count in self.__ranges()]
+
+
+    def estimate(self, start_block: int, end_block: int) -> float:
+        """
+        Estimate the number of items in a block range, assuming items are spread
+        evenly within each bucket.
+
+        :param start_block: The start block, inclusive.
+        :param end_block: The end block, exclusive.
+        :return: The estimated number of items.
+        """
+
+        total = 0.0
+        for start, end, count in self.__ranges():
+            overlap = min(end, end_block) - max(start, start_block)
+            if overlap > 0: total += count * overlap / (end - start)
+        return total
+
+
+    def shards(self, target_items: int) -> List[Tuple[int, int]]:
+        """
+        Split the plan's block range into shards of roughly the target number of
+        items each. Buckets with more items than the target are split into equal
+        block ranges, consecutive sparse buckets are merged, and empty ranges
+        before, after, and between shards are left out.
+
+        :param target_items: The target number of items per shard.
+        :return: The shards, as (start block, end block) ranges in ascending order.
+        """
+
+        if not isinstance(target_items, int) or target_items < 1: raise ValueError('Invalid target items')
+
+        shards = []
+        current = None
+        for start, end, count in self.__ranges():
+
+            # split busy buckets evenly
+            if count >= target_items:
+                if current is not None: shards.append(current[:2])
+                current = None
+                parts = min(end - start, math.ceil(count / target_items))
+                bounds = [start + (end - start) * i // parts for i in range(parts + 1)]
+                shards.extend(zip(bounds[:-1], bounds[1:]))
+                continue
+
+            # merge sparse buckets up to the target
+            if current is not None and current[2] + count > target_items:
+                shards.append(current[:2])
+                current = None
+            current = (current[0], end, current[2] + count) if current is not None else (start, end, count)
+
+        if current is not None: shards.append(current[:2])
+        return shards
+
+
+    def page_size(self, start_block: int, end_block: int,
+                  min_page_size: int=100,
+                  max_page_size: int=10000) -> int:
+
+        """
+        Choose a page size for streaming a block range: the whole range in a single
+        page if it is small, and otherwise the maximum page size.
+
+        :param start_block: The start block, inclusive.
+        :param end_block: The end block, exclusive.
+        :param min_page_size: The minimum page size.
+        :param max_page_size: The maximum page size.
+        :return: The page size.
+        """
+
+        return max(min_page_size, min(max_page_size, math.ceil(self.estimate(start_block, end_block))))
+
+
+    def progress(self, block_number: int, elapsed: float,
+                 order: str='asc') -> dict:
+
+        """
+        Estimate the progress of a stream over the plan's range from the block it
+        has reached, and the remaining time at its average rate so far.
+
+        :param block_number: The block of the last item streamed.
+        :param elapsed: The time in seconds since the stream started.
+        :param order: The order of the stream.
+        :return: The items done, items total, fraction done, and ETA in seconds (None if unknown).
+        """
+
+        if order == 'asc': done = self.estimate(self.start_block, block_number + 1)
+        else: done = self.estimate(block_number, self.end_block)
+        fraction = done / self.total if self.total > 0 else 1.0
+        eta = elapsed * (self.total - done) / done if done > 0 and elapsed > 0 else None
+        return {'items_done': round(done), 'items_total': self.total, 'fraction': fraction, 'eta': eta}
+
+
+    def __ranges(self) -> List[Tuple[int, int, int]]:
+        """
+        Return the block range and count of each non-empty bucket, clipped to the
+        plan's block range.
+
+        :return: The (start block, end block, count) of each bucket.
+        """
+
+        return [
+            (max(bucket, self.start_block), min(bucket + self.bucket_size, self.end_block), count)
+            for bucket, count in self.buckets.items() if count > 0
+        ]
@@ -0,0 +1,123 @@
+from typing import Dict
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    The TokenBucket class is a thread-safe token bucket used to pace requests to
+    the Transpose API. Tokens are refilled continuously at the configured rate up
+    to the burst size, and each request consumes a single token, blocking until
+    one is available. The bucket may also be paused (e.g. after a 429 response),
+    in which case all callers wait until the pause has elapsed.
+    """
+
+    def __init__(self, rate: float=None,
+                 burst: int=1) -> None:
+
+        """
+        Initialize the token bucket.
+
+        :param rate: The number of requests per second, or None for no limit.
+        :param burst: The maximum number of requests that may be sent at once.
+        """
+
+        self.__cond = threading.Condition()
+        self.__paused_until = 0.0
+        self.configure(rate, burst)
+
+
+    def configure(self, rate: float=None,
+                  burst: int=1) -> None:
+
+        """
+        Update the rate and burst size of the bucket.
+
+        :param rate: The number of requests per second, or None for no limit.
+        :param burst: The maximum number of requests that may be sent at once.
+        """
+
+        if rate is not None and (not isinstance(rate, (int, float)) or rate <= 0):
+            raise ValueError('Invalid rate limit (must be a positive number)')
+        elif not isinstance(burst, int) or burst < 1:
+            raise ValueError('Invalid burst size (must be a positive integer)')
+
+        with self.__cond:
+            self.rate = rate
+            self.burst = burst
+            self.__tokens = float(burst)
+            self.__updated = time.monotonic()
+            self.__cond.notify_all()
+
+
+    def acquire(self) -> None:
+        """
+        Consume a single token from the bucket, blocking until a token is
+        available and any active pause has elapsed.
+        """
+
+        with self.__cond:
+            while True:
+                now = time.monotonic()
+                wait = self.__paused_until - now
+                if wait <= 0:
+                    if self.rate is None: return
+
+                    # refill tokens
+                    self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+                    self.__updated = now
+                    if self.__tokens >= 1:
+                        self.__tokens -= 1
+                        return
+                    wait = (1 - self.__tokens) / self.rate
+
+                self.__cond.wait(wait)
+
+
+    def pause(self, seconds: float) -> None:
+        """
+        Pause the bucket so that no tokens are handed out for the given number
+        of seconds. Overlapping pauses are merged.
+
+        :param seconds: The number of seconds to pause for.
+        """
+
+        with self.__cond:
+            self.__paused_until = max(self.__paused_until, time.monotonic() + seconds)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_token_bucket(api_key: str) -> TokenBucket:
+    """
+    Return the process-wide token bucket for an API key, creating an unlimited
+    bucket if none exists. The same bucket is shared by all streams and threads
+    using the API key.
+
+    :param api_key: The API key.
+    :return: The token bucket.
+    """
+
+    with _buckets_lock:
+        bucket = _buckets.get(api_key)
+        if bucket is None:
+            bucket = TokenBucket()
+            _buckets[api_key] = bucket
+        return bucket
+
+
+def configure_rate_limit(api_key: str, rate: float,
+                         burst: int=1) -> None:
+
+    """
+    Set the client-side rate limit for an API key, shared by all streams and
+    threads in the process.
+
+    :param api_key: The API key.
+    :param rate: The number of requests per second, or None for no limit.
+    :param burst: The maximum number of requests that may be sent at once.
+    """
+
+    get_token_bucket(api_key).configure(rate, burst)
@@ -0,0 +1,202 @@
+from typing import Any, Iterator, Tuple
+import sys
+
+
+class Record:
+    """
+    The Record class is a lightweight base class for the slotted records used
+    in compact stream output. Each record stores its fields in __slots__ rather
+    than a per-instance dict, while still supporting dict-style access (e.g.
+    record['block_number']) so that code written against the default output
+    format continues to work.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, *values: Any) -> None:
+        """
+        Initialize the record with one value per field, in field order.
+
+        :param values: The field values.
+        """
+
+        if len(values) != len(self.__slots__):
+            raise TypeError('{} expects {} values'.format(type(self).__name__, len(self.__slots__)))
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+
+    def __getitem__(self, key: str) -> Any:
+        """
+        Return the value of a field by name.
+
+        :param key: The field name.
+        :return: The field value.
+        """
+
+        if key not in self.__slots__: raise KeyError(key)
+        return getattr(self, key)
+
+
+    def __contains__(self, key: str) -> bool:
+        """
+        Return whether the record has a field with the given name.
+
+        :param key: The field name.
+        :return: Whether the field exists.
+        """
+
+        return key in self.__slots__
+
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Iterate over the field names of the record, in field order.
+
+        :return: An iterator over the field names.
+        """
+
+        return iter(self.__slots__)
+
+
+    def __len__(self) -> int:
+        """
+        Return the number of fields in the record.
+
+        :return: The number of fields.
+        """
+
+        return len(self.__slots__)
+
+
+    def __eq__(self, other: Any) -> bool:
+        """
+        Compare the record to another record or dict by field values.
+
+        :param other: The object to compare against.
+        :return: Whether the objects are equal.
+        """
+
+        if isinstance(other, Record): other = other.to_dict()
+        if not isinstance(other, dict): return NotImplemented
+        return self.to_dict() == other
+
+
+    # records are mutable and compare equal to dicts, so like dicts they are unhashable
+    __hash__ = None
+
+
+    def __repr__(self) -> str:
+        """
+        Return the string representation of the record.
+
+        :return: The string representation.
+        """
+
+        return '{}({})'.format(
+            type(self).__name__,
+            ', '.join('{}={!r}'.format(k, getattr(self, k)) for k in self.__slots__)
+        )
+
+
+    def keys(self) -> Tuple[str, ...]:
+        """
+        Return the field names of the record, in field order.
+
+        :return: The field names.
+        """
+
+        return self.__slots__
+
+
+    def get(self, key: str, default: Any=None) -> Any:
+        """
+        Return the value of a field by name, or a default if it does not exist.
+
+        :param key: The field name.
+        :param default: The default value.
+        :return: The field value.
+        """
+
+        return getattr(self, key) if key in self.__slots__ else default
+
+
+    def to_dict(self) -> dict:
+        """
+        Convert the record to a dict in the default output format.
+
+        :return: The record as a dict.
+        """
+
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class EventItem(Record):
+    """
+    The target of a decoded event. A single instance is shared by all events
+    with the same contract and event name.
+    """
+
+    __slots__ = ('contract_address', 'event_name')
+
+
+class CallItem(Record):
+    """
+    The target of a decoded call. A single instance is shared by all calls
+    with the same contract and function name.
+    """
+
+    __slots__ = ('contract_address', 'function_name')
+
+
+class EventContext(Record):
+    """
+    The block and transaction context of a decoded event.
+    """
+
+    __slots__ = ('timestamp', 'block_number', 'log_index', 'transaction_hash', 'transaction_position', 'confirmed')
+
+
+class CallContext(Record):
+    """
+    The block, transaction, and trace context of a decoded call.
+    """
+
+    __slots__ = ('timestamp', 'block_number', 'transaction_hash', 'transaction_position', 'trace_index',
+                 'trace_address', 'trace_type', 'confirmed')
+
+
+class CallData(Record):
+    """
+    The underlying call data of a decoded call.
+    """
+
+    __slots__ = ('type', 'from_address', 'to_address', 'eth_value')
+
+
+def to_dict(value: Any) -> Any:
+    """
+    Recursively convert records in a decoded item to plain dicts, leaving all
+    other values untouched. Useful for serializing compact stream output.
+
+    :param value: The decoded item or value to convert.
+    :return: The converted value.
+    """
+
+    if isinstance(value, Record): return {k: to_dict(getattr(value, k)) for k in value.__slots__}
+    elif isinstance(value, dict): return {k: to_dict(v) for k, v in value.items()}
+    else: return value
+
+
+def intern_values(data: dict) -> dict:
+    """
+    Intern the top-level string values of a decoded data dict in place, so
+    that repeated values (e.g. addresses) share a single string object.
+
+    :param data: The decoded data dict.
+    :return: The same dict.
+    """
+
+    for key, value in data.items():
+        if type(value) is str: data[key] = sys.intern(value)
+    return data
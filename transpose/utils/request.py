@@ -1,39 +1,180 @@
-from typing import List
-import requests
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, List, Optional
+import threading
+import random
+import time
+import os
 
 from transpose.utils.exceptions import TransposeAPIError
+from transpose.utils.ratelimit import get_token_bucket
+
+if TYPE_CHECKING: import requests
+
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+CONNECTION_POOL_SIZE = 32
+DEFAULT_API_URL = 'https://api.transpose.io/sql'
+
+_api_url = os.environ.get('TRANSPOSE_API_URL', DEFAULT_API_URL)
+_gateway_url = os.environ.get('TRANSPOSE_GATEWAY_URL')
+_session = None
+_session_lock = threading.Lock()
+
+
+def set_api_url(url: Optional[str]) -> None:
+    """
+    Set the URL of the Transpose SQL API, e.g. to point the SDK at a local
+    stand-in API, or None to restore the default, which is the TRANSPOSE_API_URL
+    environment variable if it is set.
+
+    :param url: The API URL.
+    """
+
+    global _api_url
+    _api_url = url if url is not None else os.environ.get('TRANSPOSE_API_URL', DEFAULT_API_URL)
+
+
+def get_api_url() -> str:
+    """
+    Return the URL of the Transpose SQL API.
+
+    :return: The API URL.
+    """
+
+    return _api_url
+
+
+def set_gateway_url(url: Optional[str]) -> None:
+    """
+    Set the base URL of a local gateway (e.g. "http://127.0.0.1:8787") to route
+    all queries through, or None to query the API directly. The gateway applies
+    the rate limit on behalf of every process that uses it, so requests routed
+    through it skip the local token bucket. Defaults to the TRANSPOSE_GATEWAY_URL
+    environment variable.
+
+    :param url: The gateway URL.
+    """
+
+    global _gateway_url
+    _gateway_url = url
+
+
+def get_session() -> 'requests.Session':
+    """
+    Return the process-wide HTTP session used to send requests to the Transpose
+    API. The session keeps a pool of connections alive, so consecutive and
+    concurrent queries reuse connections rather than opening new ones. The
+    session is created on first use, so importing the SDK does not load the
+    HTTP stack.
+
+    :return: The HTTP session.
+    """
+
+    global _session
+    with _session_lock:
+        if _session is None:
+            from requests.adapters import HTTPAdapter
+            import requests
+            _session = requests.Session()
+            _session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=CONNECTION_POOL_SIZE))
+            _session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=CONNECTION_POOL_SIZE))
+        return _session
 
 
 def send_transpose_sql_request(api_key: str, query: str,
-                               debug: bool=False) -> List[dict]:
+                               debug: bool=False,
+                               max_retries: int=5,
+                               backoff_factor: float=0.5,
+                               max_backoff: float=60.0,
+                               timeout: float=300.0,
+                               url: str=None) -> List[dict]:
 
     """
-    Send a SQL query to the Transpose API and return the response results. Will
-    raise a TransposeAPIError if the API returns an error.
+    Send a SQL query to the Transpose API and return the response results. Requests
+    are paced by the shared token bucket for the API key, and rate-limited (429),
+    server (5xx), and connection errors are retried with jittered exponential backoff,
+    honoring the Retry-After header when present. Queries are routed through the
+    local gateway if one is set. Will raise a TransposeAPIError if the API returns
+    an error or the retries are exhausted.
 
     :param api_key: A valid API key for Transpose.
     :param query: A valid SQL query.
     :param debug: Whether to print the query.
+    :param max_retries: The maximum number of retries for retryable errors.
+    :param backoff_factor: The base delay in seconds for the exponential backoff.
+    :param max_backoff: The maximum delay in seconds between retries.
+    :param timeout: The request timeout in seconds.
+    :param url: The URL to send the query to, bypassing the gateway.
     :return: The response from the Transpose API.
     """
-        
-    # send POST request to Transpose API
-    response = requests.post(
-        url='https://api.transpose.io/sql',
-        json={'sql': query},
-        headers={'X-Api-Key': api_key, 'X-Request-Source': 'decoding-sdk'}
-    )
-
-    # check for errors
-    api_response = response.json()
-    if api_response['status'] == 'error':
-        raise TransposeAPIError(
-            status_code=response.status_code,
-            message=api_response['message']
-        )
-
-    # print query
-    if debug: print(query)
-    
-    # return results
-    return api_response['results']
\ No newline at end of file
+
+    import requests
+
+    # route through gateway, which applies the rate limit itself
+    bucket = None
+    if url is None and _gateway_url is not None: url = _gateway_url.rstrip('/') + '/sql'
+    else:
+        url = url if url is not None else _api_url
+        bucket = get_token_bucket(api_key)
+
+    for attempt in range(max_retries + 1):
+        if bucket is not None: bucket.acquire()
+        retry_delay = min(max_backoff, backoff_factor * 2 ** attempt) * random.random()
+
+        # send POST request to Transpose API
+        try:
+            response = get_session().post(
+                url=url,
+                json={'sql': query},
+                headers={'X-Api-Key': api_key, 'X-Request-Source': 'decoding-sdk'},
+                timeout=timeout
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= max_retries: raise TransposeAPIError(status_code=None, message=str(e)) from e
+            time.sleep(retry_delay)
+            continue
+
+        # retry rate-limited and server errors, pausing the rate budget when throttled
+        if response.status_code in RETRY_STATUS_CODES:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None: retry_delay = min(max_backoff, retry_after)
+            if response.status_code == 429 and bucket is not None: bucket.pause(retry_delay)
+            if attempt < max_retries:
+                time.sleep(retry_delay)
+                continue
+
+        # check for errors and malformed responses
+        try: api_response = response.json()
+        except ValueError: raise TransposeAPIError(status_code=response.status_code, message=response.text)
+        if not isinstance(api_response, dict): api_response = {}
+        if api_response.get('status') == 'error' or not isinstance(api_response.get('results'), list):
+            raise TransposeAPIError(
+                status_code=response.status_code,
+                message=api_response.get('message') or 'Invalid response: {}'.format(response.text)
+            )
+
+        # print query
+        if debug: print(query)
+
+        # return results
+        return api_response['results']
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse the value of a Retry-After header, supplied either as a number of
+    seconds or as an HTTP date, into a delay in seconds.
+
+    :param value: The header value.
+    :return: The delay in seconds, or None if the header is missing or invalid.
+    """
+
+    if value is None: return None
+    try: return max(0.0, float(value))
+    except ValueError: pass
+
+    try: retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError): return None
+    if retry_at.tzinfo is None: retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,248 @@
+from typing import Dict, List, Optional, Tuple, Union
+import threading
+import json
+import os
+
+from transpose.utils.decode import build_function_map, build_topic_map
+
+
+_lock = threading.Lock()
+_resolvers: Dict[Tuple[str, int, int], 'SignatureResolver'] = {}
+
+
+class SignatureResolver:
+    """
+    The SignatureResolver class resolves event topics and function selectors
+    that are missing from a contract's ABI (e.g. after a proxy upgrade) to ABI
+    entries built from text signatures such as "Transfer(address,address,uint256)".
+    Signatures are held in a single dict keyed by the raw bytes of each topic or
+    selector, and are only parsed into ABI entries when first resolved. Since
+    text signatures have no parameter names, parameters are named arg0, arg1,
+    etc., and since event signatures do not say which parameters are indexed,
+    the leading parameters are assumed to be indexed, one per topic of the log.
+    Function signatures have no outputs, so resolved calls have no output data.
+
+    Subclasses can resolve signatures from another source by overriding lookup().
+    """
+
+    def __init__(self, signatures: Union[Dict[str, Union[str, List[str]]], List[str]]=None) -> None:
+        """
+        Initialize the resolver.
+
+        :param signatures: The text signatures, either as a list or as a dict of text signatures by their topic or selector.
+        """
+
+        self.__signatures: Dict[bytes, Union[str, Tuple[str, ...]]] = {}
+        self.__events: Dict[Tuple[str, int], Optional[dict]] = {}
+        self.__functions: Dict[str, List[dict]] = {}
+        self.__lock = threading.Lock()
+
+        if isinstance(signatures, dict):
+            for signature_hash, text in signatures.items():
+                for t in ([text] if isinstance(text, str) else text): self.add(t, signature_hash)
+        elif signatures is not None:
+            for text in signatures: self.add(text)
+
+
+    @classmethod
+    def from_file(cls, path: str) -> 'SignatureResolver':
+        """
+        Load a resolver from a signature database file. JSON files may contain a
+        dict of text signatures by topic or selector, a list of text signatures,
+        or a list of objects with "text_signature" and optional "hex_signature"
+        fields (as exported by 4byte.directory). Any other file is read as text,
+        with one signature per line, optionally preceded by its topic or selector.
+
+        :param path: The path to the signature database file.
+        :return: The resolver.
+        """
+
+        resolver = cls()
+        with open(path, 'r') as f:
+            if path.endswith('.json'):
+                data = json.load(f)
+                if isinstance(data, dict): data = [(k, t) for k, v in data.items() for t in ([v] if isinstance(v, str) else v)]
+                for entry in data:
+                    if isinstance(entry, str): resolver.add(entry)
+                    elif isinstance(entry, dict): resolver.add(entry['text_signature'], entry.get('hex_signature'))
+                    else: resolver.add(entry[1], entry[0])
+
+            else:
+                for line in f:
+                    line = line.strip()
+                    if len(line) == 0 or line.startswith('#'): continue
+                    # split off a leading topic or selector, separated by whitespace or a comma
+                    if not line.startswith('0x'): resolver.add(line)
+                    else:
+                        end = min([i for i in [line.find(' '), line.find('\t'), line.find(',')] if i > 0] or [len(line)])
+                        resolver.add(line[end + 1:].strip(), line[:end])
+
+        return resolver
+
+
+    def add(self, text_signature: str,
+            signature_hash: str=None) -> None:
+
+        """
+        Add a text signature. Without a topic or selector, the signature is
+        hashed and added as both an event and a function signature.
+
+        :param text_signature: The text signature.
+        :param signature_hash: The topic or selector of the signature.
+        """
+
+        if signature_hash is not None: keys = [bytes.fromhex(signature_hash[2:] if signature_hash.startswith('0x') else signature_hash)]
+        else:
+            from eth_hash.auto import keccak
+            topic = keccak(text_signature.replace(' ', '').encode())
+            keys = [topic, topic[:4]]
+
+        with self.__lock:
+            for key in keys:
+                existing = self.__signatures.get(key)
+                if existing is None: self.__signatures[key] = text_signature
+                elif isinstance(existing, str): self.__signatures[key] = (existing, text_signature) if existing != text_signature else existing
+                elif text_signature not in existing: self.__signatures[key] = existing + (text_signature,)
+
+
+    def lookup(self, signature_hash: str) -> List[str]:
+        """
+        Return the text signatures with a topic or selector.
+
+        :param signature_hash: The topic or selector.
+        :return: The text signatures.
+        """
+
+        try: key = bytes.fromhex(signature_hash[2:])
+        except (ValueError, TypeError): return []
+        with self.__lock: texts = self.__signatures.get(key)
+        if texts is None: return []
+        return [texts] if isinstance(texts, str) else list(texts)
+
+
+    def resolve_event(self, topic_0: str, num_indexed: int) -> Optional[dict]:
+        """
+        Return the topic map entry of an event from its signature, with its
+        leading parameters indexed.
+
+        :param topic_0: The event signature topic.
+        :param num_indexed: The number of indexed parameters, i.e. the number of topics after the first.
+        :return: The topic map entry, or None if the signature is unknown.
+        """
+
+        key = (topic_0, num_indexed)
+        with self.__lock:
+            if key in self.__events: return self.__events[key]
+
+        entry = None
+        for text in self.lookup(topic_0):
+            parsed = parse_signature(text)
+            if parsed is None or len(parsed[1]) < num_indexed: continue
+            inputs = [dict(param, indexed=i < num_indexed) for i, param in enumerate(parsed[1])]
+            topic_map = build_topic_map([{'type': 'event', 'name': parsed[0], 'inputs': inputs}])
+            if topic_0 in topic_map:
+                entry = topic_map[topic_0]
+                break
+
+        with self.__lock: return self.__events.setdefault(key, entry)
+
+
+    def resolve_function(self, function_selector: str) -> List[dict]:
+        """
+        Return the function map entries of a function selector from its
+        signatures, in order, since selectors can collide.
+
+        :param function_selector: The function selector.
+        :return: The function map entries, without outputs.
+        """
+
+        with self.__lock:
+            if function_selector in self.__functions: return self.__functions[function_selector]
+
+        entries = []
+        for text in self.lookup(function_selector):
+            parsed = parse_signature(text)
+            if parsed is None: continue
+            function_map = build_function_map([{'type': 'function', 'name': parsed[0], 'inputs': parsed[1], 'outputs': []}])
+            if function_selector in function_map: entries.append(function_map[function_selector])
+
+        with self.__lock: return self.__functions.setdefault(function_selector, entries)
+
+
+def load_signature_resolver(path: str) -> SignatureResolver:
+    """
+    Load a signature resolver from a signature database file. Resolvers are
+    cached per file path and modification time, so the same file is only
+    loaded once per process unless it changes.
+
+    :param path: The path to the signature database file.
+    :return: The signature resolver.
+    """
+
+    stat = os.stat(path)
+    key = (os.path.realpath(path), stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        if key in _resolvers: return _resolvers[key]
+
+    resolver = SignatureResolver.from_file(path)
+    with _lock: return _resolvers.setdefault(key, resolver)
+
+
+def parse_signature(text_signature: str) -> Optional[Tuple[str, List[dict]]]:
+    """
+    Parse a text signature such as "swap(uint256,(address,uint256)[])" into its
+    name and ABI parameters, named arg0, arg1, etc.
+
+    :param text_signature: The text signature.
+    :return: The name and parameters, or None if the signature is invalid.
+    """
+
+    text_signature = text_signature.replace(' ', '')
+    start = text_signature.find('(')
+    if start <= 0 or not text_signature.endswith(')'): return None
+    types = split_types(text_signature[start + 1:-1])
+    if types is None: return None
+    return text_signature[:start], [to_abi_param(f'arg{i}', t) for i, t in enumerate(types)]
+
+
+def split_types(types: str) -> Optional[List[str]]:
+    """
+    Split a comma-separated list of types at the top level, keeping tuple types
+    whole.
+
+    :param types: The types.
+    :return: The list of types, or None if the parentheses are unbalanced.
+    """
+
+    if len(types) == 0: return []
+    parts, depth, start = [], 0, 0
+    for i, c in enumerate(types):
+        if c == '(': depth += 1
+        elif c == ')': depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(types[start:i])
+            start = i + 1
+        if depth < 0: return None
+
+    parts.append(types[start:])
+    return parts if depth == 0 and all(len(p) > 0 for p in parts) else None
+
+
+def to_abi_param(name: str, param_type: str) -> dict:
+    """
+    Convert a canonical type into an ABI parameter, expanding tuple types into
+    tuple parameters with components.
+
+    :param name: The parameter name.
+    :param param_type: The canonical type, e.g. "(address,uint256)[]".
+    :return: The ABI parameter.
+    """
+
+    if not param_type.startswith('('): return {'name': name, 'type': param_type}
+    end = param_type.rindex(')')
+    components = split_types(param_type[1:end]) or []
+    return {
+        'name': name,
+        'type': 'tuple' + param_type[end + 1:],
+        'components': [to_abi_param(f'arg{i}', t) for i, t in enumerate(components)]
+    }
@@ -1,15 +1,22 @@
 from datetime import datetime, timezone 
-from dateutil import parser
+from functools import lru_cache
 
 
+@lru_cache(maxsize=4096)
 def to_iso_timestamp(timestamp: str) -> datetime:
     """
-    Parses a timestamp string into a valid ISO-8601 timestamp.
+    Parses a timestamp string into a valid ISO-8601 timestamp. Results are
+    cached, so rows from the same block share a single datetime object. ISO
+    timestamps are parsed natively, and other formats fall back to dateutil.
 
     :param timestamp: The timestamp to parse.
     :return: The parsed timestamp.
     """
 
-    dt = parser.parse(timestamp)
+    try: dt = datetime.fromisoformat(timestamp[:-1] + '+00:00' if timestamp.endswith('Z') else timestamp)
+    except ValueError:
+        from dateutil import parser
+        dt = parser.parse(timestamp)
+
     if dt.tzinfo is None: dt = dt.replace(tzinfo=timezone.utc)
     return dt.astimezone(timezone.utc)
\ No newline at end of file